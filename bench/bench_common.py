@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Общее для бенчмарков: перцентили, сводка и сохранение результатов в JSON.
+
+Результаты пишутся в bench/results/<имя>-<время>.json вместе с коммитом,
+чтобы прогоны на разных коммитах можно было сравнить.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+
+def add_path(*parts):
+    path = os.path.join(ROOT_DIR, *parts)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies_ms, wall_seconds=None):
+    """count, пропускная способность и p50/p95/p99/max в миллисекундах."""
+    values = sorted(latencies_ms)
+    summary = {"count": len(values)}
+    if wall_seconds:
+        summary["throughput_per_s"] = round(len(values) / wall_seconds, 2)
+    for p in (50, 95, 99):
+        value = percentile(values, p)
+        summary[f"p{p}_ms"] = round(value, 2) if value is not None else None
+    summary["max_ms"] = round(values[-1], 2) if values else None
+    return summary
+
+
+def format_summary(summary):
+    parts = [f"n={summary['count']}"]
+    if 'throughput_per_s' in summary:
+        parts.append(f"{summary['throughput_per_s']}/с")
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+        if summary.get(key) is not None:
+            parts.append(f"{key[:-3]}={summary[key]:.1f}мс")
+    return ' '.join(parts)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                             capture_output=True, text=True, timeout=5)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                               capture_output=True, text=True, timeout=5).stdout.strip()
+        return out.stdout.strip() + ('-dirty' if dirty else '')
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(name, params, results, out=None):
+    """Сохраняет прогон в JSON и возвращает путь к файлу."""
+    record = {
+        "bench": name,
+        "commit": git_commit(),
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {out}")
+    return out
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Микро-бенчмарк CommandAnalyzer: как растёт время analyze() с размером корпуса.
+
+Сравнивает прежний цикл по корпусу (WRatio + сортировка) с extractOne
+без кэша и с тёплым LRU-кэшем.
+
+    python3 bench/bench_intent_matching.py [--sizes 100,500,1000] [--queries 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'local'))
+
+from rapidfuzz import fuzz
+from command_analyzer import CommandAnalyzer
+
+WORDS = [
+    'включи', 'медиа', 'сцена', 'номер', 'картинка', 'видео', 'поставь', 'звук',
+    'громче', 'тише', 'первый', 'второй', 'третий', 'свет', 'музыка', 'выключи',
+    'максимум', 'минимум', 'сделай', 'добавь', 'убавь', 'режим', 'экран', 'яркость',
+]
+
+
+def make_intents(n_phrases, rng):
+    intents = {}
+    for i in range(n_phrases):
+        key = f'intent_{i // 10}'
+        phrase = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        intents.setdefault(key, {'func': None, 'phrases': []})['phrases'].append(phrase)
+    return intents
+
+
+def naive_analyze(corpus, text, threshold):
+    # Прежняя реализация: Python-цикл по корпусу и сортировка всего списка
+    results = []
+    for item in corpus:
+        score = fuzz.WRatio(text, item['phrase'])
+        results.append({'intent': item['intent'], 'score': score})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    if results and results[0]['score'] >= threshold:
+        return results[0]
+    return None
+
+
+def per_call_us(fn, queries):
+    started = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - started) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='84,250,500,1000,2000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'фраз':>6} {'цикл, мкс':>12} {'extractOne, мкс':>16} {'кэш, мкс':>10}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        analyzer = CommandAnalyzer(make_intents(size, rng), threshold=65)
+        queries = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))) for _ in range(args.queries)]
+
+        naive = per_call_us(lambda q: naive_analyze(analyzer.corpus, q, analyzer.threshold), queries)
+        cold = per_call_us(lambda q: analyzer._match_normalized(q), queries)
+        for q in queries:
+            analyzer.analyze(q)
+        warm = per_call_us(analyzer.analyze, queries)
+        print(f"{size:>6} {naive:>12.1f} {cold:>16.1f} {warm:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
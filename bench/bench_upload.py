@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Нагрузочный тест /upload сервера с локальным «Кубом»-заглушкой.
+
+Поднимает server/flask_app.py во временной папке (GOLO_BASE_DIR) и
+принимающий endpoint вместо Куба, затем шлёт картинки заданных размеров с
+разным числом параллельных клиентов. Меряет ответ /upload и полный путь до
+Куба (по trace_t0 из доставленной формы).
+
+    python3 bench/bench_upload.py [--sizes 640x480,1920x1080] [--concurrency 1,4,16] [--requests 50]
+
+Лимиты допуска сервера на время замера сняты, иначе мерился бы лимит, а
+не конвейер. С --abusers N остаётся лимит на user_id, и N клиентов от
+одного пользователя долбят /upload без пауз: у остальных (каждая загрузка
+от своего user_id) задержка должна остаться прежней.
+
+Outbox не шлёт на localhost/127.0.0.1 (это адрес-заглушка), поэтому
+заглушка Куба слушает 127.0.0.2 — на Linux весь 127.0.0.0/8 локальный.
+"""
+import io
+import os
+import time
+import random
+import shutil
+import tempfile
+import logging
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, request
+from werkzeug.serving import make_server
+from PIL import Image
+
+from bench_common import add_path, summarize, format_summary, save_results, free_port
+
+
+class StandInCube:
+    """Принимает /webhook как Куб и запоминает задержку от trace_t0."""
+
+    def __init__(self, host, delay_ms=0):
+        self.host = host
+        self.port = free_port()
+        self.delay = delay_ms / 1000
+        self.lock = threading.Lock()
+        self.delivery_ms = []
+        self.received = 0
+        app = Flask('stand_in_cube')
+
+        @app.route('/webhook', methods=['POST'])
+        def webhook():
+            data = request.form.to_dict() if request.form else (request.get_json(silent=True) or {})
+            if 'file' in request.files:
+                request.files['file'].read()
+            if self.delay:
+                time.sleep(self.delay)
+            with self.lock:
+                self.received += 1
+                if data.get('trace_t0'):
+                    self.delivery_ms.append((time.time() - float(data['trace_t0'])) * 1000)
+            return {'status': 'ok'}
+
+        self.server = make_server(host, self.port, app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/webhook'
+
+    def reset(self):
+        with self.lock:
+            self.delivery_ms = []
+            self.received = 0
+
+
+def make_images(size, count, duplicates, rng):
+    """JPEG, сжимающиеся примерно как фото; часть повторяется для проверки дедупликации."""
+    width, height = size
+    unique = max(1, int(count * (1 - duplicates)))
+    small = (max(1, width // 16), max(1, height // 16))
+    images = []
+    for _ in range(unique):
+        # Растянутый мелкий шум: плавные пятна вместо несжимаемого шума
+        img = Image.frombytes('RGB', small, rng.randbytes(small[0] * small[1] * 3))
+        img = img.resize((width, height), Image.BICUBIC)
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=85)
+        images.append(buf.getvalue())
+    return [images[i % unique] for i in range(count)]
+
+
+def abuse_loop(upload_url, image, stop, results):
+    session = requests.Session()
+    statuses = {}
+    while not stop.is_set():
+        try:
+            status = session.post(upload_url, data={'user_id': 'abuser'},
+                                  files={'file': ('abuse.jpg', image, 'image/jpeg')}, timeout=60).status_code
+        except requests.RequestException:
+            status = 'error'
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    results.put(statuses)
+
+
+class Abusers:
+    """N процессов шлют загрузки от одного user_id без пауз и считают ответы по статусу.
+
+    Отдельные процессы, а не потоки: иначе генератор нагрузки делил бы GIL
+    с сервером и замедлял всех независимо от лимитов.
+    """
+
+    def __init__(self, upload_url, image, count):
+        self.stop = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.procs = [multiprocessing.Process(target=abuse_loop, args=(upload_url, image, self.stop, self.results),
+                                              daemon=True) for _ in range(count)]
+        for p in self.procs:
+            p.start()
+
+    def finish(self):
+        self.stop.set()
+        statuses = {}
+        for _ in self.procs:
+            for status, n in self.results.get().items():
+                statuses[status] = statuses.get(status, 0) + n
+        for p in self.procs:
+            p.join()
+        return statuses
+
+
+def run_load(upload_url, images, concurrency):
+    local = threading.local()
+
+    def one(index):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        r = session.post(upload_url, data={'user_id': f'bench{index}', 'brightness': '0.7'},
+                         files={'file': (f'bench_{index}.jpg', images[index], 'image/jpeg')}, timeout=60)
+        return (time.perf_counter() - started) * 1000, r.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(len(images))))
+    wall = time.perf_counter() - started
+    latencies = [ms for ms, status in outcomes if status == 200]
+    errors = sum(1 for _, status in outcomes if status != 200)
+    return latencies, wall, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='640x480,1920x1080,4000x3000')
+    parser.add_argument('--concurrency', default='1,4,16')
+    parser.add_argument('--requests', type=int, default=50, help='загрузок на каждую комбинацию')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='доля повторных картинок')
+    parser.add_argument('--cube-delay-ms', type=int, default=0, help='сколько «Куб» думает над ответом')
+    parser.add_argument('--cube-host', default='127.0.0.2')
+    parser.add_argument('--wait', type=float, default=60.0, help='сколько ждать доставки на Куб (сек)')
+    parser.add_argument('--abusers', type=int, default=0,
+                        help='клиентов от одного user_id, шлющих без пауз во время замера')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None)
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    base_dir = tempfile.mkdtemp(prefix='golo-bench-')
+    os.environ['GOLO_BASE_DIR'] = base_dir
+    add_path('server')
+    import flask_app
+    from admission import TokenBucket
+
+    flask_app.admission.global_bucket = TokenBucket(1e9, 1e9)
+    flask_app.admission.max_pending = float('inf')
+    if not args.abusers:
+        flask_app.admission.user_rate = flask_app.admission.user_burst = 1e9
+
+    cube = StandInCube(args.cube_host, args.cube_delay_ms)
+    flask_app.cubes.register(flask_app.DEFAULT_CUBE_ID, cube.url)
+    port = free_port()
+    server = make_server('127.0.0.1', port, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    upload_url = f'http://127.0.0.1:{port}/upload'
+
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        for size_arg in args.sizes.split(','):
+            size = tuple(int(v) for v in size_arg.split('x'))
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                images = make_images(size, args.requests, args.duplicates, rng)
+                cube.reset()
+                abusers = Abusers(upload_url, images[0], args.abusers) if args.abusers else None
+                latencies, wall, errors = run_load(upload_url, images, concurrency)
+                abuse = abusers.finish() if abusers else None
+                deadline = time.time() + args.wait
+                while cube.received < len(latencies) and time.time() < deadline:
+                    time.sleep(0.05)
+                upload = summarize(latencies, wall)
+                delivery = summarize(cube.delivery_ms)
+                print(f"{size_arg:>10} x{concurrency:<3} /upload: {format_summary(upload)}")
+                print(f"{'':>15} до Куба: {format_summary(delivery)}, ошибок {errors}")
+                if abuse:
+                    print(f"{'':>15} нарушитель: {abuse}")
+                results.append({
+                    "size": size_arg, "concurrency": concurrency,
+                    "avg_bytes": sum(len(i) for i in images) // len(images),
+                    "upload": upload, "delivery": delivery, "errors": errors,
+                    "undelivered": len(latencies) - cube.received, "abuser_statuses": abuse,
+                })
+        results.append({"cubes": flask_app.cubes.stats(), "uploads": flask_app.janitor.stats(),
+                        "admission": flask_app.admission.stats()})
+    finally:
+        server.shutdown()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    save_results('upload', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Прогон папки WAV через распознавание InfoAssistant без микрофона.
+
+Каждый файл режется на кадры FRAME_MS и идёт тем же путём, что и звук с
+микрофона: VadGate -> пачки CHUNK_BYTES -> Vosk -> CommandAnalyzer ->
+интент. Команды на медиа-плеер не отправляются — интенты только
+записываются. Нужны WAV 16 кГц, моно, 16 бит.
+
+Ожидаемый интент берётся из --labels (JSON: имя файла -> интент) или из
+префикса имени файла до "__" (например volume_up__03.wav).
+
+С --streams N каждый файл звучит сразу в N потоках, как одна фраза в
+комнате с N микрофонами (--skew-ms — сдвиг между ними). Распознавание
+идёт через пул ассистента на общей модели, и на файл должен сработать
+ровно один интент: остальные гасит дедупликация.
+
+    python3 bench/bench_wav_replay.py path/to/wavs [--active] [--realtime] [--labels labels.json] [--streams 4]
+"""
+import os
+import json
+import time
+import wave
+import argparse
+import contextlib
+
+from bench_common import add_path, summarize, format_summary, save_results
+
+
+def read_frames(path, frame_bytes):
+    with wave.open(path, 'rb') as wav:
+        if wav.getframerate() != 16000 or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"нужен 16 кГц моно 16 бит, а тут {wav.getframerate()} Гц, "
+                             f"{wav.getnchannels()} кан., {wav.getsampwidth() * 8} бит")
+        data = wav.readframes(wav.getnframes())
+    frames = [data[i:i + frame_bytes] for i in range(0, len(data), frame_bytes)]
+    if frames and len(frames[-1]) < frame_bytes:
+        frames[-1] = frames[-1].ljust(frame_bytes, b'\0')
+    return frames, len(data) / 2 / 16000
+
+
+def expected_intent(name, labels):
+    if name in labels:
+        return labels[name]
+    if '__' in name:
+        return name.split('__', 1)[0]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder')
+    parser.add_argument('--labels', default=None)
+    parser.add_argument('--active', action='store_true',
+                        help='сразу режим команд (без слова активации)')
+    parser.add_argument('--realtime', action='store_true', help='подавать звук в темпе реального времени')
+    parser.add_argument('--no-vad', action='store_true')
+    parser.add_argument('--streams', type=int, default=1, help='микрофонов, слышащих каждый файл')
+    parser.add_argument('--skew-ms', type=int, default=40, help='сдвиг звука между соседними микрофонами')
+    parser.add_argument('--workers', type=int, default=0, help='потоков распознавания (0 — по ядрам)')
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--verbose', action='store_true', help='не глушить логи ассистента')
+    args = parser.parse_args()
+
+    add_path('local')
+    import voise_intension_vosk as assistant_mod
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, encoding='utf-8') as f:
+            labels = json.load(f)
+
+    load_started = time.perf_counter()
+    if args.no_vad:
+        assistant_mod.USE_VAD = False
+    assistant = assistant_mod.InfoAssistant(sources=[])
+    streams = [assistant.add_stream(f"replay{i}") for i in range(max(1, args.streams))]
+    assistant.wait_model()
+    load_ms = (time.perf_counter() - load_started) * 1000
+    if len(streams) > 1:
+        assistant.start_pool(args.workers)
+
+    fired = []
+    for key, intent in assistant.intents.items():
+        intent['func'] = lambda k=key: fired.append((k, time.perf_counter()))
+
+    frame_ms = assistant_mod.FRAME_MS
+    frame_bytes = 16000 * frame_ms // 1000 * 2
+    files = sorted(f for f in os.listdir(args.folder) if f.lower().endswith('.wav'))
+    per_file = []
+    skew_frames = args.skew_ms // frame_ms
+    intent_ms, tail_ms, rtf = [], [], []
+    correct = labelled = duplicated = 0
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    started = time.perf_counter()
+    for name in files:
+        try:
+            frames, duration = read_frames(os.path.join(args.folder, name), frame_bytes)
+        except (ValueError, wave.Error) as e:
+            print(f"⚠️ {name}: пропущен ({e})")
+            continue
+        for stream in streams:
+            stream.reset()
+        assistant.listen_until = time.time() + 3600 if args.active else 0.0
+        fired.clear()
+        # Дальний микрофон слышит ту же фразу чуть позже
+        silence = bytes(frame_bytes)
+        shifted = [[silence] * (i * skew_frames) + frames + [silence] * ((len(streams) - 1 - i) * skew_frames)
+                   for i in range(len(streams))]
+
+        with quiet:
+            file_started = time.perf_counter()
+            for t in range(len(shifted[0])):
+                for stream, stream_frames in zip(streams, shifted):
+                    if assistant.pool:
+                        assistant.submit(stream, stream_frames[t])
+                    else:
+                        assistant.feed_frame(stream, stream_frames[t])
+                if args.realtime:
+                    time.sleep(frame_ms / 1000)
+            audio_end = time.perf_counter()
+            for stream in streams:
+                if assistant.pool:
+                    assistant.submit_end(stream)
+                else:
+                    assistant.end_stream(stream)
+            assistant.wait_idle()
+            done = time.perf_counter()
+
+        tail_ms.append((done - audio_end) * 1000)
+        rtf.append((done - file_started) / duration if duration else 0.0)
+        got = fired[0][0] if fired else None
+        duplicated += len(fired) > 1
+        if fired:
+            # Отрицательное значение — интент сработал раньше конца файла (VAD или ранний запуск)
+            intent_ms.append((fired[0][1] - audio_end) * 1000)
+        want = expected_intent(name, labels)
+        if want is not None:
+            labelled += 1
+            correct += got == want
+        per_file.append({"file": name, "duration_s": round(duration, 3), "intent": got,
+                         "expected": want, "intents": [k for k, _ in fired],
+                         "tail_ms": round(tail_ms[-1], 2), "rtf": round(rtf[-1], 3)})
+        mark = '' if want is None else (' ✅' if got == want else f' ❌ (ждали {want})')
+        print(f"{name}: {got or '—'}{mark}  хвост {tail_ms[-1]:.0f} мс, RTF {rtf[-1]:.2f}")
+    wall = time.perf_counter() - started
+
+    results = {
+        "model_load_ms": round(load_ms, 1),
+        "files": len(per_file),
+        "intent_after_audio_end": summarize(intent_ms),
+        "finalize_tail": summarize(tail_ms, wall),
+        "rtf_avg": round(sum(rtf) / len(rtf), 3) if rtf else None,
+        "accuracy": round(correct / labelled, 3) if labelled else None,
+        "files_with_repeats": duplicated,
+        "recognition": assistant.stats(),
+        "analyzer_cache": assistant.analyzer.cache_info()._asdict(),
+        "per_file": per_file,
+    }
+    print(f"📦 Модель: {load_ms:.0f} мс, файлов: {len(per_file)}, RTF в среднем: {results['rtf_avg']}")
+    print(f"🎯 Интент от конца звука: {format_summary(results['intent_after_audio_end'])}")
+    print(f"⏱️  Хвост после последнего кадра: {format_summary(results['finalize_tail'])}")
+    if labelled:
+        print(f"✅ Точность: {correct}/{labelled}")
+    if len(streams) > 1:
+        print(f"🎙️ Микрофонов: {len(streams)}, потоков: {assistant.workers}, "
+              f"погашено повторов: {assistant.deduplicated}, файлов с лишним интентом: {duplicated}")
+    save_results('wav_replay', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
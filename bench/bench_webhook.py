@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Поток команд в media_choose.py: /webhook (или unix-сокет) без настоящего mpv.
+
+MediaController работает как на Кубе — webhook, CommandScheduler и
+process_data, — но MpvPlayer и VolumeControl заменены заглушками, которые
+только выдерживают заданную задержку. Меряется ответ /webhook и путь до
+«первого кадра» от момента отправки (trace_t0 в команде).
+
+    python3 bench/bench_webhook.py [--commands 2000] [--concurrency 8] [--mix static=5,volume=4,custom=1]
+"""
+import os
+import time
+import hashlib
+import queue
+import random
+import logging
+import argparse
+import tempfile
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from bench_common import add_path, summarize, format_summary, save_results, free_port
+
+CUSTOM_NAME = 'bench_custom.jpg'
+
+
+class FakePlayer:
+    """Вместо mpv: задержка на команду и «первый кадр» сразу после неё."""
+
+    def __init__(self, command_ms):
+        self.delay = command_ms / 1000
+        self.on_playback_start = None
+        self.calls = {"play": 0, "play_scene": 0, "stop": 0}
+
+    def start(self): pass
+    def shutdown(self): pass
+    def preload(self, paths): pass
+    def apply(self, settings): pass
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if name != 'stop' and self.on_playback_start:
+            self.on_playback_start()
+
+    def play(self, path, settings):
+        self._call('play')
+
+    def play_scene(self, index, settings):
+        self._call('play_scene')
+
+    def stop(self):
+        self._call('stop')
+
+
+class FakeVolume:
+    def __init__(self):
+        self.requests = queue.Queue()
+        self.calls = 0
+
+    def start(self): pass
+
+    def adjust(self, set_to=None, steps=0, toggle_mute=0):
+        self.calls += 1
+
+
+def parse_mix(mix):
+    kinds, weights = [], []
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        kinds.append(name)
+        weights.append(float(weight))
+    return kinds, weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', default='static=5,volume=4,custom=1', help='доли static/volume/stop/custom')
+    parser.add_argument('--transport', choices=('http', 'ipc'), default='http',
+                        help='как слать static/volume/stop (custom всегда по HTTP)')
+    parser.add_argument('--mpv-ms', type=float, default=5.0, help='задержка заглушки mpv на команду')
+    parser.add_argument('--custom-kb', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default=None)
+    parser.add_argument('--verbose', action='store_true', help='не глушить логи контроллера')
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    add_path('local')
+    import media_choose
+    from cube_ipc import IpcServer, IpcClient, make_static, make_volume, make_stop
+
+    controller = media_choose.MediaController()
+    controller.player = FakePlayer(args.mpv_ms)
+    controller.player.on_playback_start = controller.on_first_frame
+    controller.volume = FakeVolume()
+    # Как после preload_static: сцены уже в плейлисте
+    controller.scene_index = {num: i for i, num in enumerate(sorted(controller.static_files))}
+
+    processed_ms = []
+    process_data = controller.process_data
+
+    def timed_process(data):
+        trace = data.get('_trace')
+        process_data(data)
+        if trace:
+            processed_ms.append((time.time() - trace.t0) * 1000)
+
+    running = True
+
+    def worker():
+        while running:
+            data = controller.scheduler.get(timeout=0.2)
+            if data:
+                timed_process(data)
+    threading.Thread(target=worker, daemon=True).start()
+
+    port = free_port()
+    server = make_server('127.0.0.1', port, media_choose.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webhook_url = f'http://127.0.0.1:{port}/webhook'
+
+    ipc_path = None
+    if args.transport == 'ipc':
+        ipc_path = os.path.join(tempfile.mkdtemp(prefix='golo-bench-'), 'cube.sock')
+        IpcServer(controller.enqueue_local, ipc_path).start()
+
+    rng = random.Random(args.seed)
+    kinds, weights = parse_mix(args.mix)
+    plan = rng.choices(kinds, weights, k=args.commands)
+    custom_body = rng.randbytes(args.custom_kb * 1024)
+    # Кэш хранит файл под <sha256>.<ext>; чужую копию тех же байт после прогона не трогаем
+    custom_hash = hashlib.sha256(custom_body).hexdigest()
+    custom_cached_before = bool(controller.cache.have([custom_hash])['have'])
+    local = threading.local()
+
+    def send(index):
+        kind = plan[index]
+        if kind == 'static':
+            cmd = make_static(rng.choice('123'))
+        elif kind == 'volume':
+            cmd = make_volume(rng.choice(('up', 'up', 'down', 'mute')))
+        elif kind == 'stop':
+            cmd = make_stop()
+        else:
+            cmd = None
+        trace = {"trace_id": f"bench{index}", "trace_t0": time.time()}
+        started = time.perf_counter()
+        if cmd is not None and ipc_path:
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = IpcClient(ipc_path)
+            reply = client.send(dict(cmd, **trace))
+            status = 200 if reply and reply['status'] == 'ok' else 429
+        else:
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            if cmd is None:
+                r = session.post(webhook_url, data=dict(trace, image_number='0'),
+                                 files={'file': (CUSTOM_NAME, custom_body, 'image/jpeg')}, timeout=30)
+            else:
+                r = session.post(webhook_url, json=dict(cmd, **trace), timeout=30)
+            status = r.status_code
+        return kind, (time.perf_counter() - started) * 1000, status
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with quiet:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(send, range(args.commands)))
+        wall = time.perf_counter() - started
+        # Даём планировщику разобрать хвост
+        deadline = time.time() + 10
+        while controller.scheduler.stats()['pending'] and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+        running = False
+    server.shutdown()
+    custom_path = controller.cache.lookup(custom_hash)
+    if custom_path and not custom_cached_before:
+        os.remove(custom_path)
+
+    results = {"send": summarize([ms for _, ms, status in outcomes if status == 200], wall)}
+    for kind in kinds:
+        results[f"send_{kind}"] = summarize([ms for k, ms, status in outcomes if k == kind and status == 200])
+    results["processed"] = summarize(processed_ms)
+    results["rejected"] = sum(1 for _, _, status in outcomes if status == 429)
+    results["errors"] = sum(1 for _, _, status in outcomes if status not in (200, 429))
+    results["scheduler"] = controller.scheduler.stats()
+    results["player_calls"] = controller.player.calls
+    results["volume_calls"] = controller.volume.calls
+
+    print(f"📨 Отправка ({args.transport}): {format_summary(results['send'])}")
+    for kind in kinds:
+        print(f"   {kind:>7}: {format_summary(results[f'send_{kind}'])}")
+    print(f"🎬 До «первого кадра»: {format_summary(results['processed'])}")
+    print(f"🧮 Планировщик: {results['scheduler']}")
+    print(f"⛔ Отклонено: {results['rejected']}, ошибок: {results['errors']}")
+    save_results('webhook', vars(args), results, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import os
+import math
+import time
+import wave
+import errno
+import threading
+from array import array
+from collections import deque
+
+try:
+    import audioop  # есть до Python 3.12, дальше считаем RMS вручную
+except ImportError:
+    audioop = None
+
+HAS_WEBRTCVAD = False
+try:
+    import webrtcvad
+    HAS_WEBRTCVAD = True
+except ImportError:
+    HAS_WEBRTCVAD = False
+
+PA_INPUT_OVERFLOWED = -9981
+
+
+def frame_rms(frame):
+    if audioop:
+        return audioop.rms(frame, 2)
+    samples = array('h', frame)
+    if not samples:
+        return 0
+    return int(math.sqrt(sum(s * s for s in samples) / len(samples)))
+
+
+class AudioCapture:
+    """Отдельный поток чтения микрофона с кольцевым буфером.
+
+    Медленный AcceptWaveform больше не теряет звук молча: поток захвата
+    всегда читает PortAudio вовремя, а если потребитель не успевает, в
+    кольце вытесняются самые старые кадры и растёт счётчик overflow.
+    """
+
+    def __init__(self, rate=16000, frame_ms=30, buffer_seconds=5.0, device_index=None, name="mic"):
+        self.rate = rate
+        self.frame_samples = int(rate * frame_ms / 1000)
+        self.device_index = device_index
+        self.name = name
+        self.ring = deque(maxlen=int(buffer_seconds * 1000 / frame_ms))
+        self.cond = threading.Condition()
+        self.running = False
+        self.pa = None
+        self.stream = None
+        self.counters = {"frames": 0, "overflow": 0, "input_overflow": 0, "underrun": 0}
+
+    def start(self):
+        import pyaudio
+        self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paInt16, channels=1, rate=self.rate, input=True,
+                                   input_device_index=self.device_index,
+                                   frames_per_buffer=self.frame_samples)
+        self.stream.start_stream()
+        self.running = True
+        threading.Thread(target=self._capture_loop, name=f"capture-{self.name}", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        time.sleep(0.1)
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+        if self.pa:
+            self.pa.terminate()
+
+    def _capture_loop(self):
+        while self.running:
+            try:
+                frame = self.stream.read(self.frame_samples, exception_on_overflow=True)
+            except IOError as e:
+                # Переполнение буфера PortAudio: кусок звука уже потерян, читаем дальше
+                if getattr(e, 'errno', None) in (PA_INPUT_OVERFLOWED, errno.EOVERFLOW) or 'overflow' in str(e).lower():
+                    self.counters["input_overflow"] += 1
+                    continue
+                if not self.running:
+                    break
+                raise
+            self.push(frame)
+
+    def push(self, frame):
+        with self.cond:
+            if len(self.ring) == self.ring.maxlen:
+                self.counters["overflow"] += 1
+            self.ring.append(frame)
+            self.counters["frames"] += 1
+            self.cond.notify()
+
+    def read(self, timeout=1.0):
+        """Следующий кадр или None, если за timeout ничего не пришло."""
+        with self.cond:
+            if not self.ring:
+                self.cond.wait(timeout)
+            if not self.ring:
+                if self.running:
+                    self.counters["underrun"] += 1
+                return None
+            return self.ring.popleft()
+
+    def stats(self):
+        with self.cond:
+            return {"buffered": len(self.ring), **self.counters}
+
+
+
+class PcmFileSource(AudioCapture):
+    """WAV или сырой PCM (16 бит, моно) вместо микрофона — проверка без железа.
+
+    Кадры идут в кольцо в темпе реального времени, как с микрофона. Когда
+    файл кончился, finished становится True и read() возвращает None.
+    """
+
+    def __init__(self, path, rate=16000, frame_ms=30, buffer_seconds=5.0, name=None):
+        super().__init__(rate, frame_ms, buffer_seconds, name=name or os.path.basename(path))
+        self.path = path
+        self.finished = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._file_loop, name=f"capture-{self.name}", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+
+    def _read_pcm(self):
+        if not self.path.lower().endswith('.wav'):
+            with open(self.path, 'rb') as f:
+                return f.read()
+        with wave.open(self.path, 'rb') as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) != (self.rate, 1, 2):
+                raise ValueError(f"нужен {self.rate} Гц моно 16 бит, а тут {wav.getframerate()} Гц, "
+                                 f"{wav.getnchannels()} кан., {wav.getsampwidth() * 8} бит")
+            return wav.readframes(wav.getnframes())
+
+    def _file_loop(self):
+        try:
+            data = self._read_pcm()
+        except (OSError, ValueError, wave.Error) as e:
+            print(f"❌ Источник {self.name}: {e}")
+            data = b''
+        frame_bytes = self.frame_samples * 2
+        frame_sec = self.frame_samples / self.rate
+        started = time.monotonic()
+        for index, offset in enumerate(range(0, len(data), frame_bytes)):
+            if not self.running:
+                break
+            delay = started + index * frame_sec - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.push(data[offset:offset + frame_bytes].ljust(frame_bytes, b'\0'))
+        self.finished = True
+        self.stop()
+
+
+def open_sources(spec, rate=16000, frame_ms=30, buffer_seconds=5.0):
+    """Источники звука по строке вида "0,2,wav:/tmp/a.wav,pcm:/tmp/b.raw".
+
+    Число — индекс устройства PyAudio, wav:/pcm: — файл вместо микрофона.
+    Пустая строка — один микрофон по умолчанию. Источники ещё не запущены.
+    """
+    sources = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        kind, _, path = item.partition(':')
+        if kind in ('wav', 'pcm') and path:
+            sources.append(PcmFileSource(path, rate, frame_ms, buffer_seconds))
+        elif item.isdigit():
+            sources.append(AudioCapture(rate, frame_ms, buffer_seconds, device_index=int(item), name=f"mic{item}"))
+        else:
+            raise ValueError(f"непонятный источник звука '{item}'")
+    return sources or [AudioCapture(rate, frame_ms, buffer_seconds)]
+
+class VadGate:
+    """Пропускает к распознавателю только речь.
+
+    Кадр считается речью по webrtcvad (если установлен) или по энергии выше
+    адаптивного порога шума. Перед началом речи отдаётся pre-roll, чтобы не
+    съесть начало слова; после конца — hangover, затем сигнал конца фразы.
+    Ровный шум (вентилятор, музыка) не держит «речь» вечно: во время речи
+    порог шума медленно ползёт вверх, а фраза длиннее max_speech_ms
+    обрывается сигналом конца.
+    """
+
+    def __init__(self, rate=16000, frame_ms=30, preroll_ms=300, hangover_ms=600,
+                 aggressiveness=2, min_rms=300, noise_ratio=3.0, max_speech_ms=15000):
+        self.rate = rate
+        self.preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.max_speech_frames = max(1, max_speech_ms // frame_ms)
+        self.min_rms = min_rms
+        self.noise_ratio = noise_ratio
+        self.noise_floor = float(min_rms) / noise_ratio
+        self.vad = webrtcvad.Vad(aggressiveness) if HAS_WEBRTCVAD else None
+        self.active = False
+        self.silence = 0
+        self.speech_frames = 0  # длина текущей фразы в кадрах
+        self.counters = {"frames": 0, "passed": 0, "utterances": 0, "cut_long": 0}
+
+    def is_speech(self, frame):
+        if self.vad:
+            try:
+                return self.vad.is_speech(frame, self.rate)
+            except Exception:
+                pass  # неподходящая длина кадра — считаем по энергии
+        rms = frame_rms(frame)
+        speech = rms > max(self.min_rms, self.noise_floor * self.noise_ratio)
+        if not speech:
+            # Медленно подстраиваемся под фоновый шум комнаты
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        else:
+            # ...и совсем медленно во время «речи»: ровный шум за пару секунд
+            # перестаёт считаться речью, а короткая фраза порог почти не двигает
+            self.noise_floor = 0.998 * self.noise_floor + 0.002 * rms
+        return speech
+
+    def feed(self, frame):
+        """Возвращает (кадры для распознавателя, закончилась ли фраза)."""
+        self.counters["frames"] += 1
+        speech = self.is_speech(frame)
+        if not self.active:
+            if not speech:
+                self.preroll.append(frame)
+                return [], False
+            self.active = True
+            self.silence = 0
+            self.speech_frames = 0
+            self.counters["utterances"] += 1
+            out = list(self.preroll) + [frame]
+            self.preroll.clear()
+            self.counters["passed"] += len(out)
+            return out, False
+
+        self.counters["passed"] += 1
+        self.speech_frames += 1
+        if self.speech_frames >= self.max_speech_frames:
+            # Так долго не говорят: закрываем фразу, чтобы распознаватель выдал результат
+            self.active = False
+            self.counters["cut_long"] += 1
+            return [frame], True
+        if speech:
+            self.silence = 0
+            return [frame], False
+        self.silence += 1
+        if self.silence >= self.hangover_frames:
+            self.active = False
+            return [frame], True
+        return [frame], False
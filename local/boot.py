@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+BOOT_T0_ENV = 'GOLO_BOOT_T0'  # start.sh кладёт сюда время своего запуска
+READY_DIR = '/tmp'            # /tmp/golo-<имя>.ready — процесс готов
+
+
+def seconds_since_power_on():
+    """Сколько секунд назад включилось питание (по /proc/uptime), или None."""
+    try:
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class BootTimer:
+    """Фазы старта процесса и явный сигнал готовности.
+
+    Время считается от GOLO_BOOT_T0 (запуск start.sh), поэтому фазы
+    медиа-плеера и голосового ассистента видно на одной шкале. ready()
+    печатает разбивку и пишет /tmp/golo-<имя>.ready — его ждёт start.sh.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.t0 = float(os.environ.get(BOOT_T0_ENV) or time.time())
+        self.lock = threading.Lock()
+        self.phases = {}  # фаза -> [начало, конец] в секундах от t0
+        self.marks = {}   # событие -> секунды от t0 (первое значение)
+        self.ready_path = os.path.join(READY_DIR, f"golo-{name}.ready")
+
+    def now(self):
+        return round(time.time() - self.t0, 3)
+
+    @contextmanager
+    def phase(self, name):
+        started = self.now()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = [started, self.now()]
+
+    def mark(self, name):
+        with self.lock:
+            self.marks.setdefault(name, self.now())
+
+    def parallel(self, **steps):
+        """Запускает шаги одновременно (каждый — своя фаза) и ждёт все."""
+        def run(name, fn):
+            with self.phase(name):
+                try:
+                    fn()
+                except Exception as e:
+                    print(f"❌ Старт ({name}): {e}")
+        threads = [threading.Thread(target=run, args=item, name=f"boot-{item[0]}", daemon=True)
+                   for item in steps.items()]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+    def ready(self):
+        self.mark('ready')
+        summary = self.summary()
+        tmp_path = self.ready_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(summary, f)
+        os.replace(tmp_path, self.ready_path)
+        self.report()
+
+    def summary(self):
+        with self.lock:
+            return {"name": self.name, "pid": os.getpid(), "phases": dict(self.phases),
+                    "marks": dict(self.marks), "power_on_s": seconds_since_power_on()}
+
+    def durations(self):
+        with self.lock:
+            return {name: round(end - start, 3) for name, (start, end) in self.phases.items()}
+
+    def report(self):
+        summary = self.summary()
+        print(f"⏱️  Старт {self.name}: готов через {summary['marks'].get('ready', 0):.2f} с после start.sh")
+        for name, (start, end) in sorted(summary['phases'].items(), key=lambda item: item[1][0]):
+            print(f"     {name:<10} {start:6.2f} → {end:6.2f} с  ({end - start:.2f} с)")
+        for name, at in sorted(summary['marks'].items(), key=lambda item: item[1]):
+            print(f"     ● {name:<8} {at:6.2f} с")
+        if summary['power_on_s'] is not None:
+            print(f"     с включения питания: {summary['power_on_s']:.1f} с")
@@ -0,0 +1,61 @@
+import re
+from functools import lru_cache
+from typing import Optional
+
+from rapidfuzz import process, fuzz
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, без пунктуации и лишних пробелов."""
+    text = text.lower().replace('ё', 'е')
+    text = _PUNCT_RE.sub(' ', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class CommandAnalyzer:
+    """Сопоставляет распознанную фразу с интентом.
+
+    Корпус нормализуется один раз при создании, поиск идёт через
+    process.extractOne (весь цикл внутри rapidfuzz, с ранним отсечением по
+    score_cutoff), а результаты для одинаковых фраз берутся из LRU-кэша.
+    """
+
+    def __init__(self, intents_map: dict, threshold=70, cache_size=512):
+        self.intents_map = intents_map
+        self.threshold = threshold
+        self.corpus = []
+        for intent_key, data in self.intents_map.items():
+            for phrase in data['phrases']:
+                self.corpus.append({'phrase': phrase, 'intent': intent_key})
+        self.choices = [normalize(item['phrase']) for item in self.corpus]
+        # Точное совпадение (частый случай) — без нечёткого поиска
+        self.exact = {}
+        for index, choice in enumerate(self.choices):
+            self.exact.setdefault(choice, index)
+        self._match = lru_cache(maxsize=cache_size)(self._match_normalized)
+
+    def analyze(self, text: str) -> Optional[dict]:
+        if not text: return None
+        query = normalize(text)
+        if not query: return None
+        match = self._match(query)
+        return dict(match) if match else None
+
+    def _match_normalized(self, query: str) -> Optional[dict]:
+        index = self.exact.get(query)
+        if index is not None:
+            return {'intent': self.corpus[index]['intent'], 'score': 100.0}
+        best = process.extractOne(
+            query, self.choices, scorer=fuzz.WRatio,
+            processor=None, score_cutoff=self.threshold
+        )
+        if best is None:
+            return None
+        _, score, index = best
+        return {'intent': self.corpus[index]['intent'], 'score': score}
+
+    def cache_info(self):
+        return self._match.cache_info()
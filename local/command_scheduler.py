@@ -0,0 +1,119 @@
+import time
+import threading
+from collections import deque
+
+PLAY_TYPES = ('static_image', 'custom_image', 'custom_video')
+
+
+class CommandScheduler:
+    """Очередь команд перед MediaController.process_data, которая схлопывает лишнее.
+
+    - stop вытесняет всё, что ещё ждёт выполнения;
+    - подряд идущие up/down сливаются в одну дельту, max сбрасывает дельту,
+      два mute подряд взаимно гасятся;
+    - из нескольких команд воспроизведения выполняется только последняя;
+    - всё остальное идёт по порядку, но общий объём ожидания ограничен.
+
+    Порядок выдачи: stop, затем громкость (дёшево), затем воспроизведение,
+    затем прочие команды.
+    """
+
+    def __init__(self, max_pending=64):
+        self.max_pending = max_pending
+        self.cond = threading.Condition()
+        self.stop_pending = False
+        self.volume = None    # {"set": 'max' | None, "steps": int, "toggle_mute": int[, "_trace"]}
+        self.play = None
+        self.other = deque()
+        self.counters = {
+            "accepted": 0, "executed": 0, "dropped_full": 0,
+            "coalesced_volume": 0, "superseded_play": 0, "preempted_by_stop": 0,
+        }
+
+    # --- ПРИЁМ ---
+    def put(self, data):
+        """Кладёт команду. Возвращает False, если очередь переполнена."""
+        cmd_type = data.get('type')
+        with self.cond:
+            if cmd_type == 'stop':
+                self._preempt()
+                self.stop_pending = True
+            elif cmd_type == 'volume':
+                if not self._merge_volume(data.get('action'), data.get('_trace')):
+                    return False
+            elif cmd_type in PLAY_TYPES:
+                if self.play is not None:
+                    self.counters["superseded_play"] += 1
+                elif self._pending_count() >= self.max_pending:
+                    return self._drop(cmd_type)
+                self.play = data
+            else:
+                if self._pending_count() >= self.max_pending:
+                    return self._drop(cmd_type)
+                self.other.append(data)
+            self.counters["accepted"] += 1
+            self.cond.notify()
+            return True
+
+    def _merge_volume(self, action, trace=None):
+        if self.volume is None:
+            if self._pending_count() >= self.max_pending:
+                return self._drop('volume')
+            self.volume = {"set": None, "steps": 0, "toggle_mute": 0}
+        else:
+            self.counters["coalesced_volume"] += 1
+        if action == 'up':
+            self.volume["steps"] += 1
+        elif action == 'down':
+            self.volume["steps"] -= 1
+        elif action == 'max':
+            # max выставляет 100% и снимает mute — всё, что было до него, не важно
+            self.volume = {"set": 'max', "steps": 0, "toggle_mute": 0}
+        elif action == 'mute':
+            self.volume["toggle_mute"] ^= 1
+        if trace is not None:
+            # Схлопнутая команда продолжает трассу последней из слитых
+            self.volume["_trace"] = trace
+        return True
+
+    def _preempt(self):
+        dropped = len(self.other) + (self.play is not None) + (self.volume is not None)
+        self.counters["preempted_by_stop"] += dropped
+        self.other.clear()
+        self.play = None
+        self.volume = None
+
+    def _drop(self, cmd_type):
+        self.counters["dropped_full"] += 1
+        print(f"⛔ Очередь команд переполнена, отброшено: {cmd_type}")
+        return False
+
+    def _pending_count(self):
+        return (len(self.other) + (self.play is not None)
+                + (self.volume is not None) + self.stop_pending)
+
+    # --- ВЫДАЧА ---
+    def get(self, timeout=None):
+        """Следующая команда по приоритету или None по таймауту."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self._pending_count() == 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            self.counters["executed"] += 1
+            if self.stop_pending:
+                self.stop_pending = False
+                return {"type": "stop"}
+            if self.volume is not None:
+                volume, self.volume = self.volume, None
+                return {"type": "volume", "action": "adjust", **volume}
+            if self.play is not None:
+                play, self.play = self.play, None
+                return play
+            return self.other.popleft()
+
+    def stats(self):
+        with self.cond:
+            return {"pending": self._pending_count(), "max_pending": self.max_pending, **self.counters}
@@ -0,0 +1,159 @@
+"""Локальный канал команд между голосовым ассистентом и медиа-плеером.
+
+Unix-сокет, постоянное соединение, JSON построчно, на каждую команду —
+подтверждение. Схема команд общая для обоих процессов; HTTP /webhook
+остаётся для удалённых push с сервера.
+"""
+import os
+import json
+import time
+import socket
+import threading
+
+CUBE_IPC_SOCKET = '/tmp/golo-cube.sock'
+
+VOLUME_ACTIONS = ('up', 'down', 'max', 'mute')
+STATIC_NUMBERS = ('1', '2', '3')
+
+
+# --- ОБЩАЯ СХЕМА КОМАНД ---
+def make_static(image_number, music_data="off"):
+    return {"type": "static_image", "image_number": str(image_number), "music_data": music_data}
+
+
+def make_volume(action):
+    return {"type": "volume", "action": action}
+
+
+def make_stop():
+    return {"type": "stop"}
+
+
+def validate_command(cmd):
+    """Проверяет команду по схеме. Возвращает её или бросает ValueError."""
+    if not isinstance(cmd, dict):
+        raise ValueError("команда должна быть объектом")
+    cmd_type = cmd.get('type')
+    if cmd_type == 'static_image':
+        if str(cmd.get('image_number')) not in STATIC_NUMBERS:
+            raise ValueError(f"неизвестный номер медиа: {cmd.get('image_number')}")
+    elif cmd_type == 'volume':
+        if cmd.get('action') not in VOLUME_ACTIONS:
+            raise ValueError(f"неизвестное действие громкости: {cmd.get('action')}")
+    elif cmd_type != 'stop':
+        raise ValueError(f"неизвестный тип команды: {cmd_type}")
+    return cmd
+
+
+# --- СЕРВЕР (медиа-плеер) ---
+class IpcServer:
+    """Принимает команды на unix-сокете и отвечает подтверждением.
+
+    handler(cmd) возвращает статус: 'ok' или 'dropped' (очередь полна).
+    """
+
+    def __init__(self, handler, path=CUBE_IPC_SOCKET):
+        self.handler = handler
+        self.path = path
+        self.sock = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(8)
+        threading.Thread(target=self._accept_loop, name="ipc-accept", daemon=True).start()
+        print(f"🔌 Локальный канал команд: {self.path}")
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), name="ipc-conn", daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile('rb') as rfile:
+            for line in rfile:
+                try:
+                    msg = json.loads(line)
+                    cmd = validate_command(msg.get('cmd'))
+                    reply = {"id": msg.get('id'), "status": self.handler(cmd)}
+                except ValueError as e:
+                    reply = {"id": msg.get('id') if isinstance(msg, dict) else None,
+                             "status": "error", "error": str(e)}
+                except Exception as e:
+                    reply = {"id": None, "status": "error", "error": str(e)}
+                try:
+                    conn.sendall((json.dumps(reply) + '\n').encode('utf-8'))
+                except OSError:
+                    break
+
+
+# --- КЛИЕНТ (голосовой ассистент) ---
+class IpcClient:
+    """Постоянное соединение с медиа-плеером: отправка с подтверждением и повтором.
+
+    Повторяется только отправка, которая не ушла (нет соединения, сокет
+    закрыт). Если команда ушла, а ответа нет, плеер мог её уже выполнить:
+    повтор (в том числе через HTTP) сыграл бы её дважды, поэтому такой
+    исход — отдельный статус no_reply, а не None.
+    """
+
+    def __init__(self, path=CUBE_IPC_SOCKET, timeout=0.5, retries=3, backoff=0.05):
+        self.path = path
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.sock = None
+        self.rfile = None
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+
+    def close(self):
+        for obj in (self.rfile, self.sock):
+            try:
+                if obj: obj.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.rfile = None
+
+    def send(self, cmd):
+        """Отправляет команду. Возвращает ответ сервера или None, если не доставлено."""
+        validate_command(cmd)
+        with self.lock:
+            for attempt in range(self.retries):
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    msg_id = self.next_id
+                    self.next_id += 1
+                    self.sock.sendall((json.dumps({"id": msg_id, "cmd": cmd}) + '\n').encode('utf-8'))
+                except OSError:
+                    self.close()
+                    time.sleep(self.backoff * (2 ** attempt))
+                    continue
+                try:
+                    while True:
+                        line = self.rfile.readline()
+                        if not line:
+                            raise ConnectionError("соединение закрыто")
+                        reply = json.loads(line)
+                        # Ответ на старый запрос после таймаута — пропускаем
+                        if reply.get('id') == msg_id:
+                            return reply
+                except (OSError, ConnectionError, ValueError) as e:
+                    self.close()
+                    return {"id": msg_id, "status": "no_reply", "error": str(e) or "таймаут"}
+            return None
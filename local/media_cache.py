@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+EXT_RE = re.compile(r'^[0-9a-z]{1,5}$')
+
+
+class RangeMismatch(Exception):
+    """Кусок докачки пришёл не с того места, где остановился файл."""
+
+    def __init__(self, received):
+        super().__init__(f"ожидалось смещение {received}")
+        self.received = received
+
+
+class MediaCache:
+    """Кэш присланных сервером медиа на SD-карте Куба.
+
+    Файл хранится под именем <sha256>.<ext>, поэтому одинаковые картинки
+    лежат один раз, а сервер может спросить «есть ли у тебя хэш X?» и не
+    гонять байты через туннель повторно. Размер папки ограничен: при
+    переполнении удаляются давно не игравшие файлы (LRU по mtime, так что
+    порядок переживает перезапуск). Большие файлы приходят кусками в
+    .partial/<хэш>.part и после обрыва туннеля докачиваются с места обрыва.
+    Файлы из protect() (слоты расписания) не вытесняются; пока набор не
+    передан первым protect(), квота не применяется, чтобы при запуске не
+    вытеснить файлы расписания, которое ещё не прочитано с диска.
+    """
+
+    def __init__(self, folder, max_bytes, max_files, partial_ttl=6 * 3600):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.partial_ttl = partial_ttl
+        self.partial_folder = os.path.join(folder, '.partial')
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # имя -> размер, от давно игравших к недавним
+        self.by_hash = {}           # хэш -> имя
+        self.protected = set()      # хэши, которые нельзя вытеснять
+        self.protected_loaded = False  # до первого protect() не вытесняем ничего
+        self.total_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "bytes_received": 0}
+        os.makedirs(self.partial_folder, exist_ok=True)
+        self._scan()
+
+    # --- ПАПКА ---
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.folder):
+            path = self.path_for(name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                found.append((st.st_mtime, name, st.st_size))
+        # Файлы до кэша (имя от отправителя) тоже учитываются и вытесняются
+        for _, name, size in sorted(found):
+            self._add(name, size)
+        now = time.time()
+        for name in os.listdir(self.partial_folder):
+            path = os.path.join(self.partial_folder, name)
+            if now - os.path.getmtime(path) > self.partial_ttl or not name.endswith('.part'):
+                os.remove(path)
+        self._evict()
+        print(f"🗃️ Кэш медиа: {len(self.files)} файлов, {self.total_bytes / 1024 / 1024:.1f} МБ")
+
+    def _add(self, name, size):
+        self.files[name] = size
+        self.files.move_to_end(name)
+        self.total_bytes += size
+        h = name.split('.', 1)[0]
+        if HASH_RE.match(h):
+            self.by_hash[h] = name
+
+    def _drop(self, name):
+        self.total_bytes -= self.files.pop(name)
+        h = name.split('.', 1)[0]
+        if self.by_hash.get(h) == name:
+            del self.by_hash[h]
+
+    def _evict(self):
+        if not self.protected_loaded:
+            return
+        # Последний (только что пришедший) файл не трогаем, даже если он один больше квоты
+        while len(self.files) > 1 and (self.total_bytes > self.max_bytes or len(self.files) > self.max_files):
+            name = next((n for n in list(self.files)[:-1] if n.split('.', 1)[0] not in self.protected), None)
+            if name is None:
+                break  # Всё остальное нужно расписанию
+            self._drop(name)
+            try:
+                os.remove(self.path_for(name))
+            except FileNotFoundError:
+                pass
+            self.counters["evicted"] += 1
+            print(f"🧹 Кэш медиа: вытеснен {name}")
+
+    def _touch(self, name):
+        self.files.move_to_end(name)
+        try:
+            os.utime(self.path_for(name))
+        except OSError:
+            pass
+
+    def path_for(self, name):
+        return os.path.join(self.folder, name)
+
+    def partial_path(self, h):
+        return os.path.join(self.partial_folder, f"{h}.part")
+
+    def protect(self, hashes):
+        """Заменяет набор хэшей, которые держатся в кэше при любой квоте."""
+        with self.lock:
+            self.protected = set(hashes)
+            self.protected_loaded = True
+            self._evict()  # Отложенная с запуска квота
+
+    # --- ПОИСК ---
+    def lookup(self, h):
+        """Путь к файлу с хэшем h или None; найденный файл становится самым свежим."""
+        with self.lock:
+            name = self.by_hash.get(h)
+            if name and not os.path.exists(self.path_for(name)):
+                self._drop(name)  # Удалили руками
+                name = None
+            if name is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self._touch(name)
+            return self.path_for(name)
+
+    def have(self, hashes):
+        """Ответ на «есть ли у тебя»: какие хэши уже в кэше и сколько байт докачано у остальных."""
+        have, partial = [], {}
+        for h in hashes:
+            if not isinstance(h, str) or not HASH_RE.match(h):
+                continue
+            if self.lookup(h):
+                have.append(h)
+            elif os.path.exists(self.partial_path(h)):
+                partial[h] = os.path.getsize(self.partial_path(h))
+        return {"have": have, "partial": partial}
+
+    # --- ПРИЁМ ---
+    def put_stream(self, stream, filename, expected_hash=None):
+        """Файл целиком из запроса; хэш считается на лету. Возвращает путь в кэше."""
+        ext = self._ext(filename)
+        tmp_path = os.path.join(self.partial_folder, f"{uuid.uuid4().hex}.tmp")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            h = hasher.hexdigest()
+            if expected_hash and expected_hash != h:
+                raise ValueError(f"хэш не совпал: ждали {expected_hash[:12]}, пришёл {h[:12]}")
+            return self._adopt(tmp_path, h, ext, size)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def write_chunk(self, h, ext, offset, data, total):
+        """Кусок докачки. Возвращает, сколько байт файла уже на Кубе.
+
+        RangeMismatch — кусок не с того места (отправитель продолжит с received),
+        ValueError — неверный хэш, расширение или размер.
+        """
+        if not HASH_RE.match(h) or not EXT_RE.match(ext):
+            raise ValueError("неверный хэш или расширение")
+        with self.lock:
+            if h in self.by_hash:
+                return total
+            path = self.partial_path(h)
+            received = os.path.getsize(path) if os.path.exists(path) else 0
+            if offset != received:
+                raise RangeMismatch(received)
+            if received + len(data) > total:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise ValueError(f"кусок выходит за размер файла {total}")
+            with open(path, 'ab') as out:
+                out.write(data)
+            received += len(data)
+            self.counters["bytes_received"] += len(data)
+        if received < total:
+            return received
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        if hasher.hexdigest() != h:
+            os.remove(path)
+            raise ValueError(f"хэш собранного файла не совпал с {h[:12]}")
+        self._adopt(path, h, ext, total)
+        return total
+
+    def _adopt(self, tmp_path, h, ext, size):
+        with self.lock:
+            name = self.by_hash.get(h)
+            if name and os.path.exists(self.path_for(name)):
+                os.remove(tmp_path)
+                self._touch(name)
+                return self.path_for(name)
+            if name:
+                self._drop(name)
+            name = f"{h}.{ext}"
+            os.replace(tmp_path, self.path_for(name))
+            if name in self.files:
+                self._drop(name)
+            self._add(name, size)
+            self.counters["stored"] += 1
+            self._evict()
+            return self.path_for(name)
+
+    def _ext(self, filename):
+        ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else 'bin'
+        return ext if EXT_RE.match(ext) else 'bin'
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.files), "bytes": self.total_bytes,
+                    "max_bytes": self.max_bytes, **self.counters}
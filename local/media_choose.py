@@ -1,22 +1,18 @@
 import os
+import re
 import time
-import json
-import queue
-import signal
 import threading
-import subprocess
 import requests
-from flask import Flask, request, jsonify
-import sys
-
-# --- БЛОК ИНИЦИАЛИЗАЦИИ ЗВУКА ---
-HAS_PULSE = False 
-try:
-    import pulsectl
-    HAS_PULSE = True
-except ImportError:
-    HAS_PULSE = False
-    print("⚠️ ВНИМАНИЕ: Библиотека 'pulsectl' не найдена. Звук регулироваться не будет.")
+from flask import Flask, Response, request, jsonify
+from werkzeug.serving import make_server
+from mpv_player import MpvPlayer, warm_page_cache, probe_media
+from command_scheduler import CommandScheduler
+from volume_control import VolumeControl
+from cube_ipc import IpcServer
+from media_cache import MediaCache, RangeMismatch
+from playlist import PlaylistRunner
+from tracing import Trace, METRICS
+from boot import BootTimer
 
 # --- ОПРЕДЕЛЕНИЕ ПУТЕЙ (АБСОЛЮТНАЯ ПРИВЯЗКА) ---
 # Получаем точный путь к папке, где лежит этот скрипт (media_choose.py)
@@ -24,9 +20,19 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 DOWNLOAD_FOLDER = os.path.join(BASE_DIR, 'downloaded_media')
 STATIC_VIDEO_FOLDER = os.path.join(BASE_DIR, 'static_videos')
+PLAYLISTS_FILE = os.path.join(BASE_DIR, 'playlists.json')  # Расписание сцен от сервера
 
 SERVER_UPDATE_URL = "https://myTree.pythonanywhere.com/admin/update_url"
 ADMIN_SECRET = "GOLO_CUBE_SECRET_KEY_2025" 
+# Имя этого Куба в реестре сервера и группы (через запятую), напр. GOLO_CUBE_GROUPS=hall_a
+CUBE_ID = os.environ.get('GOLO_CUBE_ID', 'default')
+CUBE_GROUPS = [g for g in os.environ.get('GOLO_CUBE_GROUPS', '').split(',') if g]
+HEARTBEAT_INTERVAL = 300  # Как часто повторять рукопожатие, чтобы сервер видел Куб живым (сек)
+NGROK_API_URL = "http://127.0.0.1:4040/api/tunnels"
+TUNNEL_POLL = 0.2          # Как часто спрашивать ngrok, пока туннель не поднялся (сек)
+TUNNEL_CHECK = 10          # ...и потом — не сменился ли адрес после переподключения
+REGISTER_BACKOFF_MAX = 30  # Потолок паузы между повторами регистрации адреса (сек)
+HTTP_PORT = 5000
 
 # Настройки изображения для MPV (Яркость/Контраст: -100 до 100)
 VIDEO_SETTINGS = {
@@ -35,37 +41,107 @@ VIDEO_SETTINGS = {
     "3": {"brightness": 10, "contrast": 0},
 }
 
+# Держать статические сцены в плейлисте mpv и в page cache
+PRELOAD_STATIC = True
+WARM_INTERVAL = 600  # Как часто напоминать ядру про файлы сцен (сек)
+
+MAX_PENDING_COMMANDS = 64  # Сколько команд может ждать выполнения (после схлопывания)
+# Типы команд, которые попадают в метки метрик как есть; прочие считаются как other
+COMMAND_TYPES = ('static_image', 'custom_image', 'custom_video', 'volume', 'stop')
+
+# Кэш присланных файлов в downloaded_media: сверх квоты удаляются давно не игравшие
+MEDIA_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+MEDIA_CACHE_MAX_FILES = 2000
+
 # Создаем папки, если их нет
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 os.makedirs(STATIC_VIDEO_FOLDER, exist_ok=True)
 
 app = Flask(__name__)
+boot = BootTimer('media')
 
 # --- СИНХРОНИЗАЦИЯ NGROK ---
-def sync_ngrok_url_to_server():
-    time.sleep(3)
+def tunnel_url():
+    """Публичный адрес /webhook из локального API ngrok или None, пока туннеля нет."""
     try:
-        response = requests.get("http://127.0.0.1:4040/api/tunnels", timeout=1)
-        tunnels = response.json().get('tunnels', [])
-        if tunnels:
-            url = tunnels[0]['public_url'] + "/webhook"
-            print(f"✅ ONLINE: {url}")
-            requests.post(SERVER_UPDATE_URL, json={"secret": ADMIN_SECRET, "url": url}, timeout=5)
-    except: pass
+        tunnels = requests.get(NGROK_API_URL, timeout=1).json().get('tunnels', [])
+    except (requests.RequestException, ValueError):
+        return None
+    return tunnels[0]['public_url'] + "/webhook" if tunnels else None
+
+def sync_ngrok_url_to_server(on_server_date=None):
+    """Ждёт туннель, регистрирует адрес на сервере с повторами и дальше держит его свежим.
+
+    on_server_date получает заголовок Date ответа — по нему сверяются часы.
+    """
+    registered, registered_at, backoff = None, 0.0, 0.5
+    while True:
+        url = tunnel_url()
+        if url is None:
+            time.sleep(TUNNEL_POLL if registered is None else TUNNEL_CHECK)
+            continue
+        boot.mark('tunnel')
+        if url == registered and time.time() - registered_at < HEARTBEAT_INTERVAL:
+            time.sleep(TUNNEL_CHECK)
+            continue
+        try:
+            r = requests.post(SERVER_UPDATE_URL, json={"secret": ADMIN_SECRET, "url": url,
+                                                       "cube_id": CUBE_ID, "groups": CUBE_GROUPS}, timeout=5)
+            r.raise_for_status()
+            if on_server_date:
+                on_server_date(r.headers.get('Date'))
+        except requests.RequestException as e:
+            print(f"⚠️ Адрес не зарегистрирован ({e}), повтор через {backoff:.1f} с")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, REGISTER_BACKOFF_MAX)
+            continue
+        if url != registered:
+            print(f"✅ ONLINE: {url} ({CUBE_ID})")
+        boot.mark('registered')
+        registered, registered_at, backoff = url, time.time(), 0.5
 
 class MediaController:
     def __init__(self):
-        self.cmd_queue = queue.Queue()
+        self.scheduler = CommandScheduler(max_pending=MAX_PENDING_COMMANDS)
         self.is_running = True
-        self.current_process = None
+        self.player = MpvPlayer()
+        self.volume = VolumeControl()
         # Имена файлов должны быть именно такими внутри папки static_videos
         self.static_files = {
             "1": "video_1.mp4",
             "2": "video_2.mp4",
             "3": "video_3.mp4"
         }
+        self.static_status = {}  # номер -> (ok, причина) после самопроверки
+        self.cache = MediaCache(DOWNLOAD_FOLDER, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_MAX_FILES)
+        # Слоты расписания переключаются здесь по таймеру, а не запросом с сервера
+        self.playlists = PlaylistRunner(PLAYLISTS_FILE, self.cache, lambda cmd: self.enqueue(cmd, 'playlist'),
+                                        scene_ok=lambda num: self.static_status.get(num, (True, ''))[0])
+        self.scene_index = {}    # номер -> позиция в плейлисте mpv
+        # Голосовой ассистент на том же кубе шлёт команды сюда, минуя HTTP
+        self.ipc = IpcServer(self.enqueue_local)
+        self.frame_trace = None  # команда воспроизведения, ждущая первого кадра
+        self.player.on_playback_start = self.on_first_frame
+        METRICS.gauge('queue_depth', lambda: {"scheduler": self.scheduler.stats()['pending'],
+                                              "volume": self.volume.requests.qsize()}, label='queue')
+        METRICS.gauge('media_cache_bytes', lambda: self.cache.stats()['bytes'])
+        METRICS.gauge('boot_phase_seconds', boot.durations, label='phase')
         self.setup_webhook()
 
+    def enqueue(self, data, source):
+        kind = data.get('type') if data.get('type') in COMMAND_TYPES else 'other'
+        trace = Trace.from_fields(data, kind)
+        trace.mark(source)
+        data['_trace'] = trace
+        METRICS.inc('commands', source=source, type=trace.kind)
+        if not self.scheduler.put(data):
+            METRICS.inc('errors', stage='scheduler_full', source=source)
+            return False
+        return True
+
+    def enqueue_local(self, cmd):
+        return 'ok' if self.enqueue(cmd, 'ipc') else 'dropped'
+
     def setup_webhook(self):
         @app.route('/webhook', methods=['POST'])
         def webhook():
@@ -73,48 +149,158 @@ class MediaController:
                 fname = None
                 if 'file' in request.files:
                     f = request.files['file']
-                    fname = f.filename
-                    f.save(os.path.join(DOWNLOAD_FOLDER, fname))
+                    # В кэш под именем по хэшу: повтор той же картинки место не занимает
+                    fname = os.path.basename(self.cache.put_stream(f.stream, f.filename, request.form.get('hash')))
                 
                 data = request.form.to_dict() if request.form else (request.get_json() or {})
+                if data.get('type') == 'playlist':
+                    try:
+                        return jsonify(self.playlists.update(data))
+                    except (ValueError, KeyError, TypeError) as e:
+                        return jsonify({'error': f'плейлист отклонён: {e}'}), 400
+                if data.get('type') == 'prefetch':
+                    # Файл к будущему слоту расписания: только в кэш, ничего не играем
+                    if not fname and (not data.get('hash') or self.cache.lookup(data['hash']) is None):
+                        return jsonify({'status': 'missing', 'hash': data.get('hash')}), 409
+                    return jsonify({'status': 'ok'})
                 if fname: 
                     data['filename'] = fname
                     data['type'] = 'custom_video'
+                elif data.get('hash') and data.get('type') == 'custom_image':
+                    # Сервер прислал только ссылку: файл должен быть в кэше
+                    path = self.cache.lookup(data['hash'])
+                    if path is None:
+                        METRICS.inc('errors', stage='cache_miss')
+                        return jsonify({'status': 'missing', 'hash': data['hash']}), 409
+                    data['filename'] = os.path.basename(path)
                 
-                self.cmd_queue.put(data)
+                if not self.enqueue(data, 'webhook'):
+                    return jsonify({'status': 'dropped', 'error': 'queue full'}), 429
                 return jsonify({'status': 'ok'})
             except Exception as e:
+                METRICS.inc('errors', stage='webhook')
                 return jsonify({'error': str(e)}), 500
 
+        @app.route('/media/have', methods=['POST'])
+        def media_have():
+            """Сервер спрашивает, какие файлы уже есть, чтобы не слать их снова."""
+            hashes = (request.get_json(silent=True) or {}).get('hashes') or []
+            return jsonify(self.cache.have(hashes))
+
+        @app.route('/media/<h>', methods=['PUT'])
+        def media_put(h):
+            """Кусок большого файла; Content-Range: bytes начало-конец/размер."""
+            m = re.match(r'bytes (\d+)-(\d+)/(\d+)$', request.headers.get('Content-Range', ''))
+            if not m:
+                return jsonify({'error': 'Content-Range required'}), 400
+            total = int(m.group(3))
+            try:
+                received = self.cache.write_chunk(h, request.args.get('ext', 'jpg'), int(m.group(1)),
+                                                  request.get_data(), total)
+            except RangeMismatch as e:
+                return jsonify({'received': e.received}), 416
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'received': received, 'complete': received == total})
+
+        @app.route('/status', methods=['GET'])
+        def status():
+            return jsonify({'scheduler': self.scheduler.stats(), 'media_cache': self.cache.stats(),
+                            'playlists': self.playlists.stats(), 'boot': boot.summary()})
+
+        @app.route('/metrics', methods=['GET'])
+        def metrics():
+            return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+    def on_first_frame(self):
+        boot.mark('first_frame')
+        trace, self.frame_trace = self.frame_trace, None
+        if trace:
+            trace.mark('frame')
+            trace.log()
+
+    def check_static_files(self):
+        """Самопроверка при старте: каждая статическая сцена есть и декодируется."""
+        paths = {num: os.path.join(STATIC_VIDEO_FOLDER, name) for num, name in self.static_files.items()}
+        results = {}
+        threads = [
+            threading.Thread(target=lambda n=num, p=path: results.__setitem__(n, probe_media(p)))
+            for num, path in paths.items()
+        ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        for num in sorted(results):
+            ok, reason = results[num]
+            print(f"{'✅' if ok else '❌'} Сцена {num} ({self.static_files[num]}): {reason}")
+        self.static_status = results
+        return [paths[num] for num in sorted(results) if results[num][0]]
+
+    def preload_static(self, ready):
+        """Сцены, прошедшие самопроверку, — в плейлист mpv; page cache греется в фоне."""
+        if not PRELOAD_STATIC or not ready:
+            return
+        ready_nums = [num for num in sorted(self.static_status) if self.static_status[num][0]]
+        self.scene_index = {num: i for i, num in enumerate(ready_nums)}
+        self.player.preload(ready)
+        print(f"🔥 Сцены в плейлисте: {', '.join(ready_nums)}")
+
+        def keep_warm():
+            # Полное чтение с SD-карты — не на пути к готовности
+            warm_page_cache(ready)
+            while self.is_running:
+                time.sleep(WARM_INTERVAL)
+                warm_page_cache(ready, read=False)
+        threading.Thread(target=keep_warm, daemon=True).start()
+
     def start(self):
-        threading.Thread(target=lambda: app.run(host='0.0.0.0', port=5000, use_reloader=False), daemon=True).start()
-        threading.Thread(target=sync_ngrok_url_to_server, daemon=True).start()
+        # Порт слушается сразу: туннель и сервер могут стучаться, пока поднимается mpv
+        with boot.phase('http'):
+            server = make_server('0.0.0.0', HTTP_PORT, app, threaded=True)
+            threading.Thread(target=server.serve_forever, name="http", daemon=True).start()
+        threading.Thread(target=sync_ngrok_url_to_server, args=(self.playlists.note_server_date,),
+                         name="tunnel-sync", daemon=True).start()
+        # Команды, пришедшие раньше готовности, ждут в планировщике
+        ready = []
+        boot.parallel(mpv=self.player.start, probe=lambda: ready.extend(self.check_static_files()),
+                      volume=self.volume.start, ipc=self.ipc.start)
+        with boot.phase('playlist'):
+            self.preload_static(ready)
+        boot.ready()
+        self.playlists.start()
         
-        print(f"✅ MEDIA CONTROLLER STARTED")
+        print("✅ MEDIA CONTROLLER STARTED")
         print(f"📂 Корневая директория: {BASE_DIR}")
         print(f"📂 Папка с видео (ожидаемая): {STATIC_VIDEO_FOLDER}")
         
         try:
             while self.is_running:
-                try:
-                    data = self.cmd_queue.get(timeout=1)
+                data = self.scheduler.get(timeout=1)
+                if data:
                     self.process_data(data)
-                except queue.Empty:
-                    pass
         except KeyboardInterrupt:
-            self.stop_all()
+            self.player.shutdown()
 
     def process_data(self, data):
+        trace = data.pop('_trace', None) or Trace(data.get('type') or 'unknown')
+        trace.mark('dequeued')
         try:
             cmd_type = data.get('type')
             print(f"⚙️ Processing: {cmd_type}")
 
             if cmd_type == 'stop':
+                self.frame_trace = None
                 self.stop_all()
+                trace.mark('done')
+                trace.log()
                 return
 
             if cmd_type == 'volume':
-                self.set_volume(data.get('action'))
+                if data.get('action') == 'adjust':
+                    self.adjust_volume(data.get('set'), data.get('steps', 0), data.get('toggle_mute', 0))
+                else:
+                    self.set_volume(data.get('action'))
+                trace.mark('done')
+                trace.log()
                 return
 
             # Логика воспроизведения
@@ -126,6 +312,14 @@ class MediaController:
 
             # 1. СТАТИЧЕСКИЕ ВИДЕО (Медиа 1, 2, 3)
             if cmd_type == 'static_image': 
+                if img_num in self.scene_index:
+                    # Сцена уже в плейлисте mpv: мгновенный переход без открытия файла заново
+                    self.frame_trace = trace
+                    self.player.play_scene(self.scene_index[img_num], VIDEO_SETTINGS.get(img_num, settings))
+                    trace.mark('mpv_command')
+                    return
+                if img_num in self.static_status and not self.static_status[img_num][0]:
+                    print(f"⚠️ Сцена {img_num} не прошла самопроверку: {self.static_status[img_num][1]}")
                 if img_num in self.static_files:
                     target_path = os.path.join(STATIC_VIDEO_FOLDER, self.static_files[img_num])
                     settings = VIDEO_SETTINGS.get(img_num, settings)
@@ -136,70 +330,45 @@ class MediaController:
             elif cmd_type == 'custom_video' or (cmd_type == 'custom_image' and fname):
                 if fname:
                     target_path = os.path.join(DOWNLOAD_FOLDER, fname)
+                # Сервер уже уменьшил, повернул и осветлил картинку
+                if str(data.get('prerendered', '')).lower() in ('true', '1'):
+                    settings = {"brightness": 0, "contrast": 0, "rotate": 0}
             
             # ПРОВЕРКА И ЗАПУСК
             if target_path:
                 if os.path.exists(target_path):
+                    self.frame_trace = trace
                     self.play_video(target_path, settings)
+                    trace.mark('mpv_command')
                 else:
+                    METRICS.inc('errors', stage='file_missing')
                     print(f"❌ ФАЙЛ НЕ НАЙДЕН ПО ПУТИ: {target_path}")
                     print(f"   Убедитесь, что файл '{self.static_files.get(img_num, '???')}' лежит в папке 'static_videos' рядом со скриптом.")
             else:
                 print("⚠️ Путь к файлу не сформирован.")
 
         except Exception as e:
+            METRICS.inc('errors', stage='process')
             print(f"Error processing: {e}")
 
     def play_video(self, path, settings):
-        self.stop_all()
-        
-        cmd = [
-            'mpv',
-            '--loop',
-            '--fs',
-            '--video-rotate=180',
-            f'--brightness={settings["brightness"]}',
-            f'--contrast={settings["contrast"]}',
-            '--no-osc',
-            path
-        ]
-        
+        # mpv уже запущен: переключение — это loadfile, настройки — живые свойства
         print(f"▶️ Запуск: {path}")
-        try:
-            self.current_process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.DEVNULL, 
-                stderr=subprocess.DEVNULL
-            )
-        except FileNotFoundError:
-            print("❌ ОШИБКА: 'mpv' не установлен! (sudo apt install mpv)")
+        self.player.play(path, settings)
 
     def stop_all(self):
-        if self.current_process:
-            print("⏹️ Стоп")
-            try:
-                self.current_process.terminate()
-                self.current_process.wait(timeout=1)
-            except:
-                try: self.current_process.kill() 
-                except: pass
-            self.current_process = None
-        subprocess.run(['pkill', 'mpv'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        print("⏹️ Стоп")
+        self.player.stop()
 
     def set_volume(self, action):
-        if not HAS_PULSE: return
-        try:
-            with pulsectl.Pulse('golo-volume') as pulse:
-                sinks = pulse.sink_list()
-                for sink in sinks:
-                    if action == 'up': pulse.volume_change_all_chans(sink, 0.1)
-                    elif action == 'down': pulse.volume_change_all_chans(sink, -0.1)
-                    elif action == 'max': 
-                        pulse.volume_set_all_chans(sink, 1.0)
-                        pulse.mute(sink, False)
-                    elif action == 'mute': pulse.mute(sink, not sink.mute)
-        except Exception as e:
-            print(f"Audio Error: {e}")
+        if action == 'up': self.adjust_volume(None, 1, 0)
+        elif action == 'down': self.adjust_volume(None, -1, 0)
+        elif action == 'max': self.adjust_volume('max', 0, 0)
+        elif action == 'mute': self.adjust_volume(None, 0, 1)
+
+    def adjust_volume(self, set_to, steps, toggle_mute):
+        """Схлопнутая команда громкости: уходит в поток VolumeControl, не ждём PulseAudio."""
+        self.volume.adjust(set_to, steps, toggle_mute)
 
 if __name__ == '__main__':
     MediaController().start()
\ No newline at end of file
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import socket
+import threading
+import subprocess
+
+MPV_SOCKET = '/tmp/golo-mpv.sock'
+WARM_CHUNK = 1024 * 1024
+
+
+class MpvError(Exception):
+    pass
+
+
+class MpvPlayer:
+    """Один долгоживущий mpv, которым управляем через JSON IPC.
+
+    Смена медиа — это команда loadfile, а яркость/контраст/поворот — живые
+    свойства, поэтому не нужно каждый раз убивать процесс и ждать
+    инициализации декодера. Если mpv упал, сторож перезапускает его и
+    возвращает последний файл.
+    """
+
+    def __init__(self, socket_path=MPV_SOCKET, extra_args=None):
+        self.socket_path = socket_path
+        self.extra_args = extra_args or []
+        self.process = None
+        self.sock = None
+        self.lock = threading.RLock()      # процесс и сокет
+        self.send_lock = threading.Lock()  # запись в сокет
+        self.pending = {}                  # request_id -> [Event, ответ]
+        self.next_id = 1
+        self.properties = {}               # последние выставленные значения
+        self.current_path = None
+        self.current_settings = {}
+        self.last_error = None
+        self.running = False
+        self.scenes = []          # заранее загруженный плейлист статических сцен
+        self.scenes_loaded = False
+        self.current_scene = None
+        self.on_playback_start = None  # вызывается, когда mpv показал первый кадр после перехода
+
+    # --- ЖИЗНЕННЫЙ ЦИКЛ ---
+    def start(self):
+        self.running = True
+        try:
+            self._ensure_running()
+        except MpvError as e:
+            print(f"❌ ОШИБКА: {e}")
+        threading.Thread(target=self._watchdog, name="mpv-watchdog", daemon=True).start()
+
+    def shutdown(self):
+        self.running = False
+        with self.lock:
+            try:
+                self.command('quit', timeout=0.5)
+            except MpvError:
+                pass
+            if self.process:
+                try:
+                    self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+            self._close_socket()
+            self.process = None
+
+    def _spawn(self):
+        # Старый mpv от прошлого запуска держит сокет и экран.
+        # '--' обязателен: без него pkill примет шаблон за свою опцию
+        subprocess.run(['pkill', '-f', '--', f'--input-ipc-server={self.socket_path}'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        cmd = [
+            'mpv',
+            '--idle=yes',
+            '--force-window=yes',
+            '--loop-file=inf',
+            '--fs',
+            '--no-osc',
+            '--no-terminal',
+            # Следующая сцена плейлиста открывается и читается заранее, пока идёт текущая
+            '--prefetch-playlist=yes',
+            f'--input-ipc-server={self.socket_path}',
+        ] + self.extra_args
+        try:
+            self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            self.process = None
+            raise MpvError("'mpv' не установлен! (sudo apt install mpv)")
+        self.properties = {}
+        self.scenes_loaded = False
+
+    def _connect(self, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise MpvError(f"mpv завершился с кодом {self.process.returncode}")
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                self.sock = sock
+                threading.Thread(target=self._reader, args=(sock,), name="mpv-ipc", daemon=True).start()
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                time.sleep(0.02)
+        raise MpvError("mpv не открыл IPC-сокет")
+
+    def _ensure_running(self):
+        with self.lock:
+            if self.process and self.process.poll() is None and self.sock:
+                return
+            self._close_socket()
+            if not self.process or self.process.poll() is not None:
+                print("🎞️ Запуск mpv (IPC)...")
+                self._spawn()
+            self._connect()
+            if self.scenes and not self.scenes_loaded:
+                self._append_scenes()
+
+    def _close_socket(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        # Разбудить всех, кто ждёт ответа от старого сокета
+        for waiter in list(self.pending.values()):
+            waiter[1] = {"error": "disconnected"}
+            waiter[0].set()
+
+    def _watchdog(self):
+        while self.running:
+            time.sleep(1)
+            with self.lock:
+                alive = self.process and self.process.poll() is None and self.sock
+            if alive or not self.running:
+                continue
+            if self.last_error is None:
+                print("⚠️ mpv упал, перезапускаю...")
+            try:
+                self._ensure_running()
+                self.last_error = None
+                if self.current_scene is not None:
+                    self.play_scene(self.current_scene, self.current_settings)
+                elif self.current_path:
+                    self.play(self.current_path, self.current_settings)
+            except MpvError as e:
+                # Одна и та же ошибка (например, mpv не установлен) — печатаем один раз
+                if str(e) != self.last_error:
+                    print(f"❌ {e}")
+                self.last_error = str(e)
+
+    # --- IPC ---
+    def _reader(self, sock):
+        buf = b''
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except OSError:
+                chunk = b''
+            if not chunk:
+                break
+            buf += chunk
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                if msg.get('event') == 'playback-restart' and self.on_playback_start:
+                    self.on_playback_start()
+                    continue
+                waiter = self.pending.get(msg.get('request_id'))
+                if waiter:
+                    waiter[1] = msg
+                    waiter[0].set()
+        with self.lock:
+            if self.sock is sock:
+                self._close_socket()
+
+    def command(self, *args, timeout=1.0):
+        """Отправляет команду mpv и ждёт ответа. Возвращает поле data."""
+        if not self.sock:
+            raise MpvError("нет соединения с mpv")
+        with self.send_lock:
+            request_id = self.next_id
+            self.next_id += 1
+            waiter = [threading.Event(), None]
+            self.pending[request_id] = waiter
+            msg = json.dumps({"command": list(args), "request_id": request_id}) + '\n'
+            try:
+                self.sock.sendall(msg.encode('utf-8'))
+            except (OSError, AttributeError) as e:
+                self.pending.pop(request_id, None)
+                raise MpvError(f"ошибка отправки в mpv: {e}")
+        try:
+            if not waiter[0].wait(timeout):
+                raise MpvError(f"mpv не ответил на {args[0]}")
+        finally:
+            self.pending.pop(request_id, None)
+        reply = waiter[1]
+        if reply.get('error') != 'success':
+            raise MpvError(f"{args[0]}: {reply.get('error')}")
+        return reply.get('data')
+
+    def set_property(self, name, value):
+        # Не гоняем по сокету то, что уже выставлено
+        if self.properties.get(name) == value:
+            return
+        self.command('set_property', name, value)
+        self.properties[name] = value
+
+    # --- ВОСПРОИЗВЕДЕНИЕ ---
+    def play(self, path, settings):
+        """Переключает на файл и применяет brightness/contrast/rotate на лету."""
+        try:
+            self._ensure_running()
+            self.set_property('video-rotate', settings.get("rotate", 180))
+            self.set_property('brightness', settings.get("brightness", 0))
+            self.set_property('contrast', settings.get("contrast", 0))
+            self.command('loadfile', path, 'replace')
+            self.scenes_loaded = False  # replace очищает плейлист сцен
+            self.current_path = path
+            self.current_scene = None
+            self.current_settings = dict(settings)
+        except MpvError as e:
+            print(f"❌ mpv: {e}")
+
+    # --- ПРЕДЗАГРУЖЕННЫЕ СЦЕНЫ ---
+    def preload(self, paths):
+        """Ставит статические сцены в плейлист mpv, не начиная воспроизведение."""
+        self.scenes = list(paths)
+        try:
+            self._ensure_running()
+            if not self.scenes_loaded:
+                self._append_scenes()
+        except MpvError as e:
+            print(f"❌ mpv: {e}")
+
+    def _append_scenes(self):
+        # В режиме idle append не запускает воспроизведение
+        self.command('playlist-clear')
+        for path in self.scenes:
+            self.command('loadfile', path, 'append')
+        self.scenes_loaded = True
+
+    def play_scene(self, index, settings):
+        """Мгновенный переход на сцену плейлиста с её яркостью/контрастом."""
+        try:
+            self._ensure_running()
+            self.set_property('video-rotate', settings.get("rotate", 180))
+            self.set_property('brightness', settings.get("brightness", 0))
+            self.set_property('contrast', settings.get("contrast", 0))
+            if not self.scenes_loaded:
+                # После кастомного файла плейлист сцен потерян: stop очищает его целиком
+                self.command('stop')
+                self._append_scenes()
+            self.command('set_property', 'playlist-pos', index)
+            self.current_path = self.scenes[index]
+            self.current_scene = index
+            self.current_settings = dict(settings)
+        except MpvError as e:
+            print(f"❌ mpv: {e}")
+
+    def apply(self, settings):
+        """Меняет яркость/контраст текущего видео без перезагрузки файла."""
+        try:
+            for name in ('brightness', 'contrast'):
+                if name in settings:
+                    self.set_property(name, settings[name])
+        except MpvError as e:
+            print(f"❌ mpv: {e}")
+
+    def stop(self):
+        self.current_path = None
+        self.current_scene = None
+        try:
+            if self.sock:
+                self.command('stop')
+                self.scenes_loaded = False  # stop очищает плейлист
+                if self.scenes:
+                    self._append_scenes()
+        except MpvError as e:
+            print(f"❌ mpv: {e}")
+
+
+# --- ПРОГРЕВ И ПРОВЕРКА ФАЙЛОВ ---
+def warm_page_cache(paths, read=True):
+    """Подтягивает файлы в page cache, чтобы открытие сцены не ждало SD-карту."""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            if read:
+                while os.read(fd, WARM_CHUNK):
+                    pass
+        finally:
+            os.close(fd)
+
+
+def probe_media(path, timeout=15):
+    """Проверяет, что файл существует и декодируется. Возвращает (ok, причина)."""
+    if not os.path.exists(path):
+        return False, "файл не найден"
+    cmd = ['mpv', '--no-config', '--vo=null', '--ao=null', '--frames=1', '--really-quiet', path]
+    try:
+        r = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout)
+    except FileNotFoundError:
+        return True, "mpv не установлен, декодирование не проверено"
+    except subprocess.TimeoutExpired:
+        return False, "проверка не уложилась в таймаут"
+    if r.returncode != 0:
+        return False, f"mpv не смог декодировать (код {r.returncode})"
+    return True, "ok"
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+from mpv_player import warm_page_cache
+from tracing import METRICS
+
+PREFETCH_LEAD = 30     # За сколько секунд до слота проверить файл и поднять его в page cache
+EXPIRE_AFTER = 3600    # Через сколько секунд после последнего слота плейлист забывается
+IDLE_CHECK = 60        # Как часто просыпаться, когда впереди ничего нет
+CLOCK_SKEW_MAX = 5     # Расхождение с часами сервера, после которого Куб верит серверу (сек)
+
+
+class PlaylistRunner:
+    """Расписание сцен на Кубе: сервер присылает его заранее, переключает сам Куб.
+
+    Плейлисты лежат на диске и переживают перезагрузку, поэтому слот
+    наступает вовремя, даже если туннель медленный или лежит. Файлы
+    слотов приходят раньше (type=prefetch) и не вытесняются из кэша;
+    за lead секунд до слота файл ещё раз ищется в кэше и поднимается в
+    page cache, так что в момент слота остаётся только команда mpv.
+
+    fire(команда) ставит команду в тот же планировщик, что и webhook;
+    scene_ok(номер) — прошла ли статическая сцена самопроверку.
+    """
+
+    def __init__(self, path, cache, fire, scene_ok=None, lead=PREFETCH_LEAD):
+        self.path = path
+        self.cache = cache
+        self.fire = fire
+        self.scene_ok = scene_ok or (lambda num: True)
+        self.lead = lead
+        self.cond = threading.Condition()
+        self.playlists = {}    # id -> плейлист (и пустые-«надгробия» удалённых, ради версии)
+        self.timeline = []     # слоты всех плейлистов по времени
+        self.fired_upto = 0.0  # время последнего отыгранного слота
+        self.fired_keys = set()  # ...и какие слоты с этим временем уже отыграли
+        self.clock_offset = 0.0
+        self.running = False
+        self.counters = {"fired": 0, "skipped_late": 0, "missing": 0, "updates": 0, "stale_updates": 0}
+        self._load()
+
+    # --- ЧАСЫ ---
+    def now(self):
+        return time.time() + self.clock_offset
+
+    def note_server_date(self, header):
+        """Date из ответа сервера: без RTC часы Куба до NTP могут врать на годы."""
+        try:
+            skew = parsedate_to_datetime(header).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return
+        offset = skew if abs(skew) > CLOCK_SKEW_MAX else 0.0
+        if abs(offset - self.clock_offset) > 1:
+            print(f"🕰️ Часы Куба расходятся с сервером на {skew:+.0f} с, расписание идёт по серверу"
+                  if offset else "🕰️ Часы Куба сошлись с сервером")
+        with self.cond:
+            self.clock_offset = offset
+            self.cond.notify()
+
+    # --- ПЛЕЙЛИСТЫ ---
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.playlists = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Расписание на диске повреждено, ждём новое от сервера: {e}")
+                self.playlists = {}
+        # И без файла: кэш до первого protect() не применяет квоту
+        self._rebuild()
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.playlists, f)
+        os.replace(tmp_path, self.path)
+
+    def _rebuild(self):
+        """Пересобирает общую шкалу слотов и защищает их файлы от вытеснения из кэша."""
+        now = self.now()
+        for playlist_id in [pid for pid, p in self.playlists.items()
+                            if self._end(p) + EXPIRE_AFTER < now]:
+            del self.playlists[playlist_id]
+        self.timeline = sorted(
+            (dict(slot, playlist=playlist['id'], seq=n)
+             for playlist in self.playlists.values() for n, slot in enumerate(playlist['items'])),
+            key=lambda slot: slot['at'])
+        self.cache.protect(slot['file_hash'] for slot in self.timeline if slot.get('file_hash'))
+
+    def _end(self, playlist):
+        # У «надгробия» слотов нет: хранится, пока не устареет его версия
+        return playlist['items'][-1]['at'] if playlist['items'] else playlist.get('received', 0)
+
+    def update(self, data):
+        """Плейлист от сервера. Ответ — какие файлы его слотов ещё не в кэше."""
+        playlist_id = str(data.get('id') or '')
+        items = data.get('items')
+        if not playlist_id or not isinstance(items, list):
+            raise ValueError("плейлист без id или items")
+        version = int(data.get('version') or 0)
+        with self.cond:
+            current = self.playlists.get(playlist_id)
+            if current and current['version'] > version:
+                # Повтор старой копии из очереди сервера
+                self.counters["stale_updates"] += 1
+            elif not current or current['version'] != version:
+                self.counters["updates"] += 1
+                self.playlists[playlist_id] = {"id": playlist_id, "version": version, "received": time.time(),
+                                               "items": sorted(items, key=lambda slot: float(slot['at']))}
+                self._rebuild()
+                self._save()
+                self.cond.notify()
+                upcoming = sum(1 for slot in items if float(slot['at']) > self.now())
+                print(f"🗓️ Расписание {playlist_id} v{version}: " +
+                      (f"{upcoming} слотов впереди" if items else "снято"))
+            playlist = self.playlists.get(playlist_id)
+        missing = self.missing(playlist)
+        if missing:
+            print(f"📥 Расписание {playlist_id}: ждём файлы {', '.join(h[:12] for h in missing)}")
+        return {"status": "ok", "id": playlist_id, "version": playlist['version'] if playlist else version,
+                "missing": missing}
+
+    def missing(self, playlist):
+        """Хэши файлов будущих (и текущего) слотов, которых нет в кэше."""
+        if not playlist:
+            return []
+        now = self.now()
+        items = playlist['items']
+        wanted = [slot['file_hash'] for i, slot in enumerate(items) if slot.get('file_hash')
+                  and (slot['at'] > now or i + 1 == len(items) or items[i + 1]['at'] > now)]
+        have = set(self.cache.have(wanted)['have'])
+        return [h for h in dict.fromkeys(wanted) if h not in have]
+
+    # --- ТАЙМЕР ---
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._loop, name="playlist", daemon=True).start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _slot_key(self, slot):
+        return slot['playlist'], slot['seq']
+
+    def _next_slot(self):
+        # Слоты с одинаковым временем различаются ключом, иначе сыграл бы только первый
+        return next((slot for slot in self.timeline if slot['at'] > self.fired_upto or
+                     (slot['at'] == self.fired_upto and self._slot_key(slot) not in self.fired_keys)), None)
+
+    def _mark_fired(self, slot):
+        if slot['at'] != self.fired_upto:
+            self.fired_upto = slot['at']
+            self.fired_keys = set()
+        self.fired_keys.add(self._slot_key(slot))
+
+    def _loop(self):
+        self._resume()
+        while self.running:
+            with self.cond:
+                slot = self._next_slot()
+                if slot is None:
+                    self.cond.wait(IDLE_CHECK)
+                    continue
+                wait = slot['at'] - self.now()
+                if wait > self.lead:
+                    self.cond.wait(min(wait - self.lead, IDLE_CHECK))
+                    continue
+            if not slot.get('prepared'):
+                self._prepare(slot)
+            with self.cond:
+                if self._next_slot() is not slot:
+                    continue  # Расписание сменилось, пока готовились
+                wait = slot['at'] - self.now()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                self._mark_fired(slot)
+                following = self._next_slot()
+            if following and following['at'] <= self.now():
+                # Часы прыгнули, Куб спал или у слотов одно время: играет только последний
+                self.counters["skipped_late"] += 1
+                continue
+            self._fire(slot)
+
+    def _resume(self):
+        """После перезагрузки сразу включаем слот, который должен играть сейчас."""
+        now = self.now()
+        with self.cond:
+            self.fired_upto = now
+            past = [slot for slot in self.timeline if slot['at'] <= now]
+            self.fired_keys = {self._slot_key(slot) for slot in past if slot['at'] == now}
+            current = past[-1] if past else None
+            # Только если его плейлист ещё идёт: отыгравший не перехватывает экран
+            running = current and any(slot['at'] > now and slot['playlist'] == current['playlist']
+                                      for slot in self.timeline)
+        if running:
+            print(f"🗓️ Продолжаем расписание {current['playlist']} с текущего слота")
+            self._prepare(current)
+            self._fire(current)
+
+    def _prepare(self, slot):
+        """Проверка файла слота заранее: есть в кэше (хэш сверен при приёме) и прогрет."""
+        slot['prepared'] = True
+        if slot['type'] == 'custom_image':
+            path = self.cache.lookup(slot['file_hash'])
+            slot['path'] = path
+            if path is None:
+                print(f"⚠️ Слот {slot['playlist']} через {slot['at'] - self.now():.0f} с: "
+                      f"файла {slot['file_hash'][:12]} нет в кэше")
+                return
+            warm_page_cache([path])
+        elif slot['type'] == 'static_image' and not self.scene_ok(slot['image_number']):
+            print(f"⚠️ Слот {slot['playlist']}: сцена {slot['image_number']} не прошла самопроверку")
+
+    def _fire(self, slot):
+        if slot['type'] == 'custom_image' and not (slot.get('path') and os.path.exists(slot['path'])):
+            # Файл так и не пришёл: оставляем на экране то, что есть
+            self.counters["missing"] += 1
+            METRICS.inc('errors', stage='playlist_missing')
+            print(f"❌ Слот {slot['playlist']} пропущен: нет файла {slot['file_hash'][:12]}")
+            return
+        late_ms = (self.now() - slot['at']) * 1000
+        METRICS.observe('playlist_lateness_ms', max(0.0, late_ms))
+        self.counters["fired"] += 1
+        print(f"🗓️ Слот {slot['playlist']}: {slot['type']} (опоздание {late_ms:.0f} мс)")
+        self.fire(self._command(slot))
+
+    def _command(self, slot):
+        # Трасса начинается с времени слота: в ней видно опоздание до первого кадра
+        command = {"type": slot['type'], "playlist": slot['playlist'], "trace_t0": slot['at'] - self.clock_offset}
+        if slot['type'] == 'stop':
+            return command
+        command.update(image_number=slot.get('image_number', '0'), brightness=slot.get('brightness', 1.0),
+                       music_data=slot.get('music_data', 'off'), lighting_data=slot.get('lighting_data', 'off'))
+        if slot['type'] == 'custom_image':
+            command.update(filename=os.path.basename(slot['path']), hash=slot['file_hash'],
+                           prerendered=slot.get('prerendered', False))
+        return command
+
+    def stats(self):
+        now = self.now()
+        with self.cond:
+            upcoming = [slot for slot in self.timeline if slot['at'] > now]
+            return {"playlists": {pid: {"version": p['version'], "slots": len(p['items'])}
+                                  for pid, p in self.playlists.items() if p['items']},
+                    "next_slot_in": round(upcoming[0]['at'] - now, 1) if upcoming else None,
+                    "clock_offset": round(self.clock_offset, 1), **self.counters}
@@ -1,10 +1,14 @@
 #!/bin/bash
 
 # ==========================================
-# Golo_cube Launcher v2.0 (Robust Edition)
+# Golo_cube Launcher v2.1 (Fast Boot Edition)
 # Role: System Initialization & Process Management
 # ==========================================
 
+# Общая точка отсчёта: процессы считают свои фазы старта от неё
+export GOLO_BOOT_T0=$(date +%s.%N)
+BOOT_WAIT=120  # Сколько ждать сигналов готовности для итоговой сводки (сек)
+
 # 1. ЖЕСТКАЯ ФИКСАЦИЯ РАБОЧЕЙ ДИРЕКТОРИИ
 # Это гарантирует, что скрипт найдет .py файлы, откуда бы его ни запустили
 cd "$(dirname "$0")" || { echo "❌ Не удалось перейти в папку скрипта"; exit 1; }
@@ -25,38 +29,33 @@ function cleanup_old_processes {
     pkill -u "$(whoami)" -f "ngrok"
     pkill -u "$(whoami)" -f "media_choose.py"
     pkill -u "$(whoami)" -f "voise_intension_vosk.py"
-    sleep 2
+    rm -f /tmp/golo-*.ready
+    # Ждём, пока старые процессы реально завершатся (порт 5000 и сокеты свободны), но не дольше 2 с
+    for i in {1..20}; do
+        pgrep -u "$(whoami)" -f "ngrok|media_choose.py|voise_intension_vosk.py" > /dev/null || break
+        sleep 0.1
+    done
 }
 
 cleanup_old_processes
 
 # 4. ПРОВЕРКА ЗАВИСИМОСТЕЙ
-# Быстрая проверка, установлены ли критические библиотеки Python
-echo "🔍 Проверка библиотек Python..."
-python3 -c "import rapidfuzz, vosk, flask, PIL, pyaudio" 2>/dev/null
-if [ $? -ne 0 ]; then
-    echo "❌ ОШИБКА: Не все библиотеки установлены!"
-    echo "Попробуйте: pip install rapidfuzz vosk flask pillow pyaudio requests"
-    # Мы не выходим, но предупреждаем.
-    sleep 3
-else
-    echo "✅ Все библиотеки найдены."
-fi
+# Импорт vosk/PIL сам по себе занимает секунды, поэтому проверка идёт в фоне и только предупреждает
+echo "🔍 Проверка библиотек Python (в фоне)..."
+(
+    if python3 -c "import rapidfuzz, vosk, flask, PIL, pyaudio" 2>/dev/null; then
+        echo "✅ Все библиотеки найдены."
+    else
+        echo "❌ ОШИБКА: Не все библиотеки установлены!"
+        echo "Попробуйте: pip install rapidfuzz vosk flask pillow pyaudio requests"
+    fi
+) &
 
 # 5. ЗАПУСК NGROK (ТУННЕЛЬ)
 if command -v ngrok &> /dev/null; then
     echo "🚀 Запуск ngrok..."
+    # Не ждём: media_choose.py сам опрашивает API ngrok и регистрирует адрес, как только туннель поднимется
     nohup ngrok http 5000 > /tmp/ngrok.log 2>&1 &
-    
-    # Интеллектуальное ожидание запуска (вместо sleep 5)
-    echo "⏳ Ждем инициализации ngrok..."
-    for i in {1..10}; do
-        if pgrep -x "ngrok" > /dev/null; then
-            break
-        fi
-        sleep 1
-    done
-    sleep 2 # Дополнительное время на установку соединения
 else
     echo "⚠️ ПРЕДУПРЕЖДЕНИЕ: ngrok не найден в системе. Удаленный доступ не будет работать."
 fi
@@ -70,7 +69,32 @@ else
     nohup python3 -u voise_intension_vosk.py > /tmp/voice.log 2>&1 &
 fi
 
-# 7. ЗАПУСК МЕДИА-ПЛЕЕРА (ГЛАВНЫЙ ПРОЦЕСС)
+# 7. СВОДКА СТАРТА
+# Процессы пишут /tmp/golo-<имя>.ready, когда готовы; ждём оба и печатаем общее время
+function boot_summary {
+    local start=$(date +%s)
+    while [ $(( $(date +%s) - start )) -lt $BOOT_WAIT ]; do
+        if [ -f /tmp/golo-media.ready ] && { [ -f /tmp/golo-voice.ready ] || [ ! -d "model" ]; }; then
+            python3 - <<'PY'
+import json, os
+t0 = float(os.environ['GOLO_BOOT_T0'])
+for name in ('media', 'voice'):
+    path = f'/tmp/golo-{name}.ready'
+    if os.path.exists(path):
+        with open(path) as f:
+            s = json.load(f)
+        print(f"🏁 {name}: готов через {s['marks']['ready']:.2f} с после start.sh"
+              + (f", {s['power_on_s']:.1f} с после включения" if s.get('power_on_s') else ''))
+PY
+            return
+        fi
+        sleep 0.2
+    done
+    echo "⚠️ За ${BOOT_WAIT} с не все процессы сообщили о готовности (см. /tmp/voice.log)"
+}
+boot_summary &
+
+# 8. ЗАПУСК МЕДИА-ПЛЕЕРА (ГЛАВНЫЙ ПРОЦЕСС)
 # Запускаем без nohup, чтобы видеть вывод в консоли, если запускаем вручную.
 # Если запускаете автоматически, он удержит сессию активной.
 echo "🎬 Запуск медиа-плеера..."
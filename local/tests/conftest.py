@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули Куба импортируются друг другом по имени, как при запуске из папки local
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
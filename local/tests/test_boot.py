@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import boot
+from boot import BOOT_T0_ENV, BootTimer
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = [100.0]
+    monkeypatch.setattr(boot.time, 'time', lambda: clock[0])
+    monkeypatch.setattr(boot, 'READY_DIR', str(tmp_path))
+    monkeypatch.setenv(BOOT_T0_ENV, '90')
+    return clock
+
+
+def test_phases_and_marks_count_from_start_sh(clock):
+    timer = BootTimer('media')
+    with timer.phase('cache'):
+        clock[0] += 2
+    timer.mark('socket')
+    clock[0] += 1
+    timer.mark('socket')  # Считается первое значение
+    assert timer.phases == {'cache': [10.0, 12.0]}
+    assert timer.marks == {'socket': 12.0}
+    assert timer.durations() == {'cache': 2.0}
+
+
+def test_failed_phase_is_still_recorded(clock):
+    timer = BootTimer('media')
+    with pytest.raises(RuntimeError):
+        with timer.phase('mpv'):
+            clock[0] += 1
+            raise RuntimeError('нет mpv')
+    assert timer.phases['mpv'] == [10.0, 11.0]
+
+
+def test_parallel_runs_every_step_even_if_one_fails(clock):
+    timer = BootTimer('voice')
+    done = []
+
+    def broken():
+        raise OSError('нет микрофона')
+
+    timer.parallel(model=lambda: done.append('model'), mic=broken)
+    assert done == ['model']
+    assert set(timer.phases) == {'model', 'mic'}
+
+
+def test_ready_writes_summary_for_start_sh(clock, tmp_path):
+    timer = BootTimer('voice')
+    clock[0] += 3
+    timer.ready()
+    with open(tmp_path / 'golo-voice.ready') as f:
+        summary = json.load(f)
+    assert summary['name'] == 'voice'
+    assert summary['marks'] == {'ready': 13.0}
+
+
+def test_without_env_counts_from_process_start(clock, monkeypatch):
+    monkeypatch.delenv(BOOT_T0_ENV)
+    timer = BootTimer('media')
+    assert timer.now() == 0
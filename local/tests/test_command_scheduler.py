@@ -0,0 +1,80 @@
+from command_scheduler import CommandScheduler
+
+
+def drain(scheduler):
+    commands = []
+    while True:
+        command = scheduler.get(timeout=0)
+        if command is None:
+            return commands
+        commands.append(command)
+
+
+def static(number):
+    return {"type": "static_image", "image_number": number}
+
+
+def volume(action):
+    return {"type": "volume", "action": action}
+
+
+def test_only_last_play_command_runs():
+    scheduler = CommandScheduler()
+    for number in ('1', '2', '3'):
+        assert scheduler.put(static(number))
+    assert drain(scheduler) == [static('3')]
+    assert scheduler.stats()['superseded_play'] == 2
+
+
+def test_volume_steps_merge_into_one_adjustment():
+    scheduler = CommandScheduler()
+    for action in ('up', 'up', 'down', 'up', 'mute', 'mute', 'mute'):
+        scheduler.put(volume(action))
+    assert drain(scheduler) == [{"type": "volume", "action": "adjust", "set": None, "steps": 2,
+                                 "toggle_mute": 1}]
+    assert scheduler.stats()['coalesced_volume'] == 6
+
+
+def test_max_resets_earlier_volume_steps():
+    scheduler = CommandScheduler()
+    for action in ('down', 'mute', 'max', 'up'):
+        scheduler.put(volume(action))
+    [command] = drain(scheduler)
+    assert (command['set'], command['steps'], command['toggle_mute']) == ('max', 1, 0)
+
+
+def test_merged_volume_keeps_last_trace():
+    scheduler = CommandScheduler()
+    scheduler.put(dict(volume('up'), _trace='first'))
+    scheduler.put(dict(volume('up'), _trace='last'))
+    [command] = drain(scheduler)
+    assert command['_trace'] == 'last'
+
+
+def test_stop_preempts_pending_commands():
+    scheduler = CommandScheduler()
+    scheduler.put(static('1'))
+    scheduler.put(volume('up'))
+    scheduler.put({"type": "lighting"})
+    scheduler.put({"type": "stop"})
+    scheduler.put(static('2'))
+    assert drain(scheduler) == [{"type": "stop"}, static('2')]
+    assert scheduler.stats()['preempted_by_stop'] == 3
+
+
+def test_priority_order():
+    scheduler = CommandScheduler()
+    scheduler.put({"type": "lighting"})
+    scheduler.put(static('1'))
+    scheduler.put(volume('down'))
+    assert [command['type'] for command in drain(scheduler)] == ['volume', 'static_image', 'lighting']
+
+
+def test_full_queue_drops_new_commands():
+    scheduler = CommandScheduler(max_pending=2)
+    assert scheduler.put({"type": "a"})
+    assert scheduler.put({"type": "b"})
+    assert not scheduler.put({"type": "c"})
+    assert not scheduler.put(static('1'))
+    assert scheduler.put({"type": "stop"})
+    assert scheduler.stats()['dropped_full'] == 2
@@ -0,0 +1,110 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from cube_ipc import (IpcClient, IpcServer, make_static, make_stop, make_volume,
+                      validate_command)
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    # Длина пути unix-сокета ограничена, tmp_path pytest бывает слишком длинным
+    path = f'/tmp/golo-test-{os.getpid()}-{id(tmp_path)}.sock'
+    yield path
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@pytest.fixture
+def server(socket_path):
+    received = []
+
+    def handler(cmd):
+        received.append(cmd)
+        return 'ok'
+
+    server = IpcServer(handler, path=socket_path)
+    server.start()
+    server.received = received
+    yield server
+    server.sock.close()
+
+
+def test_validate_command_accepts_schema():
+    assert validate_command(make_static(2, "on")) == make_static(2, "on")
+    assert validate_command(make_volume('up'))['action'] == 'up'
+    assert validate_command(make_stop()) == {"type": "stop"}
+
+
+@pytest.mark.parametrize('cmd', [
+    None,
+    {"type": "static_image", "image_number": "9"},
+    {"type": "volume", "action": "louder"},
+    {"type": "reboot"},
+])
+def test_validate_command_rejects_bad_commands(cmd):
+    with pytest.raises(ValueError):
+        validate_command(cmd)
+
+
+def test_client_gets_ack_from_server(server, socket_path):
+    client = IpcClient(path=socket_path)
+    try:
+        first = client.send(make_static(1))
+        second = client.send(make_volume('mute'))
+    finally:
+        client.close()
+    assert first == {"id": 1, "status": "ok"}
+    assert second == {"id": 2, "status": "ok"}
+    assert server.received == [make_static(1), make_volume('mute')]
+
+
+def test_server_reports_invalid_command(server, socket_path):
+    client = IpcClient(path=socket_path)
+    try:
+        client._connect()
+        client.sock.sendall(b'{"id": 7, "cmd": {"type": "reboot"}}\n')
+        reply = client.rfile.readline()
+    finally:
+        client.close()
+    assert b'"status": "error"' in reply
+    assert b'"id": 7' in reply
+    assert server.received == []
+
+
+def test_client_returns_none_without_server(socket_path):
+    client = IpcClient(path=socket_path, retries=2, backoff=0)
+    assert client.send(make_stop()) is None
+
+
+def test_client_rejects_invalid_command_before_sending(socket_path):
+    client = IpcClient(path=socket_path)
+    with pytest.raises(ValueError):
+        client.send({"type": "reboot"})
+    assert client.sock is None
+
+
+def test_sent_command_without_reply_is_not_retried(socket_path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+    lines = []
+
+    def silent_peer():
+        conn, _ = listener.accept()
+        with conn, conn.makefile('rb') as rfile:
+            lines.extend(rfile)
+
+    peer = threading.Thread(target=silent_peer, daemon=True)
+    peer.start()
+    client = IpcClient(path=socket_path, timeout=0.1, retries=3, backoff=0)
+    try:
+        reply = client.send(make_stop())
+    finally:
+        client.close()
+        peer.join(1)
+        listener.close()
+    assert reply['status'] == 'no_reply'
+    assert len(lines) == 1
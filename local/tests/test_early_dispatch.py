@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+pytest.importorskip('vosk')
+pytest.importorskip('pyaudio')
+pytest.importorskip('rapidfuzz')
+import voise_intension_vosk as assistant_module
+from voise_intension_vosk import InfoAssistant, MicStream
+
+
+class Analyzer:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def analyze(self, text):
+        intent, score = self.scores.get(text, (None, 0))
+        return {"intent": intent, "score": score} if intent else None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(assistant_module.time, 'time', lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def assistant(monkeypatch, clock):
+    monkeypatch.setattr(assistant_module, 'EARLY_DISPATCH', True)
+    assistant = InfoAssistant.__new__(InfoAssistant)
+    assistant.executed = []
+    assistant.intents = {"stop": {"func": lambda: assistant.executed.append("stop")},
+                         "play": {"func": lambda: assistant.executed.append("play")}}
+    assistant.analyzer = Analyzer({"стоп": ("stop", 95), "включи": ("play", 70)})
+    assistant.listen_until = 1005.0
+    assistant.latency_stats = {}
+    assistant.exec_lock = threading.Lock()
+    assistant.last_fired = {}
+    assistant.deduplicated = 0
+    assistant.trace = None
+    return assistant
+
+
+@pytest.fixture
+def mic():
+    return MicStream('mic0')
+
+
+def feed_partials(assistant, stream, *texts):
+    for text in texts:
+        assistant._on_partial(stream, text)
+
+
+def test_stable_partial_fires_once_and_final_is_skipped(assistant, mic):
+    feed_partials(assistant, mic, 'стоп', 'стоп', 'стоп', 'стоп')
+    assert assistant.executed == ['stop']
+    assistant._on_final(mic, 'стоп')
+    assert assistant.executed == ['stop']
+    assert assistant.latency_stats['partial'][0] == 1
+
+
+def test_changing_partial_does_not_fire(assistant, mic):
+    feed_partials(assistant, mic, 'с', 'стоп', 'с', 'стоп')
+    assert assistant.executed == []
+
+
+def test_weak_partial_waits_for_final(assistant, mic):
+    feed_partials(assistant, mic, 'включи', 'включи', 'включи')
+    assert assistant.executed == []
+    assistant._on_final(mic, 'включи')
+    assert assistant.executed == ['play']
+    assert 'final' in assistant.latency_stats
+
+
+def test_disabled_early_dispatch_only_uses_final(assistant, mic, monkeypatch):
+    monkeypatch.setattr(assistant_module, 'EARLY_DISPATCH', False)
+    feed_partials(assistant, mic, 'стоп', 'стоп', 'стоп')
+    assert assistant.executed == []
+    assistant._on_final(mic, 'стоп')
+    assert assistant.executed == ['stop']
+
+
+def test_next_utterance_can_fire_again(assistant, mic, clock):
+    feed_partials(assistant, mic, 'стоп', 'стоп', 'стоп')
+    assistant._on_final(mic, 'стоп')
+    clock[0] += 2
+    feed_partials(assistant, mic, 'стоп', 'стоп', 'стоп')
+    assert assistant.executed == ['stop', 'stop']
+
+
+def test_same_phrase_from_two_mics_runs_once(assistant, mic):
+    other = MicStream('mic1')
+    assistant._on_final(mic, 'включи')
+    assistant._on_final(other, 'включи')
+    assert assistant.executed == ['play']
+    assert assistant.deduplicated == 1
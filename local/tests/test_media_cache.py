@@ -0,0 +1,110 @@
+import hashlib
+import os
+
+import pytest
+
+from media_cache import MediaCache, RangeMismatch
+
+DATA = bytes(range(256)) * 40
+HASH = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=10)
+    cache.protect([])
+    return cache
+
+
+def test_chunks_assemble_into_cached_file(cache):
+    assert cache.write_chunk(HASH, 'jpg', 0, DATA[:4000], len(DATA)) == 4000
+    assert cache.have([HASH]) == {"have": [], "partial": {HASH: 4000}}
+    assert cache.write_chunk(HASH, 'jpg', 4000, DATA[4000:], len(DATA)) == len(DATA)
+    path = cache.lookup(HASH)
+    assert path.endswith(f"{HASH}.jpg")
+    with open(path, 'rb') as f:
+        assert f.read() == DATA
+    assert cache.have([HASH]) == {"have": [HASH], "partial": {}}
+
+
+def test_resume_after_restart_continues_from_partial(cache, tmp_path):
+    cache.write_chunk(HASH, 'jpg', 0, DATA[:1000], len(DATA))
+    reopened = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=10)
+    assert reopened.have([HASH])['partial'] == {HASH: 1000}
+    assert reopened.write_chunk(HASH, 'jpg', 1000, DATA[1000:], len(DATA)) == len(DATA)
+
+
+def test_chunk_from_wrong_offset_reports_received(cache):
+    cache.write_chunk(HASH, 'jpg', 0, DATA[:1000], len(DATA))
+    with pytest.raises(RangeMismatch) as err:
+        cache.write_chunk(HASH, 'jpg', 500, DATA[500:1500], len(DATA))
+    assert err.value.received == 1000
+    with pytest.raises(RangeMismatch) as err:
+        cache.write_chunk(HASH, 'jpg', 2000, DATA[2000:], len(DATA))
+    assert err.value.received == 1000
+
+
+def test_already_cached_hash_needs_no_chunks(cache):
+    cache.write_chunk(HASH, 'jpg', 0, DATA, len(DATA))
+    assert cache.write_chunk(HASH, 'jpg', 0, b'', len(DATA)) == len(DATA)
+
+
+def test_wrong_bytes_are_discarded(cache):
+    bad = b'x' * len(DATA)
+    with pytest.raises(ValueError):
+        cache.write_chunk(HASH, 'jpg', 0, bad, len(DATA))
+    assert cache.have([HASH]) == {"have": [], "partial": {}}
+
+
+def test_chunk_past_total_is_rejected(cache):
+    with pytest.raises(ValueError):
+        cache.write_chunk(HASH, 'jpg', 0, DATA + b'!', len(DATA))
+    assert cache.have([HASH])['partial'] == {}
+
+
+@pytest.mark.parametrize("h, ext", [("../" + HASH[3:], 'jpg'), (HASH, 'j/pg'), (HASH.upper(), 'jpg')])
+def test_bad_hash_or_extension(cache, h, ext):
+    with pytest.raises(ValueError):
+        cache.write_chunk(h, ext, 0, DATA, len(DATA))
+
+
+def blob(n):
+    data = bytes([n]) * 100
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def test_least_recently_played_file_is_evicted(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=2)
+    cache.protect([])
+    (h1, d1), (h2, d2), (h3, d3) = blob(1), blob(2), blob(3)
+    for h, data in ((h1, d1), (h2, d2)):
+        cache.write_chunk(h, 'jpg', 0, data, len(data))
+    assert cache.lookup(h1)  # h1 сыгран недавно, старейший теперь h2
+    cache.write_chunk(h3, 'jpg', 0, d3, len(d3))
+    assert cache.have([h1, h2, h3])['have'] == [h1, h3]
+    assert not os.path.exists(os.path.join(str(tmp_path), f"{h2}.jpg"))
+
+
+def test_protected_file_is_not_evicted(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=2)
+    (h1, d1), (h2, d2), (h3, d3) = blob(1), blob(2), blob(3)
+    cache.protect([h1])
+    for h, data in ((h1, d1), (h2, d2), (h3, d3)):
+        cache.write_chunk(h, 'jpg', 0, data, len(data))
+    assert cache.have([h1, h2, h3])['have'] == [h1, h3]
+
+
+def test_quota_waits_for_schedule_after_restart(tmp_path):
+    cache = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=10)
+    cache.protect([])
+    blobs = [blob(n) for n in range(3)]
+    for h, data in blobs:
+        cache.write_chunk(h, 'jpg', 0, data, len(data))
+    hashes = [h for h, _ in blobs]
+
+    # После перезапуска с меньшей квотой файлы расписания не должны пропасть до protect()
+    reopened = MediaCache(str(tmp_path), max_bytes=1 << 20, max_files=1)
+    assert sorted(reopened.have(hashes)['have']) == sorted(hashes)
+    reopened.protect([hashes[0]])
+    assert hashes[0] in reopened.have(hashes)['have']
+    assert len(reopened.have(hashes)['have']) == 2
@@ -0,0 +1,27 @@
+import mpv_player
+from mpv_player import MpvPlayer
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        return self
+
+
+def test_spawn_kills_stale_mpv_by_socket(monkeypatch, tmp_path):
+    run, popen = Recorder(), Recorder()
+    monkeypatch.setattr(mpv_player.subprocess, 'run', run)
+    monkeypatch.setattr(mpv_player.subprocess, 'Popen', popen)
+    socket_path = str(tmp_path / 'mpv.sock')
+    open(socket_path, 'w').close()
+
+    MpvPlayer(socket_path=socket_path)._spawn()
+    assert run.calls == [['pkill', '-f', '--', f'--input-ipc-server={socket_path}']]
+    assert f'--input-ipc-server={socket_path}' in popen.calls[0]
+    assert '--prefetch-playlist=yes' in popen.calls[0]
+    # Сокет от мёртвого mpv убран до запуска нового
+    assert not (tmp_path / 'mpv.sock').exists()
+
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import pytest
+
+import volume_control
+from volume_control import VolumeControl, VOLUME_STEP, RAMP_TIME
+
+
+class Pulse:
+    """PulseAudio-клиент для проверки логики громкости: запоминает вызовы."""
+
+    def __init__(self, *volumes):
+        self.sinks = [SimpleNamespace(index=i, volume=SimpleNamespace(value_flat=v), mute=False)
+                      for i, v in enumerate(volumes)]
+        self.set_calls = []
+        self.mute_calls = []
+
+    def sink_list(self):
+        return self.sinks
+
+    def volume_set_all_chans(self, sink, volume):
+        self.set_calls.append((sink.index, round(volume, 3)))
+
+    def mute(self, sink, mute):
+        self.mute_calls.append((sink.index, mute))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(volume_control.time, 'time', lambda: clock.now)
+    return clock
+
+
+@pytest.fixture
+def control(clock):
+    control = VolumeControl()
+    control.pulse = Pulse(0.5, 0.2)
+    control._refresh_sinks()
+    return control
+
+
+def volumes(control):
+    return [round(info["volume"], 3) for _, info in sorted(control.sinks.items())]
+
+
+def test_ramp_reaches_target_in_ramp_time(control, clock):
+    control._apply_request(None, 2, False)
+    control._ramp_tick()
+    assert volumes(control) == [0.5, 0.2]
+    clock.now += RAMP_TIME / 2
+    control._ramp_tick()
+    assert volumes(control) == [0.6, 0.3]
+    clock.now += RAMP_TIME
+    control._ramp_tick()
+    assert volumes(control) == [0.5 + 2 * VOLUME_STEP, 0.2 + 2 * VOLUME_STEP]
+    assert control.targets == {}
+
+
+def test_steps_during_ramp_add_to_pending_target(control, clock):
+    control._apply_request(None, 1, False)
+    clock.now += RAMP_TIME / 2
+    control._ramp_tick()
+    control._apply_request(None, 1, False)
+    assert [round(target, 3) for _, target, _ in control.targets.values()] == [0.7, 0.4]
+
+
+def test_volume_is_clamped(control, clock):
+    control._apply_request(None, -10, False)
+    clock.now += RAMP_TIME
+    control._ramp_tick()
+    assert volumes(control) == [0.0, 0.0]
+
+
+def test_max_unmutes_and_goes_to_full(control, clock):
+    control.sinks[0]["mute"] = True
+    control._apply_request('max', 0, False)
+    assert control.pulse.mute_calls == [(0, False)]
+    clock.now += RAMP_TIME
+    control._ramp_tick()
+    assert volumes(control) == [1.0, 1.0]
+
+
+def test_mute_toggles_without_ramp(control):
+    control._apply_request(None, 0, True)
+    assert control.pulse.mute_calls == [(0, True), (1, True)]
+    assert control.targets == {}
+    control._apply_request(None, 0, True)
+    assert control.pulse.mute_calls[2:] == [(0, False), (1, False)]
+
+
+def test_refresh_keeps_own_volume_while_ramping(control, clock):
+    control._apply_request(None, 1, False)
+    clock.now += RAMP_TIME / 2
+    control._ramp_tick()
+    control.pulse.sinks[0].volume.value_flat = 0.9
+    control._refresh_sinks()
+    assert volumes(control) == [0.55, 0.25]
+
+
+def test_vanished_sink_drops_its_ramp(control):
+    control._apply_request(None, 1, False)
+    del control.pulse.sinks[1]
+    control._refresh_sinks()
+    assert list(control.targets) == [0]
@@ -4,66 +4,197 @@ import json
 import os
 import sys
 import time
-import queue
-import random
+import threading
 import requests
-import pyaudio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from vosk import Model, KaldiRecognizer
-from typing import Dict, Optional
+from typing import Dict
 
 try:
-    from rapidfuzz import process, fuzz
+    from rapidfuzz import fuzz
 except ImportError:
     print("Ошибка: pip install rapidfuzz")
     sys.exit(1)
 
+try:
+    from command_analyzer import CommandAnalyzer
+    from audio_capture import VadGate, open_sources
+    from cube_ipc import IpcClient, make_static, make_volume
+    from tracing import Trace
+    from boot import BootTimer
+except ImportError as e:
+    print(f"Ошибка: не найден модуль рядом со скриптом ({e}), запускайте из папки local")
+    sys.exit(1)
+
 MEDIA_PLAYER_URL = "http://127.0.0.1:5000/webhook"
 current_dir = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(current_dir, "model")
 QUOTES_RU = ["Риск — дело благородное.", "Успех — это путь от неудачи к неудаче."]
 FACTS_RUSSIAN = ["Москва основана в 1147 году.", "Байкал — самое глубокое озеро."]
 
-class CommandAnalyzer:
-    def __init__(self, intents_map: dict, threshold=70):
-        self.intents_map = intents_map
-        self.threshold = threshold
-        self.corpus = []
-        for intent_key, data in self.intents_map.items():
-            for phrase in data['phrases']:
-                self.corpus.append({'phrase': phrase, 'intent': intent_key})
-
-    def analyze(self, text: str) -> Optional[dict]:
-        if not text: return None
-        results = []
-        for item in self.corpus:
-            score = fuzz.WRatio(text, item['phrase'])
-            results.append({'intent': item['intent'], 'score': score})
-        
-        results.sort(key=lambda x: x['score'], reverse=True)
-        if results and results[0]['score'] >= self.threshold:
-            return results[0]
-        return None
+# Слова, которые слушает распознаватель в режиме ожидания
+WAKE_WORDS = ["юхин"]
+USE_GRAMMAR = True  # False — один открытый словарь, как раньше
+
+# Ранний запуск команды по частичному результату, не дожидаясь тишины после фразы
+EARLY_DISPATCH = False
+PARTIAL_STABLE_CHUNKS = 2  # Сколько кусков подряд частичный текст не меняется
+EARLY_THRESHOLD = 80       # Порог совпадения для раннего запуска (строже обычного)
+
+# Захват звука в отдельном потоке и отсев тишины до Vosk
+FRAME_MS = 30              # Кадр захвата/VAD (10/20/30 мс подходят и для webrtcvad)
+CHUNK_BYTES = 8000         # ~250 мс PCM 16 кГц на один вызов AcceptWaveform
+CAPTURE_BUFFER_SEC = 5.0   # Ёмкость кольцевого буфера
+USE_VAD = True
+VAD_PREROLL_MS = 300       # Сколько звука до начала речи отдать вместе с ней
+VAD_HANGOVER_MS = 600      # Сколько тишины после речи ждать до конца фразы
+
+# Несколько микрофонов в одном процессе: модель одна, распознаватели у каждого свои
+MIC_SOURCES = os.environ.get('GOLO_MICS', '')  # "0,2" — индексы PyAudio, "wav:/путь" — файл; пусто — микрофон по умолчанию
+VOSK_WORKERS = int(os.environ.get('GOLO_VOSK_WORKERS', '0'))  # 0 — по числу ядер, но не больше микрофонов
+DEDUP_WINDOW_SEC = 1.5     # Одна фраза, услышанная разными микрофонами, — одна команда
+
+boot = BootTimer('voice')
+
+
+class MicStream:
+    """Один источник звука: свой VAD, своя пачка PCM и свои распознаватели.
+
+    Распознаватели создаются на общей модели, когда она загрузится. Куски
+    звука ждут в jobs и обрабатываются пулом строго по очереди: один поток
+    за раз, поэтому KaldiRecognizer не делится между потоками.
+    """
+
+    def __init__(self, name, source=None):
+        self.name = name
+        self.source = source
+        self.wake_recognizer = None
+        self.command_recognizer = None
+        self.recognizer = None
+        self.jobs = deque()       # ('chunk', pcm) / ('end', None)
+        self.scheduled = False    # кусок этого потока уже стоит в пуле
+        self.lock = threading.Lock()
+        self.counters = {"chunks": 0, "utterances": 0, "backlog_max": 0, "busy_s": 0.0}
+        self.reset()
+
+    def reset(self):
+        """Новая запись: пустая пачка, свежий VAD, нет частичного текста."""
+        self.gate = VadGate(rate=16000, frame_ms=FRAME_MS, preroll_ms=VAD_PREROLL_MS,
+                            hangover_ms=VAD_HANGOVER_MS) if USE_VAD else None
+        self.batch = bytearray()
+        # Состояние частичных результатов текущей фразы
+        self.partial_text = ''
+        self.partial_stable = 0
+        self.partial_changed_at = None
+        self.early_fired = None   # интент, уже выполненный по частичному результату
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "busy_s": round(self.counters["busy_s"], 3), "backlog": len(self.jobs)}
+
 
 class InfoAssistant:
-    def __init__(self):
+    def __init__(self, sources=None):
         self.running = True
         self.intents = self._setup_intents()
         self.analyzer = CommandAnalyzer(self.intents, threshold=65)
-        self.listen_until = 0.0  # Время, до которого ассистент слушает команды
+        self.listen_until = 0.0  # Время, до которого ассистент слушает команды (общее для всех микрофонов)
+        self.latency_stats = {}   # режим -> (число команд, сумма мс)
+        if sources is None:
+            sources = open_sources(MIC_SOURCES, rate=16000, frame_ms=FRAME_MS, buffer_seconds=CAPTURE_BUFFER_SEC)
+        self.streams = [MicStream(source.name, source) for source in sources]
+        self.streams_lock = threading.Lock()
+        self.pool = None
+        self.workers = 0
+        self.idle = threading.Condition()
+        self.pending_jobs = 0
+        # Выполнение интентов — по одному; last_fired гасит повтор с соседнего микрофона
+        self.exec_lock = threading.Lock()
+        self.last_fired = {}      # интент -> (поток, конец речи)
+        self.deduplicated = 0
+        self.media_ipc = IpcClient()  # постоянное соединение с media_choose.py
+        self.trace = None             # трасса выполняемого сейчас интента
         
         if not os.path.exists(MODEL_PATH):
-            print(f"❌ ОШИБКА: Нет папки model")
+            print("❌ ОШИБКА: Нет папки model")
             sys.exit(1)
-            
+
+        # Модель грузится в фоне, пока run() открывает микрофон; дождаться — wait_model()
+        self.model_ready = threading.Event()
+        self.model_error = None
+        threading.Thread(target=self._load_model, name="vosk-model", daemon=True).start()
+
+    def _load_model(self):
         print("⏳ Загрузка модели...")
-        try:
-            self.model = Model(MODEL_PATH)
-            self.recognizer = KaldiRecognizer(self.model, 16000)
-        except Exception as e:
-            print(f"❌ Ошибка модели: {e}")
+        with boot.phase('model'):
+            try:
+                self.model = Model(MODEL_PATH)
+                # Два распознавателя на поток: крошечная грамматика для имени
+                # и грамматика из фраз интентов для окна команд
+                self.wake_grammar = self._make_grammar(WAKE_WORDS, "имя")
+                self.command_grammar = self._make_grammar(
+                    WAKE_WORDS + [p for data in self.intents.values() for p in data['phrases']], "команды"
+                )
+                with self.streams_lock:
+                    for stream in self.streams:
+                        self._attach(stream)
+                    self.model_ready.set()
+            except Exception as e:
+                self.model_error = e
+                self.model_ready.set()
+
+    def wait_model(self):
+        self.model_ready.wait()
+        if self.model_error:
+            print(f"❌ Ошибка модели: {self.model_error}")
             sys.exit(1)
         print("✅ Готов к работе.")
 
+    def _attach(self, stream):
+        stream.wake_recognizer = self._make_recognizer(self.wake_grammar)
+        stream.command_recognizer = self._make_recognizer(self.command_grammar)
+        stream.recognizer = stream.wake_recognizer
+
+    def add_stream(self, name, source=None):
+        """Ещё один поток звука на той же модели (бенчмарк, подключённый позже микрофон)."""
+        stream = MicStream(name, source)
+        with self.streams_lock:
+            if self.model_ready.is_set() and not self.model_error:
+                self._attach(stream)
+            self.streams.append(stream)
+        return stream
+
+    def _make_recognizer(self, grammar):
+        if grammar is None:
+            return KaldiRecognizer(self.model, 16000)
+        return KaldiRecognizer(self.model, 16000, grammar)
+
+    def _make_grammar(self, phrases, label):
+        """Грамматика из phrases + [unk] для KaldiRecognizer или None (открытый словарь)."""
+        if not USE_GRAMMAR:
+            return None
+        find_word = getattr(self.model, 'find_word', None)  # есть в vosk >= 0.3.31
+        known = []
+        for phrase in dict.fromkeys(phrases):
+            missing = [w for w in phrase.split() if find_word and find_word(w) < 0]
+            if missing:
+                print(f"⚠️ Грамматика ({label}): нет в словаре модели {missing}, фраза '{phrase}' пропущена")
+            else:
+                known.append(phrase)
+        if not known:
+            print(f"⚠️ Грамматика ({label}) пуста, используем открытый словарь")
+            return None
+        print(f"📖 Грамматика ({label}): {len(known)} фраз")
+        return json.dumps(known + ["[unk]"], ensure_ascii=False)
+
+    def _switch_recognizer(self, stream, active):
+        """Меняет распознаватель потока при смене режима без перезагрузки модели."""
+        target = stream.command_recognizer if active else stream.wake_recognizer
+        if target is not stream.recognizer:
+            target.Reset()
+            stream.recognizer = target
+
     def _setup_intents(self) -> Dict:
         return {
             # === МЕДИА 1 ===
@@ -129,17 +260,25 @@ class InfoAssistant:
             },
         }
     
-    def cmd_send_media(self, img="1", mus="off"):
-        payload = {"type": "static_image", "image_number": img, "music_data": mus}
+    def send_command(self, payload):
+        """Unix-сокет с подтверждением; если медиа-плеер его не слушает — старый HTTP."""
+        if self.trace:
+            payload.update(self.trace.fields())
+        reply = self.media_ipc.send(payload)
+        if reply is not None:
+            if reply.get('status') != 'ok':
+                print(f"⚠️ Медиа-плеер не принял команду: {reply.get('error', reply.get('status'))}")
+            return
         try: requests.post(MEDIA_PLAYER_URL, json=payload, timeout=0.1)
         except: pass
+
+    def cmd_send_media(self, img="1", mus="off"):
+        self.send_command(make_static(img, mus))
         return True
 
     def cmd_volume(self, action):
         print(f"🔊 ГРОМКОСТЬ: {action}")
-        payload = {"type": "volume", "action": action}
-        try: requests.post(MEDIA_PLAYER_URL, json=payload, timeout=0.1)
-        except: pass
+        self.send_command(make_volume(action))
         return True
 
     def cmd_stop(self):
@@ -147,47 +286,246 @@ class InfoAssistant:
         return True
 
     def run(self):
-        p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True, frames_per_buffer=4000)
-        stream.start_stream()
+        # Микрофоны открываются, пока грузится модель; услышанное за это время ждёт в кольцах
+        with boot.phase('mic'):
+            for stream in self.streams:
+                stream.source.start()
+        self.wait_model()
+        self.start_pool()
+        boot.ready()
         print("\n💤 РЕЖИМ ОЖИДАНИЯ. Скажите 'ЮХИН', чтобы активировать...")
+        if len(self.streams) > 1:
+            print(f"🎙️ Микрофонов: {len(self.streams)} ({', '.join(s.name for s in self.streams)}), "
+                  f"потоков распознавания: {self.workers}")
+        if EARLY_DISPATCH:
+            print(f"⚡ Ранний запуск: команда выполняется после {PARTIAL_STABLE_CHUNKS} стабильных кусков")
+        if USE_VAD:
+            print(f"🔇 VAD: {'webrtcvad' if self.streams[0].gate.vad else 'по энергии'}, тишина в распознаватель не идёт")
+
+        readers = [threading.Thread(target=self._read_loop, args=(stream,), name=f"read-{stream.name}", daemon=True)
+                   for stream in self.streams]
+        for t in readers: t.start()
+        # Живые микрофоны не кончаются; файлы-источники — да, тогда и ассистент завершается
+        while self.running and any(t.is_alive() for t in readers):
+            time.sleep(0.5)
+        self.running = False
+        self.wait_idle()
+        self.pool.shutdown(wait=True)
+        for stream in self.streams:
+            stream.source.stop()
+        print(f"📊 Распознавание: {self.stats()}")
 
+    def stats(self):
+        return {"streams": {stream.name: stream.stats() for stream in self.streams},
+                "workers": self.workers, "deduplicated": self.deduplicated}
+
+    def _read_loop(self, stream):
+        """Кадры одного источника -> VAD и пачки здесь, распознавание в пуле."""
+        source = stream.source
+        last_report = source.stats()
         while self.running:
-            data = stream.read(4000, exception_on_overflow=False)
-            if self.recognizer.AcceptWaveform(data):
-                res = json.loads(self.recognizer.Result())
-                text = res.get('text', '')
-                
-                if not text:
-                    continue
-
-                current_time = time.time()
-                
-                # Проверяем, находимся ли мы в активном окне прослушивания
-                if current_time < self.listen_until:
-                    # ЛОГИКА СКОЛЬЗЯЩЕГО ОКНА:
-                    # Если мы услышали речь, мы продлеваем время прослушивания еще на 5 секунд
-                    self.listen_until = current_time + 5.0
-                    print(f"⏱️  Речь обнаружена. Таймер сброшен (+5 сек).")
-                    
-                    print(f"🟢 (Активен) Слышу: '{text}'")
-                    match = self.analyzer.analyze(text)
-                    if match:
-                        print(f"🚀 Выполняю: {match['intent']}")
-                        self.intents[match['intent']]['func']()
-                else:
-                    # Режим ожидания: Ищем только ключевое слово "Юхин"
-                    # fuzz.partial_ratio позволяет найти имя даже во фразе "Эй Юхин привет"
-                    wake_score = fuzz.partial_ratio("юхин", text.lower())
-                    if wake_score >= 50:
-                        self.listen_until = current_time + 5.0
-                        print(f"\n🔔 ЮХИН АКТИВИРОВАН! Слушаю команды 5 секунд...")
-                    else:
-                        print(f"💤 (Игнор) '{text}'")
+            frame = source.read(timeout=1.0)
+            if frame is None:
+                if getattr(source, 'finished', False):
+                    self.submit_end(stream)
+                    return
+                continue
+            self.submit(stream, frame)
+
+            stats = source.stats()
+            if stats["overflow"] != last_report["overflow"] or stats["input_overflow"] != last_report["input_overflow"]:
+                print(f"⚠️ Потеря звука ({stream.name}): кольцо {stats['overflow']}, "
+                      f"PortAudio {stats['input_overflow']} кадров")
+            last_report = stats
+
+    # --- ПУЛ РАСПОЗНАВАНИЯ ---
+    def start_pool(self, workers=None):
+        """Пул потоков для AcceptWaveform: Vosk отпускает GIL, так что микрофоны идут параллельно."""
+        self.workers = max(1, workers or VOSK_WORKERS or min(len(self.streams), os.cpu_count() or 1))
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vosk")
+        return self.pool
+
+    def submit(self, stream, frame):
+        """Кадр потока в пул; куски одного потока распознаются строго по порядку."""
+        self._enqueue(stream, self._cut(stream, frame))
+
+    def submit_end(self, stream):
+        """Источник кончился: дожать пачку и забрать финальный результат."""
+        self._enqueue(stream, self._cut_end(stream))
+
+    def _enqueue(self, stream, jobs):
+        if not jobs:
+            return
+        with self.idle:
+            self.pending_jobs += len(jobs)
+        with stream.lock:
+            stream.jobs.extend(jobs)
+            stream.counters["backlog_max"] = max(stream.counters["backlog_max"], len(stream.jobs))
+            if stream.scheduled:
+                return
+            stream.scheduled = True
+        self.pool.submit(self._drain, stream)
+
+    def _drain(self, stream):
+        # Один кусок за раз и обратно в конец очереди пула — соседние микрофоны не ждут
+        with stream.lock:
+            job = stream.jobs.popleft()
+        started = time.perf_counter()
+        try:
+            self._recognize(stream, job)
+        except Exception as e:
+            print(f"❌ Распознавание ({stream.name}): {e}")
+        with stream.lock:
+            stream.counters["busy_s"] += time.perf_counter() - started
+            again = bool(stream.jobs)
+            stream.scheduled = again
+        if again:
+            self.pool.submit(self._drain, stream)
+        with self.idle:
+            self.pending_jobs -= 1
+            if not self.pending_jobs:
+                self.idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Ждёт, пока пул разберёт все поставленные куски."""
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.pending_jobs, timeout)
+
+    # --- РАСПОЗНАВАНИЕ ОДНОГО ПОТОКА ---
+    def _cut(self, stream, frame):
+        """VAD и пачки: работы для распознавателя ('chunk', pcm) / ('end', None)."""
+        frames, ended = stream.gate.feed(frame) if stream.gate else ([frame], False)
+        for f in frames:
+            stream.batch += f
+        jobs = []
+        if len(stream.batch) >= CHUNK_BYTES or (ended and stream.batch):
+            jobs.append(('chunk', bytes(stream.batch)))
+            stream.batch.clear()
+        if ended:
+            jobs.append(('end', None))
+        return jobs
+
+    def _cut_end(self, stream):
+        jobs = [('chunk', bytes(stream.batch))] if stream.batch else []
+        stream.batch.clear()
+        return jobs + [('end', None)]
+
+    def _recognize(self, stream, job):
+        kind, data = job
+        if kind == 'chunk':
+            self.process_chunk(stream, data)
+        else:
+            self.finalize_utterance(stream)
+
+    def feed_frame(self, stream, frame):
+        """Кадр с микрофона (или из WAV в бенчмарке) без пула: VAD, пачка для Vosk, конец фразы."""
+        for job in self._cut(stream, frame):
+            self._recognize(stream, job)
+
+    def end_stream(self, stream):
+        """Конец записи без пула: остаток пачки и финальный результат."""
+        for job in self._cut_end(stream):
+            self._recognize(stream, job)
+
+    def finalize_utterance(self, stream):
+        """VAD увидел конец фразы: забираем финальный результат, не скармливая Vosk тишину."""
+        stream.counters["utterances"] += 1
+        res = json.loads(stream.recognizer.FinalResult())
+        self._on_final(stream, res.get('text', '').replace('[unk]', '').strip())
+
+    def process_chunk(self, stream, data):
+        """Один кусок PCM 16 кГц: финальный результат или (в раннем режиме) частичный."""
+        stream.counters["chunks"] += 1
+        active = time.time() < self.listen_until
+        self._switch_recognizer(stream, active)
+        if stream.recognizer.AcceptWaveform(data):
+            res = json.loads(stream.recognizer.Result())
+            self._on_final(stream, res.get('text', '').replace('[unk]', '').strip())
+        elif active:
+            # Частичный результат нужен и для замера задержки в обычном режиме
+            res = json.loads(stream.recognizer.PartialResult())
+            self._on_partial(stream, res.get('partial', '').replace('[unk]', '').strip())
+
+    def _on_partial(self, stream, text):
+        now = time.time()
+        if text != stream.partial_text:
+            # Появилось новое слово — считаем, что речь ещё идёт
+            stream.partial_text = text
+            stream.partial_stable = 0
+            stream.partial_changed_at = now
+            return
+        if not EARLY_DISPATCH or not text or stream.early_fired:
+            return
+        stream.partial_stable += 1
+        if stream.partial_stable < PARTIAL_STABLE_CHUNKS:
+            return
+        match = self.analyzer.analyze(text)
+        if match and match['score'] >= EARLY_THRESHOLD:
+            self.listen_until = now + 5.0
+            print(f"🟡 (Частично, {stream.name}) Слышу: '{text}'")
+            stream.early_fired = match['intent']
+            self._execute(match, 'partial', stream.partial_changed_at, stream)
+
+    def _on_final(self, stream, text):
+        # Конец речи — момент последнего нового слова в частичных результатах
+        speech_end = stream.partial_changed_at or time.time()
+        early_fired = stream.early_fired
+        stream.partial_text = ''
+        stream.partial_stable = 0
+        stream.partial_changed_at = None
+        stream.early_fired = None
+
+        if not text:
+            return
+
+        current_time = time.time()
         
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+        # Проверяем, находимся ли мы в активном окне прослушивания
+        if current_time < self.listen_until:
+            # ЛОГИКА СКОЛЬЗЯЩЕГО ОКНА:
+            # Если мы услышали речь, мы продлеваем время прослушивания еще на 5 секунд
+            self.listen_until = current_time + 5.0
+            print("⏱️  Речь обнаружена. Таймер сброшен (+5 сек).")
+            
+            print(f"🟢 (Активен, {stream.name}) Слышу: '{text}'")
+            match = self.analyzer.analyze(text)
+            if match:
+                if match['intent'] == early_fired:
+                    print(f"↩️  '{match['intent']}' уже выполнена по частичному результату")
+                else:
+                    self._execute(match, 'final', speech_end, stream)
+        else:
+            # Режим ожидания: Ищем только ключевое слово "Юхин"
+            # fuzz.partial_ratio позволяет найти имя даже во фразе "Эй Юхин привет"
+            wake_score = fuzz.partial_ratio("юхин", text.lower())
+            if wake_score >= 50:
+                self.listen_until = current_time + 5.0
+                print(f"\n🔔 ЮХИН АКТИВИРОВАН ({stream.name})! Слушаю команды 5 секунд...")
+            else:
+                print(f"💤 (Игнор, {stream.name}) '{text}'")
+
+    def _execute(self, match, mode, speech_end, stream):
+        with self.exec_lock:
+            # Та же фраза с другого микрофона: концы речи почти совпадают — не повторяем
+            last = self.last_fired.get(match['intent'])
+            if last and last[0] is not stream and abs(speech_end - last[1]) < DEDUP_WINDOW_SEC:
+                self.deduplicated += 1
+                print(f"🔁 '{match['intent']}' ({stream.name}) уже выполнена по микрофону {last[0].name}")
+                return
+            self.last_fired[match['intent']] = (stream, speech_end)
+            print(f"🚀 Выполняю: {match['intent']}")
+            # Трасса голосовой команды начинается с конца речи
+            self.trace = Trace('voice', t0=speech_end)
+            self.trace.mark('intent')
+            self.intents[match['intent']]['func']()
+            self.trace.mark('sent')
+            self.trace.log(f"{match['intent']}, ")
+            self.trace = None
+            latency_ms = (time.time() - speech_end) * 1000
+            count, total = self.latency_stats.get(mode, (0, 0.0))
+            self.latency_stats[mode] = (count + 1, total + latency_ms)
+            print(f"⏱️  {match['intent']}: {latency_ms:.0f} мс от конца речи "
+                  f"({mode}, среднее {(total + latency_ms) / (count + 1):.0f} мс за {count + 1})")
 
 if __name__ == "__main__":
     InfoAssistant().run()
\ No newline at end of file
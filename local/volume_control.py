@@ -0,0 +1,159 @@
+import time
+import queue
+import threading
+
+# --- БЛОК ИНИЦИАЛИЗАЦИИ ЗВУКА ---
+HAS_PULSE = False
+try:
+    import pulsectl
+    HAS_PULSE = True
+except ImportError:
+    HAS_PULSE = False
+    print("⚠️ ВНИМАНИЕ: Библиотека 'pulsectl' не найдена. Звук регулироваться не будет.")
+
+VOLUME_STEP = 0.1     # Один шаг "громче"/"тише"
+RAMP_TIME = 0.15      # Длительность плавного изменения (сек)
+RAMP_TICK = 0.015     # Шаг плавного изменения (сек)
+
+
+class VolumeControl:
+    """Одно постоянное соединение с PulseAudio и плавная громкость в своём потоке.
+
+    adjust() не блокирует: запрос уходит в очередь, а поток управления держит
+    кэш sink'ов, плавно ведёт громкость к цели и переподключается, если
+    PulseAudio перезапустился. Отдельное соединение слушает события 'sink' и
+    помечает кэш устаревшим, поэтому sink_list() не зовётся на каждую команду.
+    """
+
+    def __init__(self, client_name='golo-volume'):
+        self.client_name = client_name
+        self.requests = queue.Queue()
+        self.pulse = None
+        self.sinks = {}          # index -> {"sink": объект, "volume": 0..1, "mute": bool}
+        self.targets = {}        # index -> (откуда, куда, время начала)
+        self.cache_dirty = threading.Event()
+        self.running = False
+
+    def start(self):
+        if not HAS_PULSE or self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._control_loop, name="volume-control", daemon=True).start()
+        threading.Thread(target=self._event_loop, name="volume-events", daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+
+    def adjust(self, set_to=None, steps=0, toggle_mute=0):
+        """max, затем шаги по VOLUME_STEP, затем переключение mute. Не блокирует."""
+        if not HAS_PULSE: return
+        self.requests.put((set_to, int(steps or 0), bool(toggle_mute)))
+
+    # --- ПОТОК УПРАВЛЕНИЯ ---
+    def _connect(self):
+        backoff = 0.5
+        while self.running:
+            try:
+                self.pulse = pulsectl.Pulse(self.client_name)
+                self._refresh_sinks()
+                print(f"🔊 PulseAudio подключен, устройств вывода: {len(self.sinks)}")
+                return True
+            except Exception as e:
+                print(f"Audio Error: нет связи с PulseAudio ({e}), повтор через {backoff:.1f} c")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10)
+        return False
+
+    def _disconnect(self):
+        if self.pulse:
+            try:
+                self.pulse.close()
+            except Exception:
+                pass
+        self.pulse = None
+        self.sinks = {}
+        self.targets = {}
+
+    def _refresh_sinks(self):
+        self.cache_dirty.clear()
+        fresh = {}
+        for sink in self.pulse.sink_list():
+            old = self.sinks.get(sink.index)
+            # Во время плавного изменения наше значение точнее снимка сервера
+            volume = old["volume"] if old and sink.index in self.targets else sink.volume.value_flat
+            fresh[sink.index] = {"sink": sink, "volume": volume, "mute": bool(sink.mute)}
+        self.sinks = fresh
+        self.targets = {i: t for i, t in self.targets.items() if i in fresh}
+
+    def _control_loop(self):
+        while self.running:
+            if self.pulse is None and not self._connect():
+                return
+            try:
+                # Пока идёт плавное изменение — короткий тик, иначе ждём команду
+                timeout = RAMP_TICK if self.targets else 1.0
+                try:
+                    req = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    req = False
+                if req is None:
+                    break
+                # Наши же шаги громкости тоже шлют события — во время плавного изменения не обновляем
+                if self.cache_dirty.is_set() and (req or not self.targets):
+                    self._refresh_sinks()
+                if req:
+                    self._apply_request(*req)
+                self._ramp_tick()
+            except Exception as e:
+                print(f"Audio Error: {e}. Переподключаюсь...")
+                self._disconnect()
+        self._disconnect()
+
+    def _apply_request(self, set_to, steps, toggle_mute):
+        now = time.time()
+        for index, info in self.sinks.items():
+            # Новая цель считается от уже запрошенной, чтобы серия "громче" не терялась
+            current_target = self.targets[index][1] if index in self.targets else info["volume"]
+            target = 1.0 if set_to == 'max' else current_target
+            target = max(0.0, min(1.0, target + steps * VOLUME_STEP))
+            if set_to == 'max' and info["mute"]:
+                self.pulse.mute(info["sink"], False)
+                info["mute"] = False
+            if toggle_mute:
+                info["mute"] = not info["mute"]
+                self.pulse.mute(info["sink"], info["mute"])
+            if abs(target - info["volume"]) > 1e-3:
+                self.targets[index] = (info["volume"], target, now)
+
+    def _ramp_tick(self):
+        now = time.time()
+        for index in list(self.targets):
+            start_vol, target, started = self.targets[index]
+            info = self.sinks.get(index)
+            if info is None:
+                del self.targets[index]
+                continue
+            progress = min(1.0, (now - started) / RAMP_TIME)
+            volume = start_vol + (target - start_vol) * progress
+            self.pulse.volume_set_all_chans(info["sink"], volume)
+            info["volume"] = volume
+            if progress >= 1.0:
+                del self.targets[index]
+
+    # --- СОБЫТИЯ PULSEAUDIO ---
+    def _event_loop(self):
+        backoff = 0.5
+        while self.running:
+            try:
+                with pulsectl.Pulse(self.client_name + '-events') as events:
+                    backoff = 0.5
+                    events.event_mask_set('sink')
+                    events.event_callback_set(lambda ev: self.cache_dirty.set())
+                    while self.running:
+                        events.event_listen(timeout=1.0)
+            except Exception as e:
+                print(f"Audio Error: подписка на события PulseAudio ({e})")
+                self.cache_dirty.set()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10)
@@ -0,0 +1,136 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+
+EVICT_SCAN = 64  # Сколько самых давних бакетов смотреть в поисках полного, когда таблица заполнена
+
+
+class TokenBucket:
+    """rate жетонов в секунду, не больше burst про запас."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько секунд ждать жетона (0 — есть уже сейчас)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.wait_time(now) > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def refill_time(self, now):
+        """Сколько секунд до полного бакета."""
+        self._refill(now)
+        return max(0.0, (self.burst - self.tokens) / self.rate)
+
+
+class AdmissionControl:
+    """Допуск запросов /upload: кто и сколько может грузить прямо сейчас.
+
+    Три проверки, от дешёвой к дорогой:
+      * очередь доставки на Кубы (pending_getter) не больше max_pending —
+        иначе 503: сервер не успевает отдавать то, что уже принял;
+      * общий бакет на весь сервер — 503 при всплеске от всех сразу;
+      * бакет на пользователя — 429 тому, кто шлёт слишком часто, пока
+        остальные проходят без задержки. Бакетов не больше max_users;
+        забывается только полный (пользователь давно молчит), и если таких
+        нет — новый пользователь получает 503, а не сброс чужого лимита.
+    Отказ — это (статус, причина, retry_after в секундах). precheck()
+    смотрит только общее состояние и не тратит жетонов, поэтому его можно
+    звать до чтения тела запроса.
+    """
+
+    def __init__(self, user_rate, user_burst, global_rate, global_burst,
+                 max_pending, pending_getter, max_users=10000, overload_retry=5):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.max_pending = max_pending
+        self.pending_getter = pending_getter
+        self.max_users = max_users
+        self.overload_retry = overload_retry
+        self.lock = threading.RLock()
+        self.users = OrderedDict()  # ключ пользователя -> TokenBucket, от давних к недавним
+        self.counters = {"admitted": 0, "rejected_user": 0, "rejected_users": 0, "rejected_global": 0,
+                         "rejected_overload": 0}
+
+    def precheck(self):
+        """Отказ по общей нагрузке или None — без чтения тела и без трат жетонов."""
+        if self.pending_getter() >= self.max_pending:
+            return self._reject('overload', 503, self.overload_retry)
+        with self.lock:
+            wait = self.global_bucket.wait_time(time.monotonic())
+        if wait > 0:
+            return self._reject('global', 503, wait)
+        return None
+
+    def admit(self, user_key):
+        """Пропускает запрос (тратит жетоны) или возвращает отказ."""
+        rejection = self.precheck()
+        if rejection:
+            return rejection
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._user_bucket(user_key, now)
+            if bucket is None:
+                return self._reject('users', 503, self._users_wait(now))
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                return self._reject('user', 429, wait)
+            if not self.global_bucket.take(now):
+                return self._reject('global', 503, self.global_bucket.wait_time(now))
+            bucket.take(now)
+            self.counters["admitted"] += 1
+        return None
+
+    def _user_bucket(self, user_key, now):
+        """Бакет пользователя; None — таблица полна и забыть некого."""
+        bucket = self.users.get(user_key)
+        if bucket is None:
+            if len(self.users) >= self.max_users and not self._forget_idle(now):
+                return None
+            bucket = self.users[user_key] = TokenBucket(self.user_rate, self.user_burst)
+        self.users.move_to_end(user_key)
+        return bucket
+
+    def _forget_idle(self, now):
+        # Забыть можно только полный бакет: иначе новый ключ обнулил бы чужой лимит
+        for user_key in list(self.users)[:EVICT_SCAN]:
+            if self.users[user_key].full(now):
+                del self.users[user_key]
+                return True
+        return False
+
+    def _users_wait(self, now):
+        # Самый давний бакет обычно наполнится первым
+        oldest = next(iter(self.users.values()), None)
+        return oldest.refill_time(now) if oldest else 0
+
+    def _reject(self, reason, status, retry_after):
+        with self.lock:
+            self.counters[f"rejected_{reason}"] += 1
+        return status, reason, max(1, math.ceil(retry_after))
+
+    def stats(self):
+        pending = self.pending_getter()
+        with self.lock:
+            now = time.monotonic()
+            idle = sum(1 for bucket in self.users.values() if bucket.full(now))
+            return {**self.counters, "users_tracked": len(self.users), "users_idle": idle,
+                    "pending": pending, "max_pending": self.max_pending}
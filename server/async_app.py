@@ -0,0 +1,178 @@
+"""Async-режим сервера: те же роуты на aiohttp, без потока на запрос.
+
+    python3 async_app.py
+
+Медленная мобильная загрузка — это корутина, которая пишет тело в
+хранилище кусками по мере прихода; отправки на Куб идут через
+AsyncDeliveryOutbox на общем aiohttp-клиенте. Блокирующие шаги (индекс
+хранилища, журнал outbox, рендер) выполняются в ограниченном пуле потоков.
+
+/upload разобран здесь, но решения принимают те же функции flask_app.py,
+поэтому ответы совпадают с Flask. Остальные роуты (/, /admin/update_url,
+/admin/events, /metrics) исполняет сам Flask-код в пуле потоков.
+"""
+import os
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('GOLO_SERVER_MODE', 'async')
+
+from aiohttp import web
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import flask_app as core
+from blob_store import CHUNK_SIZE
+from async_outbox import set_server_loop
+from tracing import Trace, METRICS
+
+if core.SERVER_MODE != 'async':
+    raise RuntimeError("async_app.py нужен GOLO_SERVER_MODE=async")
+
+ASYNC_HOST = '0.0.0.0'
+ASYNC_PORT = int(os.environ.get('GOLO_PORT', 8000))
+MAX_ACTIVE_UPLOADS = 4000  # Сколько тел /upload принимается одновременно; остальные ждут
+BLOCKING_THREADS = 16      # Пул для блокирующих шагов (диск, индекс, Flask-роуты)
+
+upload_slots = asyncio.Semaphore(MAX_ACTIVE_UPLOADS)
+
+
+def run_blocking(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+
+
+def from_werkzeug(response):
+    headers = {k: v for k, v in response.headers.items() if k.lower() != 'content-length'}
+    return web.Response(body=response.get_data(), status=response.status_code, headers=headers)
+
+
+def json_response(body, status, headers=None):
+    # Тот же JSON, что отдаёт jsonify во Flask
+    response = core.app.json.response(body)
+    response.status_code = status
+    response.headers.update(headers or {})
+    return from_werkzeug(response)
+
+
+async def read_form(request):
+    """Поля формы и файл 'file', который пишется в хранилище по мере прихода.
+
+    Возвращает (поля, HashingFile или None, имя файла).
+    """
+    limit = core.app.config['MAX_CONTENT_LENGTH']
+    if limit and request.content_length and request.content_length > limit:
+        raise RequestEntityTooLarge()
+    form, incoming, file_name = {}, None, None
+    try:
+        if request.content_type == 'multipart/form-data':
+            received = 0
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename is None:
+                    value = await part.text()
+                    received += len(value)
+                    form.setdefault(part.name, value)
+                    continue
+                if part.name != 'file' or incoming is not None:
+                    continue  # Непрочитанную часть reader пропустит сам
+                incoming = core.blob_store.incoming_file()
+                file_name = part.filename
+                while True:
+                    chunk = await part.read_chunk(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if limit and received > limit:
+                        raise RequestEntityTooLarge()
+                    # Запись куска на локальный диск (в page cache) — не повод уходить из цикла
+                    incoming.write(chunk)
+        elif request.content_type == 'application/x-www-form-urlencoded':
+            try:
+                fields = await request.post()
+            except web.HTTPRequestEntityTooLarge:
+                raise RequestEntityTooLarge()
+            for key, value in fields.items():
+                form.setdefault(key, value)
+    except BaseException:
+        if incoming is not None:
+            incoming.close()
+        raise
+    return form, incoming, file_name
+
+
+async def upload(request):
+    METRICS.inc('requests', route='upload')
+    trace = Trace('upload')
+    # Отказ по нагрузке — до чтения тела и до очереди за слотом
+    early_user = core.upload_early_user(request.headers, request.query)
+    rejected = core.upload_admit(early_user, request.remote) if early_user else core.upload_precheck()
+    if rejected:
+        return json_response(*rejected)
+    async with upload_slots:
+        incoming = None
+        try:
+            form, incoming, file_name = await read_form(request)
+            if not early_user:
+                rejected = core.upload_admit(form.get('user_id'), request.remote)
+                if rejected:
+                    return json_response(*rejected)
+
+            # Статика (1, 2, 3)
+            if core.is_static_command(form):
+                return json_response(*await run_blocking(core.upload_static, form, trace))
+
+            # Файл
+            if incoming is None: return json_response({'error': 'No file'}, 400)
+            if file_name == '': return json_response({'error': 'Empty'}, 400)
+            if not core.allowed_file(file_name): return json_response({'error': 'Type'}, 400)
+
+            ext = file_name.rsplit('.', 1)[1].lower()
+            adopted, incoming = incoming, None
+            entry, is_duplicate = await run_blocking(core.blob_store.adopt, adopted, ext)
+            return json_response(*await run_blocking(core.upload_stored, entry, is_duplicate, form, trace))
+
+        except Exception as e:
+            # Как во Flask: и превышение размера, и прочее — 500 с текстом ошибки
+            return json_response(*core.upload_error(e, trace))
+        finally:
+            if incoming is not None:
+                incoming.close()
+
+
+async def via_flask(request):
+    """/, /admin/update_url и прочие роуты — тот же Flask-код, в пуле потоков."""
+    body = await request.read()
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in ('content-length', 'content-type')]
+
+    def dispatch():
+        with core.app.test_request_context(request.path, method=request.method,
+                                           query_string=request.query_string, headers=headers,
+                                           data=body, content_type=request.headers.get('Content-Type'),
+                                           environ_base={'REMOTE_ADDR': request.remote}):
+            return core.app.full_dispatch_request()
+
+    return from_werkzeug(await run_blocking(dispatch))
+
+
+async def on_startup(app):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(BLOCKING_THREADS, thread_name_prefix='blocking'))
+    set_server_loop(loop)
+    core.start_services()
+
+
+async def on_cleanup(app):
+    await core.cubes.close()
+
+
+def make_app():
+    app = web.Application(client_max_size=core.app.config['MAX_CONTENT_LENGTH'])
+    app.router.add_post('/upload', upload)
+    app.router.add_route('*', '/{tail:.*}', via_flask)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(make_app(), host=ASYNC_HOST, port=ASYNC_PORT)
@@ -0,0 +1,218 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import aiohttp
+
+from outbox import DeliveryOutbox, BLOB_CHUNK_SIZE, BLOB_CHUNKED_FROM
+
+_server_loop = None  # цикл событий сервера, в нём живут все AsyncDeliveryOutbox
+
+
+def set_server_loop(loop):
+    """Цикл, в котором запустятся очереди Кубов, зарегистрированных позже старта."""
+    global _server_loop
+    _server_loop = loop
+
+
+def read_at(fh, offset):
+    fh.seek(offset)
+    return fh.read(BLOB_CHUNK_SIZE)
+
+
+class LoopQueue:
+    """Очередь задач для корутин, в которую можно класть из любого потока.
+
+    Повторяет то, что DeliveryOutbox берёт у queue.Queue (put, put_nowait,
+    qsize, queue.Full), но забирают задачи корутины через await get().
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.size = 0
+        self.loop = None
+        self.items = None
+        self.early = []  # положенное до старта цикла
+
+    def bind(self, loop):
+        with self.lock:
+            self.loop = loop
+            self.items = asyncio.Queue()
+            for job in self.early:
+                self.items.put_nowait(job)
+            self.early = []
+
+    def put_nowait(self, job):
+        with self.lock:
+            if self.maxsize and self.size >= self.maxsize:
+                raise queue.Full
+            self.size += 1
+            self._push(job)
+
+    def put(self, job):
+        # Повторы уже были в очереди — их не отбрасываем по лимиту
+        with self.lock:
+            self.size += 1
+            self._push(job)
+
+    def _push(self, job):
+        if self.loop is None:
+            self.early.append(job)
+        else:
+            self.loop.call_soon_threadsafe(self.items.put_nowait, job)
+
+    async def get(self):
+        job = await self.items.get()
+        with self.lock:
+            self.size -= 1
+        return job
+
+    def qsize(self):
+        return self.size
+
+
+class AsyncDeliveryOutbox(DeliveryOutbox):
+    """DeliveryOutbox для async_app.py: отправки — корутины, а не потоки.
+
+    Журнал на диске, повторы, обработчики и счётчики те же. workers здесь —
+    число одновременных отправок на одном aiohttp-клиенте, и каждая
+    медленная отправка стоит корутину, а не поток. Всё, что трогает диск
+    (журнал задач, куски файла), идёт в пул потоков, а не в цикл событий.
+    """
+
+    def __init__(self, folder, url_getter, workers=64, max_queue=500, **kwargs):
+        super().__init__(folder, url_getter, workers=workers, max_queue=max_queue, **kwargs)
+        self.queue = LoopQueue(maxsize=max_queue)
+        self.session.close()  # requests-клиент родителя не нужен
+        self.session = None
+        self.loop = None
+        self.tasks = []
+
+    def start(self):
+        """Первый запуск — внутри цикла событий; дальше можно и из пула потоков."""
+        global _server_loop
+        if self.started:
+            return
+        self.started = True
+        try:
+            _server_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Например, новый Куб зарегистрирован Flask-роутом в пуле потоков
+            _server_loop.call_soon_threadsafe(self._start_in_loop)
+            return
+        self._start_in_loop()
+
+    def _start_in_loop(self):
+        self.loop = _server_loop
+        self.queue.bind(self.loop)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.workers))
+        self._replay()
+        self.tasks = [self.loop.create_task(self._async_worker()) for _ in range(self.workers)]
+        threading.Thread(target=self._retry_loop, name="outbox-retry", daemon=True).start()
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.session:
+            await self.session.close()
+
+    async def _async_worker(self):
+        while True:
+            job = await self.queue.get()
+            self._count("in_flight", 1)
+            try:
+                await self._deliver_async(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Outbox: ошибка воркера: {e}")
+            finally:
+                self._count("in_flight", -1)
+
+    async def _deliver_async(self, job):
+        # Проверка файла и запись повтора в журнал — на диске
+        url = await self.loop.run_in_executor(None, self._begin_attempt, job)
+        if url is None:
+            return
+
+        started = time.time()
+        timeout = aiohttp.ClientTimeout(total=job['timeout'])
+        try:
+            if job['file_path'] and not await self._push_blob_async(job, url, timeout):
+                # Файл читается кусками; размер известен, поэтому уходит Content-Length
+                with open(job['file_path'], 'rb') as fh:
+                    form = aiohttp.FormData()
+                    for key, value in (job['data'] or {}).items():
+                        form.add_field(key, str(value))
+                    form.add_field('file', fh, filename=job['file_name'], content_type=job['mimetype'])
+                    async with self.session.post(url, data=form, timeout=timeout) as r:
+                        status, text = r.status, await r.text()
+            elif job['json'] is not None:
+                async with self.session.post(url, json=job['json'], timeout=timeout) as r:
+                    status, text = r.status, await r.text()
+            else:
+                async with self.session.post(url, data=job['data'], timeout=timeout) as r:
+                    status, text = r.status, await r.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._on_error(job, str(e) or type(e).__name__)
+            return
+        except Exception as e:
+            # Битый JSON или ответ без нужного поля — повтор, как в DeliveryOutbox
+            self._on_error(job, e)
+            return
+        self._on_response(job, status, text, r, started)
+
+    async def _push_blob_async(self, job, url, timeout):
+        """То же, что DeliveryOutbox._push_blob, на aiohttp-клиенте."""
+        h = job['meta'].get('hash')
+        if not h or self.blob_support.get(url) is False:
+            return False
+        media_url = self._media_url(url)
+        async with self.session.post(f"{media_url}/have", json={"hashes": [h]}, timeout=timeout) as r:
+            if not self._blob_reply(url, r.status):
+                return False
+            r.raise_for_status()
+            reply = await r.json()
+        if h in reply.get('have', []):
+            self._count("blob_cached")
+            return True
+        size = await self.loop.run_in_executor(None, os.path.getsize, job['file_path'])
+        if size < BLOB_CHUNKED_FROM:
+            return False
+        offset = reply.get('partial', {}).get(h, 0)
+        fh = await self.loop.run_in_executor(None, open, job['file_path'], 'rb')
+        with fh:
+            while offset < size:
+                chunk = await self.loop.run_in_executor(None, read_at, fh, offset)
+                headers = {"Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}"}
+                async with self.session.put(f"{media_url}/{h}", params={"ext": self._blob_ext(job)},
+                                            data=chunk, headers=headers, timeout=timeout) as r:
+                    # 416 — Куб докачал другое число байт: продолжаем с его места
+                    if r.status != 416:
+                        r.raise_for_status()
+                    offset = (await r.json())['received']
+                self._count("blob_chunks")
+        print(f"📦 Файл залит в кэш Куба кусками: {job['file_name']}")
+        return True
+
+    def _schedule_retry(self, job):
+        # Повтор сначала пишется в журнал на диске — не в цикле событий
+        if self._in_loop():
+            self.loop.run_in_executor(None, super()._schedule_retry, job)
+        else:
+            super()._schedule_retry(job)
+
+    def _finish(self, job, response, ok):
+        # Обработчики пишут индекс хранилища на диск — не в цикле событий
+        if self._in_loop():
+            self.loop.run_in_executor(None, super()._finish, job, response, ok)
+        else:
+            super()._finish(job, response, ok)
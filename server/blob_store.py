@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+CHUNK_SIZE = 64 * 1024
+LEGACY_CUBE_ID = 'default'  # Кому ушли файлы с "delivered": true из индекса до реестра Кубов
+INDEX_COMPACT_EVERY = 1000      # Строк в журнале индекса, после которых снимок пишется заново
+REFERENCE_TTL = 30 * 24 * 3600  # Сколько помнить доставленный файл без копии на сервере
+
+
+class HashingFile:
+    """Временный файл загрузки, который считает SHA-256 по мере записи.
+
+    Подходит как контейнер для werkzeug (write/seek/read), поэтому тело
+    запроса сразу ложится на диск кусками, без копии в памяти.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.adopted = False
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        # Файл, который не забрало хранилище, — мусор (ошибка, отказ, обрыв)
+        if not self.adopted and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContentStore:
+    """Хранилище загрузок, адресуемое по SHA-256 содержимого.
+
+    Одинаковые байты хранятся один раз. Индекс (хэш -> запись) лежит в JSON
+    рядом с файлами и переживает перезапуск сервера. Записи без файла
+    забываются: недоставленные сразу, доставленные — через reference_ttl.
+    """
+
+    def __init__(self, folder, index_path, reference_ttl=REFERENCE_TTL):
+        self.folder = folder
+        self.index_path = index_path
+        self.journal_path = index_path + '.log'
+        self.reference_ttl = reference_ttl
+        self.lock = threading.Lock()
+        self.index = {}
+        self.journal = None
+        self.journal_lines = 0
+        self.incoming_folder = os.path.join(folder, '.incoming')
+        os.makedirs(self.incoming_folder, exist_ok=True)
+        self._clear_incoming()
+        self._load_index()
+
+    def _clear_incoming(self):
+        # Недописанные загрузки после падения или перезапуска
+        for name in os.listdir(self.incoming_folder):
+            try:
+                os.remove(os.path.join(self.incoming_folder, name))
+            except OSError:
+                pass
+
+    # --- ИНДЕКС ---
+    # Снимок index.json плюс журнал index.json.log: каждое изменение дописывает
+    # в журнал одну строку [хэш, запись или null], а не переписывает весь
+    # индекс. Раз в INDEX_COMPACT_EVERY строк (и при старте) снимок пишется
+    # заново, а журнал обнуляется.
+    def _load_index(self):
+        restored = os.path.exists(self.index_path) or os.path.exists(self.journal_path)
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.index = json.load(f)
+            except Exception as e:
+                print(f"⚠️ Индекс хранилища повреждён, начинаем с нуля: {e}")
+                self.index = {}
+        self._replay_journal()
+        self._compact()
+        if restored:
+            print(f"🗂️ Хранилище восстановлено: {len(self.index)} файлов")
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    h, entry = json.loads(line)
+                except ValueError:
+                    break  # Недописанная строка при падении — дальше ничего нет
+                if entry is None:
+                    self.index.pop(h, None)
+                else:
+                    self.index[h] = entry
+
+    def _log(self, h):
+        """Записывает в журнал текущее состояние записи h (вызывать под lock)."""
+        self.journal.write(json.dumps([h, self.index.get(h)]) + '\n')
+        self.journal.flush()
+        self.journal_lines += 1
+        if self.journal_lines >= INDEX_COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        self._prune(time.time())
+        # Сначала атомарно снимок, потом пустой журнал: если упасть между ними,
+        # старый журнал поверх нового снимка даст те же записи
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+        if self.journal:
+            self.journal.close()
+        self.journal = open(self.journal_path, 'w')
+        self.journal_lines = 0
+
+    def _prune(self, now):
+        # Запись без файла полезна, только пока Куб может переиграть его по ссылке
+        expired = [h for h, e in self.index.items()
+                   if not self.has_file(e) and (not e.get('delivered')
+                                                or e.get('last_seen', 0) + self.reference_ttl < now)]
+        for h in expired:
+            del self.index[h]
+        return len(expired)
+
+    # --- ДОСТУП ---
+    def path_for(self, filename):
+        return os.path.join(self.folder, filename)
+
+    def blob_name(self, h, ext):
+        return f"{h}.{ext}"
+
+    def has_file(self, entry):
+        return os.path.exists(self.path_for(entry['filename']))
+
+    def is_usable(self, entry):
+        # Доставленный файл можно переиграть по ссылке даже без локальной копии
+        return entry.get('delivered') or self.has_file(entry)
+
+    def delivered_to(self, entry, cube_id):
+        """Есть ли у Куба cube_id копия файла (тогда достаточно ссылки)."""
+        if 'delivered_to' in entry:
+            return cube_id in entry['delivered_to']
+        return bool(entry.get('delivered')) and cube_id == LEGACY_CUBE_ID
+
+    def lookup(self, h):
+        """Возвращает запись по хэшу или None, если повторить её уже нельзя."""
+        with self.lock:
+            entry = self.index.get(h)
+            if entry and not self.is_usable(entry):
+                del self.index[h]
+                self._log(h)
+                entry = None
+            return dict(entry) if entry else None
+
+    def incoming_file(self):
+        """Новый временный файл для потоковой записи загрузки."""
+        return HashingFile(os.path.join(self.incoming_folder, f"{uuid.uuid4().hex}.part"))
+
+    def put(self, data, ext):
+        """Сохраняет байты. Возвращает (запись, is_duplicate)."""
+        incoming = self.incoming_file()
+        incoming.write(data)
+        return self.adopt(incoming, ext)
+
+    def put_stream(self, stream, ext):
+        """Копирует поток в хранилище кусками по CHUNK_SIZE."""
+        if isinstance(stream, HashingFile):
+            return self.adopt(stream, ext)
+        incoming = self.incoming_file()
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                incoming.write(chunk)
+        except Exception:
+            incoming.close()
+            raise
+        return self.adopt(incoming, ext)
+
+    def adopt(self, incoming, ext):
+        """Забирает дописанный HashingFile. Возвращает (запись, is_duplicate)."""
+        incoming.file.flush()
+        incoming.file.close()
+        entry, is_duplicate, kept = self._adopt_path(incoming.path, incoming.hexdigest(), incoming.size, ext)
+        incoming.adopted = kept
+        incoming.close()
+        return entry, is_duplicate
+
+    def adopt_file(self, path, ext):
+        """Забирает готовый файл (например, результат рендера), хэшируя его кусками."""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        entry, is_duplicate, kept = self._adopt_path(path, hasher.hexdigest(), os.path.getsize(path), ext)
+        if not kept:
+            os.remove(path)
+        return entry, is_duplicate
+
+    def _adopt_path(self, path, h, size, ext):
+        """Возвращает (запись, is_duplicate, kept); если kept=False, временный файл удаляет вызывающий."""
+        with self.lock:
+            entry = self.index.get(h)
+            if entry and self.is_usable(entry):
+                entry['last_seen'] = time.time()
+                entry['hits'] = entry.get('hits', 1) + 1
+                # Копию уже убрал уборщик, а новому Кубу нужен сам файл — возвращаем её
+                kept = not self.has_file(entry)
+                if kept:
+                    os.replace(path, self.path_for(entry['filename']))
+                self._log(h)
+                return dict(entry), True, kept
+
+            filename = self.blob_name(h, ext)
+            os.replace(path, self.path_for(filename))
+
+            now = time.time()
+            entry = {
+                "hash": h,
+                "filename": filename,
+                "size": size,
+                "created": now,
+                "last_seen": now,
+                "hits": 1,
+                "delivered": False,
+                "delivered_to": [],
+            }
+            self.index[h] = entry
+            self._log(h)
+            return dict(entry), False, True
+
+    def render_of(self, h, key):
+        """Хэш подготовленной версии исходника h с параметрами key."""
+        with self.lock:
+            entry = self.index.get(h)
+            return entry.get('renders', {}).get(key) if entry else None
+
+    def set_render(self, h, key, rendered_hash):
+        with self.lock:
+            entry = self.index.get(h)
+            if entry:
+                entry.setdefault('renders', {})[key] = rendered_hash
+                self._log(h)
+
+    def mark_delivered(self, h, cube_id=LEGACY_CUBE_ID):
+        """Куб cube_id получил файл; delivered — получил ли хоть один Куб."""
+        with self.lock:
+            entry = self.index.get(h)
+            if entry:
+                delivered_to = entry.setdefault('delivered_to', [LEGACY_CUBE_ID] if entry.get('delivered') else [])
+                if cube_id not in delivered_to:
+                    delivered_to.append(cube_id)
+                entry['delivered'] = True
+                self._log(h)
+
+    def mark_missing(self, h, cube_id):
+        """Куб cube_id вытеснил файл из своего кэша — ссылки ему больше мало."""
+        with self.lock:
+            entry = self.index.get(h)
+            if entry and self.delivered_to(entry, cube_id):
+                delivered_to = entry.setdefault('delivered_to', [LEGACY_CUBE_ID])
+                delivered_to.remove(cube_id)
+                entry['delivered'] = bool(delivered_to)
+                self._log(h)
+
+    def forget(self, h):
+        with self.lock:
+            if self.index.pop(h, None) is not None:
+                self._log(h)
+
+    def keep(self, h, until):
+        """Копия нужна до until, даже если её ещё никуда не отправляли (файлы расписаний)."""
+        with self.lock:
+            entry = self.index.get(h)
+            if entry:
+                entry['keep_until'] = max(until, entry.get('keep_until', 0))
+                self._log(h)
+
+    def kept_until(self, filename):
+        """Срок из keep() для файла filename или None."""
+        h = filename.split('.', 1)[0]
+        with self.lock:
+            entry = self.index.get(h)
+            return entry.get('keep_until') if entry and entry['filename'] == filename else None
+
+    def file_removed(self, filename):
+        """Уборщик удалил копию: запись, которую ни один Куб не получил, больше не нужна."""
+        h = filename.split('.', 1)[0]
+        with self.lock:
+            entry = self.index.get(h)
+            if entry and entry['filename'] == filename and not entry.get('delivered'):
+                del self.index[h]
+                self._log(h)
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import shutil
+import threading
+
+DEFAULT_CUBE_ID = 'default'  # Куб, который знал сервер до реестра (observer_url.txt)
+FAILURES_DEGRADED = 1        # Подряд неудачных попыток до состояния degraded
+FAILURES_OFFLINE = 3         # ...и до offline
+CUBE_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')  # id идёт в путь папки outbox и в метки метрик
+
+
+class CubeRegistry:
+    """Кубы галереи: адрес, группы, когда выходил на связь и здоров ли.
+
+    У каждого Куба своя очередь доставки (make_outbox) в папке
+    outbox/cubes/<id> со своими воркерами и повторами, поэтому медленный
+    или выключенный Куб не задерживает остальных. Реестр лежит в JSON и
+    обновляется рукопожатием Куба через /admin/update_url.
+    """
+
+    def __init__(self, path, outbox_folder, make_outbox):
+        self.path = path
+        self.outbox_folder = outbox_folder
+        self.make_outbox = make_outbox  # (папка, url_getter, on_attempt) -> DeliveryOutbox
+        self.lock = threading.RLock()
+        self.cubes = {}     # id -> запись
+        self.outboxes = {}  # id -> DeliveryOutbox
+        self.handlers = {}  # kind -> (on_success, on_failure), как у DeliveryOutbox.on
+        self.started = False
+        self._load()
+
+    # --- РЕЕСТР ---
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                cubes = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Реестр Кубов повреждён, начинаем с нуля: {e}")
+            return
+        for cube in cubes.values():
+            self._add(cube)
+        print(f"🧊 Реестр Кубов: {', '.join(sorted(self.cubes)) or 'пусто'}")
+
+    def _save(self):
+        with self.lock:
+            data = {cube_id: dict(cube) for cube_id, cube in self.cubes.items()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _add(self, cube):
+        cube_id = cube['id']
+        self.cubes[cube_id] = cube
+        outbox = self.make_outbox(os.path.join(self.outbox_folder, 'cubes', cube_id),
+                                  lambda: self.url_of(cube_id),
+                                  lambda ok, detail: self.record_attempt(cube_id, ok, detail))
+        for kind, (on_success, on_failure) in self.handlers.items():
+            outbox.on(kind, on_success, on_failure)
+        self.outboxes[cube_id] = outbox
+        if self.started:
+            outbox.start()
+        return outbox
+
+    def migrate_legacy(self, url_file):
+        """Один Куб из observer_url.txt и недоставленное из общей папки outbox."""
+        if self.cubes or not os.path.exists(url_file):
+            return
+        with open(url_file, 'r') as f:
+            url = f.read().strip()
+        if not url:
+            return
+        self.register(DEFAULT_CUBE_ID, url)
+        target = os.path.join(self.outbox_folder, 'cubes', DEFAULT_CUBE_ID)
+        moved = 0
+        for name in os.listdir(self.outbox_folder):
+            if name.endswith('.json'):
+                shutil.move(os.path.join(self.outbox_folder, name), os.path.join(target, name))
+                moved += 1
+        print(f"🧊 Куб '{DEFAULT_CUBE_ID}' перенесён из {os.path.basename(url_file)}, задач в очереди: {moved}")
+
+    def register(self, cube_id, url, groups=None):
+        """Рукопожатие Куба: новый адрес, группы и отметка, что Куб жив.
+
+        ValueError — если id не годится в имя папки.
+        """
+        if not isinstance(cube_id, str) or not CUBE_ID_RE.fullmatch(cube_id):
+            raise ValueError("cube_id: латиница, цифры, _ и -, до 64 символов")
+        now = time.time()
+        with self.lock:
+            cube = self.cubes.get(cube_id)
+            if cube is None:
+                cube = {"id": cube_id, "url": url, "groups": [], "registered": now,
+                        "last_seen": now, "health": "unknown", "failures": 0, "last_error": None}
+                self._add(cube)
+            cube['url'] = url
+            cube['last_seen'] = now
+            if groups is not None:
+                cube['groups'] = sorted(set(groups))
+            # Новый адрес — поводов считать Куб мёртвым больше нет
+            cube['failures'] = 0
+            if cube['health'] == 'offline':
+                cube['health'] = 'unknown'
+        self._save()
+        return dict(cube)
+
+    def url_of(self, cube_id):
+        with self.lock:
+            cube = self.cubes.get(cube_id)
+            return cube['url'] if cube else None
+
+    def resolve(self, target=None):
+        """'all' (или пусто), 'group:<имя>', id Куба или их список через запятую."""
+        with self.lock:
+            if not target or target == 'all':
+                return sorted(self.cubes)
+            ids = []
+            for part in str(target).split(','):
+                part = part.strip()
+                if part == 'all':
+                    ids.extend(self.cubes)
+                elif part.startswith('group:'):
+                    group = part[len('group:'):]
+                    ids.extend(cube_id for cube_id, cube in self.cubes.items() if group in cube['groups'])
+                elif part in self.cubes:
+                    ids.append(part)
+                elif part:
+                    print(f"⚠️ Неизвестный Куб: {part}")
+            return sorted(set(ids))
+
+    # --- ЗДОРОВЬЕ ---
+    def record_attempt(self, cube_id, ok, detail=None):
+        """Итог одной попытки доставки (вызывает outbox этого Куба)."""
+        with self.lock:
+            cube = self.cubes.get(cube_id)
+            if cube is None:
+                return
+            before = cube['health']
+            if ok:
+                cube['failures'] = 0
+                cube['last_seen'] = time.time()
+                cube['health'] = 'online'
+            else:
+                cube['failures'] += 1
+                cube['last_error'] = str(detail)
+                if cube['failures'] >= FAILURES_OFFLINE:
+                    cube['health'] = 'offline'
+                elif cube['failures'] >= FAILURES_DEGRADED:
+                    cube['health'] = 'degraded'
+            changed = cube['health'] != before
+        if changed:
+            print(f"🧊 Куб '{cube_id}': {before} -> {cube['health']}")
+            self._save()
+
+    # --- ДОСТАВКА ---
+    def on(self, kind, on_success=None, on_failure=None):
+        self.handlers[kind] = (on_success, on_failure)
+        with self.lock:
+            for outbox in self.outboxes.values():
+                outbox.on(kind, on_success, on_failure)
+
+    def start(self):
+        with self.lock:
+            self.started = True
+            outboxes = list(self.outboxes.values())
+        for outbox in outboxes:
+            outbox.start()
+
+    def enqueue(self, cube_id, kind, **job):
+        """Задача в очередь одного Куба; meta получает cube_id для обработчиков."""
+        outbox = self.outboxes.get(cube_id)
+        if outbox is None:
+            return False
+        job['meta'] = dict(job.get('meta') or {}, cube_id=cube_id)
+        return outbox.enqueue(kind, **job)
+
+    def pending_files(self):
+        with self.lock:
+            outboxes = list(self.outboxes.values())
+        return [name for outbox in outboxes for name in outbox.pending_files()]
+
+    def queue_depths(self):
+        with self.lock:
+            return {cube_id: outbox.stats()['queue_depth'] for cube_id, outbox in self.outboxes.items()}
+
+    def pending(self):
+        """Сколько задач всего ждёт доставки или в пути, по всем Кубам."""
+        with self.lock:
+            outboxes = list(self.outboxes.values())
+        total = 0
+        for outbox in outboxes:
+            stats = outbox.stats()
+            total += stats['queue_depth'] + stats['waiting_retry'] + stats['in_flight']
+        return total
+
+    def stats(self):
+        with self.lock:
+            items = [(dict(cube), self.outboxes[cube_id]) for cube_id, cube in sorted(self.cubes.items())]
+        return {cube['id']: dict(cube, outbox=outbox.stats()) for cube, outbox in items}
+
+    async def close(self):
+        """Для async-режима: закрыть клиентов AsyncDeliveryOutbox."""
+        for outbox in list(self.outboxes.values()):
+            await outbox.close()
@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import queue
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+SPARSE_EVERY = 64  # Шаг разреженного индекса времени (строк)
+
+
+class EventLog:
+    """Журнал событий с фоновой записью, ротацией сегментов и индексом.
+
+    append() только кладёт запись в очередь; отдельный поток пишет пачками в
+    текущий сегмент events-<время>.jsonl и делает fsync по политике.
+    Для каждого сегмента держим маленький индекс: диапазон времени, смещения
+    строк по user_id и разреженные метки времени. Закрытый сегмент сохраняет
+    индекс рядом (.idx), поэтому запрос читает только нужные строки, а не всю
+    историю. Строки пишутся в порядке времени, на этом держатся оба индекса.
+    Старый однофайловый журнал (legacy_path) при первом старте становится
+    самым ранним закрытым сегментом, а сам файл переименовывается в .imported.
+    """
+
+    def __init__(self, folder, segment_max_bytes=4 * 1024 * 1024, segment_max_age=24 * 3600,
+                 max_segments=30, fsync_interval=5.0, batch_size=100, flush_interval=1.0,
+                 max_queue=10000, legacy_path=None):
+        self.folder = folder
+        self.legacy_path = legacy_path
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.max_segments = max_segments
+        # None — никогда, 0 — после каждой пачки, N — не чаще раза в N секунд
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()   # защищает segments и файл сегмента
+        self.segments = []             # от старых к новым
+        self.active = None
+        self.active_file = None
+        self.last_fsync = 0.0
+        self.counters = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0}
+        self.started = False
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    # --- ПУБЛИЧНОЕ API ---
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self._import_legacy()
+        self._load_segments()
+        threading.Thread(target=self._writer, name="event-log", daemon=True).start()
+
+    def append(self, entry):
+        """Неблокирующая запись. При переполнении очереди событие теряется."""
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def query(self, user_id=None, since=None, until=None, limit=50):
+        """Последние события (новые первыми) по пользователю и/или времени.
+
+        since/until — unix-время. Учитываются только уже записанные пачки.
+        """
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        results = []
+        with self.lock:
+            if self.active_file:
+                self.active_file.flush()
+            segments = [s for s in self.segments if s["last_ts"] >= since and s["first_ts"] <= until]
+
+        for seg in reversed(segments):
+            path = os.path.join(self.folder, seg["name"])
+            try:
+                if user_id is not None:
+                    entries = self._read_user(path, seg, str(user_id), since, until, limit - len(results))
+                else:
+                    entries = self._read_range(path, seg, since, until, limit - len(results))
+            except FileNotFoundError:
+                continue
+            results.extend(entries)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _read_user(self, path, seg, user_id, since, until, limit):
+        found = []
+        with open(path, 'rb') as f:
+            for off in reversed(seg["users"].get(user_id, ())):
+                f.seek(off)
+                entry = json.loads(f.readline())
+                ts = entry_ts(entry)
+                if ts > until:
+                    continue
+                if ts < since:
+                    break
+                found.append(entry)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _read_range(self, path, seg, since, until, limit):
+        # Начинаем с ближайшей разреженной метки до since и читаем вперёд
+        i = bisect_right(seg["sparse_ts"], since) - 1
+        start = seg["sparse_off"][i] if i >= 0 else 0
+        found = []
+        with open(path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                ts = entry_ts(entry)
+                if ts > until:
+                    break
+                if ts >= since:
+                    found.append(entry)
+        # Нужны самые свежие
+        return list(reversed(found[-limit:]))
+
+    def stats(self):
+        with self.lock:
+            segments = len(self.segments)
+        return {"queue_depth": self.queue.qsize(), "segments": segments, **self.counters}
+
+    # --- СЕГМЕНТЫ ---
+    def _new_segment_meta(self, name, created):
+        return {"name": name, "created": created, "size": 0, "lines": 0,
+                "first_ts": float('inf'), "last_ts": float('-inf'),
+                "sparse_ts": array('d'), "sparse_off": array('q'), "users": {}}
+
+    def _index_line(self, seg, entry, ts, offset, size):
+        if seg["lines"] % SPARSE_EVERY == 0:
+            seg["sparse_ts"].append(ts)
+            seg["sparse_off"].append(offset)
+        seg["lines"] += 1
+        user = entry.get("user_id")
+        if user is not None:
+            seg["users"].setdefault(str(user), array('q')).append(offset)
+        seg["first_ts"] = min(seg["first_ts"], ts)
+        seg["last_ts"] = max(seg["last_ts"], ts)
+        seg["size"] = offset + size
+
+    def _load_segments(self):
+        names = sorted(n for n in os.listdir(self.folder) if n.startswith('events-') and n.endswith('.jsonl'))
+        for name in names:
+            path = os.path.join(self.folder, name)
+            idx_path = path + '.idx'
+            seg = None
+            if os.path.exists(idx_path):
+                try:
+                    with open(idx_path, 'r') as f:
+                        seg = self._decode_index(json.load(f))
+                except Exception:
+                    seg = None
+            if seg is None:
+                seg = self._scan_segment(name)
+            self.segments.append(seg)
+        # Последний сегмент без .idx продолжаем писать
+        if self.segments and not os.path.exists(os.path.join(self.folder, self.segments[-1]["name"] + '.idx')):
+            self.active = self.segments[-1]
+            self.active_file = open(os.path.join(self.folder, self.active["name"]), 'ab')
+        if self.segments:
+            print(f"📒 Журнал событий: {len(self.segments)} сегментов")
+
+    def _import_legacy(self):
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        first_ts = None
+        with open(self.legacy_path, 'rb') as f:
+            for line in f:
+                entry = legacy_entry(line)
+                if entry is not None:
+                    first_ts = entry_ts(entry)
+                    break
+        if first_ts is not None:
+            name = segment_name(first_ts)
+            path = os.path.join(self.folder, name)
+            # Сегмент уже есть — упали после импорта, но до переименования
+            if not os.path.exists(path):
+                seg = self._new_segment_meta(name, first_ts)
+                offset = 0
+                with open(self.legacy_path, 'rb') as src, open(path + '.tmp', 'wb') as dst:
+                    for line in src:
+                        entry = legacy_entry(line)
+                        if entry is None:
+                            continue  # Строка, недописанная старым сервером
+                        line = line.rstrip(b'\n') + b'\n'
+                        self._index_line(seg, entry, entry_ts(entry), offset, len(line))
+                        dst.write(line)
+                        offset += len(line)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                with open(path + '.idx.tmp', 'w') as f:
+                    json.dump(self._encode_index(seg), f)
+                os.replace(path + '.idx.tmp', path + '.idx')
+                os.replace(path + '.tmp', path)
+                print(f"📒 Журнал событий: {seg['lines']} записей перенесено из {os.path.basename(self.legacy_path)}")
+        os.replace(self.legacy_path, self.legacy_path + '.imported')
+
+    def _scan_segment(self, name):
+        path = os.path.join(self.folder, name)
+        created = segment_ms(name) / 1000
+        seg = self._new_segment_meta(name, created)
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._index_line(seg, entry, entry_ts(entry), offset, len(line))
+                except Exception:
+                    pass
+                offset += len(line)
+        seg["size"] = offset
+        return seg
+
+    def _encode_index(self, seg):
+        data = dict(seg)
+        data["sparse_ts"] = seg["sparse_ts"].tolist()
+        data["sparse_off"] = seg["sparse_off"].tolist()
+        data["users"] = {u: offs.tolist() for u, offs in seg["users"].items()}
+        return data
+
+    def _decode_index(self, data):
+        data["sparse_ts"] = array('d', data["sparse_ts"])
+        data["sparse_off"] = array('q', data["sparse_off"])
+        data["users"] = {u: array('q', offs) for u, offs in data["users"].items()}
+        return data
+
+    def _open_segment(self):
+        now = time.time()
+        name = segment_name(now)
+        # Ротация в ту же миллисекунду дописала бы в только что закрытый сегмент
+        if self.segments and name <= self.segments[-1]["name"]:
+            name = segment_name((segment_ms(self.segments[-1]["name"]) + 1) / 1000)
+        self.active = self._new_segment_meta(name, now)
+        self.active_file = open(os.path.join(self.folder, name), 'ab')
+        self.segments.append(self.active)
+
+    def _seal_segment(self):
+        self.active_file.flush()
+        os.fsync(self.active_file.fileno())
+        self.active_file.close()
+        idx_path = os.path.join(self.folder, self.active["name"] + '.idx')
+        with open(idx_path + '.tmp', 'w') as f:
+            json.dump(self._encode_index(self.active), f)
+        os.replace(idx_path + '.tmp', idx_path)
+        self.active = None
+        self.active_file = None
+        self.counters["rotations"] += 1
+        # Храним ограниченное число сегментов
+        while len(self.segments) > self.max_segments:
+            old = self.segments.pop(0)
+            for path in (old["name"], old["name"] + '.idx'):
+                try:
+                    os.remove(os.path.join(self.folder, path))
+                except FileNotFoundError:
+                    pass
+
+    def _needs_rotation(self):
+        if self.active is None:
+            return False
+        return (self.active["size"] >= self.segment_max_bytes
+                or time.time() - self.active["created"] >= self.segment_max_age)
+
+    # --- ЗАПИСЬ ---
+    def _writer(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"❌ Журнал событий: ошибка записи: {e}")
+
+    def _write_batch(self, batch):
+        with self.lock:
+            if self._needs_rotation():
+                self._seal_segment()
+            if self.active is None:
+                self._open_segment()
+            offset = self.active["size"]
+            chunks = []
+            for entry in batch:
+                line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+                self._index_line(self.active, entry, entry_ts(entry), offset, len(line))
+                chunks.append(line)
+                offset += len(line)
+            self.active_file.write(b''.join(chunks))
+            self.active_file.flush()
+            now = time.time()
+            if self.fsync_interval is not None and now - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.active_file.fileno())
+                self.last_fsync = now
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+
+
+def segment_name(ts):
+    return f"events-{int(ts * 1000):015d}.jsonl"
+
+
+def segment_ms(name):
+    return int(name[len('events-'):-len('.jsonl')])
+
+
+def legacy_entry(line):
+    """Запись из строки старого журнала или None, если строка битая."""
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def entry_ts(entry):
+    """Unix-время записи по полю timestamp (ISO) или текущее."""
+    try:
+        return datetime.fromisoformat(entry["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
@@ -1,100 +1,374 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, request, jsonify
 import os
-import hashlib
-import requests
-from datetime import datetime
-from werkzeug.utils import secure_filename
-import threading
 import json
 import time
+import fcntl
+import threading
+from datetime import datetime
+from blob_store import ContentStore
+from outbox import DeliveryOutbox
+from cube_registry import CubeRegistry, DEFAULT_CUBE_ID
+from admission import AdmissionControl
+from playlists import PlaylistStore, parse_playlist
+from janitor import UploadJanitor
+from event_log import EventLog
+from prerender import Prerenderer, NEUTRAL_BRIGHTNESS
+from tracing import Trace, METRICS
+
+class UploadRequest(Request):
+    """Файлы из multipart сразу пишутся в хранилище кусками и хэшируются на лету."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return blob_store.incoming_file()
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 
 # === НАСТРОЙКИ БЕЗОПАСНОСТИ ===
 # Этот ключ должен совпадать в обоих файлах (на сервере и на кубе)
 ADMIN_SECRET = "GOLO_CUBE_SECRET_KEY_2025"
 
 # === ПУТИ ===
-BASE_DIR = '/home/myTree/mysite'
-STATIC_IMAGES_LOG = os.path.join(BASE_DIR, 'static_images.log')
+BASE_DIR = os.environ.get('GOLO_BASE_DIR', '/home/myTree/mysite')
+EVENT_LOG_FOLDER = os.path.join(BASE_DIR, 'event_log') # Сегменты журнала событий
+LEGACY_EVENT_LOG = os.path.join(BASE_DIR, 'static_images.log') # Журнал до сегментов, переносится при старте
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
-CONFIG_FILE = os.path.join(BASE_DIR, 'observer_url.txt') # Файл для хранения адреса
+CONFIG_FILE = os.path.join(BASE_DIR, 'observer_url.txt') # Адрес единственного Куба (до реестра)
+CUBES_FILE = os.path.join(BASE_DIR, 'cubes.json') # Реестр Кубов галереи
+BLOB_INDEX_FILE = os.path.join(BASE_DIR, 'blob_index.json') # Индекс хэш -> файл
+OUTBOX_FOLDER = os.path.join(BASE_DIR, 'outbox') # Недоставленные события, по папке на Куб
+PLAYLISTS_FILE = os.path.join(BASE_DIR, 'playlists.json') # Расписания сцен
+SERVICES_LOCK_FILE = os.path.join(BASE_DIR, 'services.lock') # Кто из процессов ведёт журналы
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 OBSERVER_ENABLED = True
-
-# === ЗАГРУЗКА АДРЕСА ===
-# При запуске сервера читаем последний известный адрес из файла
-if os.path.exists(CONFIG_FILE):
-    with open(CONFIG_FILE, 'r') as f:
-        OBSERVER_URL = f.read().strip()
-    print(f"🔄 Адрес восстановлен из файла: {OBSERVER_URL}")
-else:
-    OBSERVER_URL = 'http://localhost:5000/webhook' # Заглушка
+OBSERVER_WORKERS = 4      # Сколько отправок на один Куб идёт параллельно
+OBSERVER_QUEUE_SIZE = 500 # Максимум событий в очереди доставки одного Куба
+DEFAULT_TARGET = 'all'    # Куда слать, если в запросе нет поля cube
+
+# === РЕЖИМ СЕРВЕРА ===
+# wsgi — обычный Flask (PythonAnywhere); async — async_app.py на aiohttp.
+# Журналы в BASE_DIR ведёт ровно один процесс: под uWSGI — processes = 1
+# и нужное число threads (с enable-threads), см. start_services()
+SERVER_MODE = os.environ.get('GOLO_SERVER_MODE', 'wsgi')
+ASYNC_PUSH_CONCURRENCY = 64 # Одновременных отправок на Куб в async-режиме
+
+# === ДОПУСК ЗАГРУЗОК ===
+UPLOAD_USER_RATE = 0.5     # Загрузок в секунду на одного user_id...
+UPLOAD_USER_BURST = 10     # ...и сколько можно подряд сверх этого
+UPLOAD_GLOBAL_RATE = 20    # Загрузок в секунду на весь сервер
+UPLOAD_GLOBAL_BURST = 100
+MAX_PENDING_PUSHES = 400   # Задач доставки на Кубы в очереди и в пути, дальше — 503
+
+# === КВОТА ПАПКИ ЗАГРУЗОК ===
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+UPLOAD_MAX_FILES = 500
+DELIVERED_TTL = 5   # Через сколько секунд удалять файл после доставки
+FAILED_TTL = 60     # ...и после окончательной ошибки доставки
+
+# === РАСПИСАНИЯ СЦЕН ===
+PLAYLIST_MEDIA_TTL = 24 * 3600  # Сколько держать файл для расписания, пока на него не сослался плейлист
+PLAYLIST_EXPIRE_AFTER = 3600    # Через сколько секунд после последнего слота плейлист забывается
+
+# === ПОДГОТОВКА КАРТИНОК ДЛЯ КУБА ===
+CUBE_DISPLAY_SIZE = (1920, 1080) # Разрешение экрана Куба
+CUBE_ROTATE = 180                # Экран Куба перевёрнут
+PRERENDER_QUALITY = 85
+PRERENDER_WORKERS = 2
+
+# === ЖУРНАЛ СОБЫТИЙ ===
+EVENT_LOG_SEGMENT_BYTES = 4 * 1024 * 1024
+EVENT_LOG_MAX_SEGMENTS = 30
+EVENT_LOG_FSYNC = 5.0  # None — не делать fsync, 0 — после каждой пачки, N — раз в N секунд
 
 # === ИНИЦИАЛИЗАЦИЯ ===
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-if not os.path.exists(STATIC_IMAGES_LOG):
-    with open(STATIC_IMAGES_LOG, 'w') as f:
-        f.write("Static Images Log\n=================\n")
+# Одинаковые картинки храним и отправляем на Куб один раз
+blob_store = ContentStore(UPLOAD_FOLDER, BLOB_INDEX_FILE)
+
+# Доставка на Кубы: у каждого своя очередь, воркеры, повторы и журнал на диске
+if SERVER_MODE == 'async':
+    # Те же журнал и повторы, но отправки — корутины на общем aiohttp-клиенте
+    from async_outbox import AsyncDeliveryOutbox
+    def make_outbox(folder, url_getter, on_attempt):
+        return AsyncDeliveryOutbox(folder, url_getter, workers=ASYNC_PUSH_CONCURRENCY,
+                                   max_queue=OBSERVER_QUEUE_SIZE, on_attempt=on_attempt)
+else:
+    def make_outbox(folder, url_getter, on_attempt):
+        return DeliveryOutbox(folder, url_getter, workers=OBSERVER_WORKERS,
+                              max_queue=OBSERVER_QUEUE_SIZE, on_attempt=on_attempt)
+
+cubes = CubeRegistry(CUBES_FILE, OUTBOX_FOLDER, make_outbox)
+cubes.migrate_legacy(CONFIG_FILE)
+
+# Лишнее отсекается сразу 429/503 с Retry-After, а не копится в очередях
+admission = AdmissionControl(UPLOAD_USER_RATE, UPLOAD_USER_BURST, UPLOAD_GLOBAL_RATE, UPLOAD_GLOBAL_BURST,
+                             MAX_PENDING_PUSHES, cubes.pending)
+
+# Один уборщик на всю папку загрузок: сроки удаления + квота с LRU
+janitor = UploadJanitor(UPLOAD_FOLDER, UPLOAD_MAX_BYTES, UPLOAD_MAX_FILES, orphan_ttl=FAILED_TTL,
+                        on_remove=blob_store.file_removed, restore_deadline=blob_store.kept_until)
+
+# Плейлисты уходят на Кубы заранее; сцены переключает сам Куб по своим часам
+playlists = PlaylistStore(PLAYLISTS_FILE, expire_after=PLAYLIST_EXPIRE_AFTER)
+
+# Уменьшение, поворот и яркость считаются здесь, а не на слабом железе Куба
+prerenderer = Prerenderer(blob_store, size=CUBE_DISPLAY_SIZE, rotate=CUBE_ROTATE,
+                          quality=PRERENDER_QUALITY, workers=PRERENDER_WORKERS)
+
+# Журнал событий: запись пачками в фоне, ротация и индекс по user_id/времени
+event_log = EventLog(EVENT_LOG_FOLDER, segment_max_bytes=EVENT_LOG_SEGMENT_BYTES,
+                     max_segments=EVENT_LOG_MAX_SEGMENTS, fsync_interval=EVENT_LOG_FSYNC,
+                     legacy_path=LEGACY_EVENT_LOG)
+
+# Глубина очередей для /metrics снимается в момент запроса
+METRICS.gauge('queue_depth', lambda: {
+    **{f"outbox:{cube_id}": depth for cube_id, depth in cubes.queue_depths().items()},
+    "event_log": event_log.stats()['queue_depth'],
+}, label='queue')
+METRICS.gauge('cube_online', lambda: {
+    cube_id: int(cube['health'] == 'online') for cube_id, cube in cubes.stats().items()
+}, label='cube')
+METRICS.gauge('uploads_pinned', lambda: janitor.stats()['pinned'])
+METRICS.gauge('uploads_bytes', lambda: janitor.stats()['bytes'])
 
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def file_hash(data):
-    return hashlib.md5(data).hexdigest()
-
-def delete_file_after_delay(filename, delay=60):
-    def delete_file():
-        time.sleep(delay)
-        try:
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                print(f"🗑️ Удален: {filename}")
-        except Exception as e:
-            print(f"❌ Ошибка удаления {filename}: {e}")
-    threading.Thread(target=delete_file, daemon=True).start()
-
-def notify_observer_async(filename, user_id, file_size, file_data, is_duplicate=False, image_data=None):
-    """Отправляет данные на Куб по текущему OBSERVER_URL"""
-    def send_notification():
-        # Если адрес пустой или локальный, нет смысла слать
-        if 'localhost' in OBSERVER_URL or '127.0.0.1' in OBSERVER_URL:
-            print(f"⚠️ Отправка пропущена, адрес не настроен: {OBSERVER_URL}")
-            return
-
-        try:
-            files = {'file': (filename, file_data, 'image/jpeg')}
-            payload = {
-                "filename": filename,
-                "user_id": user_id,
-                "file_size": file_size,
-                "timestamp": datetime.now().isoformat(),
-                "is_duplicate": is_duplicate
-            }
-            if image_data: payload.update(image_data)
-
-            print(f"🚀 [PUSH] Отправка на {OBSERVER_URL}...")
-            r = requests.post(OBSERVER_URL, data=payload, files=files, timeout=30)
-            
-            if r.status_code == 200:
-                print(f"✅ Успешно доставлено: {filename}")
-                delete_file_after_delay(filename, delay=5)
-            else:
-                print(f"❌ Ошибка клиента: {r.status_code} - {r.text}")
-                delete_file_after_delay(filename, delay=60)
-
-        except Exception as e:
-            print(f"⚠️ Ошибка связи с Кубом: {e}")
-            delete_file_after_delay(filename, delay=60)
-
-    if OBSERVER_ENABLED:
-        threading.Thread(target=send_notification, daemon=True).start()
+def trace_delivered(job, ok):
+    """Последняя стадия на сервере: Куб ответил (или доставка сдалась)."""
+    meta = job['meta']
+    cube_id = meta.get('cube_id', DEFAULT_CUBE_ID)
+    METRICS.inc('deliveries', kind=job['kind'], cube=cube_id, outcome='ok' if ok else 'failed')
+    if not ok:
+        METRICS.inc('errors', stage='delivery', kind=job['kind'], cube=cube_id)
+    if meta.get('trace_id'):
+        trace = Trace.from_fields(meta, meta.get('trace_kind', job['kind']))
+        trace.mark('delivered' if ok else 'failed')
+        trace.log(f"{cube_id}, попыток {job['attempts']}, ")
+
+def on_upload_delivered(job, response):
+    meta = job['meta']
+    trace_delivered(job, True)
+    if meta.get('hash'): blob_store.mark_delivered(meta['hash'], meta.get('cube_id', DEFAULT_CUBE_ID))
+    print(f"✅ Успешно доставлено: {meta.get('filename')} -> {meta.get('cube_id', DEFAULT_CUBE_ID)}")
+    if job['file_path']:
+        janitor.unpin(meta['filename'])
+        janitor.expire_in(meta['filename'], DELIVERED_TTL)
+
+def on_upload_failed(job, response):
+    if job.get('status') == 409 and resend_evicted(job):
+        return
+    trace_delivered(job, False)
+    if job['file_path']:
+        janitor.unpin(job['meta']['filename'])
+        janitor.expire_in(job['meta']['filename'], FAILED_TTL)
+
+def resend_evicted(job):
+    """Куб ответил на ссылку 409: файла в его кэше уже нет. Шлём сам файл, если он ещё у нас."""
+    meta = job['meta']
+    cube_id = meta.get('cube_id', DEFAULT_CUBE_ID)
+    if not meta.get('hash'):
+        return False
+    blob_store.mark_missing(meta['hash'], cube_id)
+    if job['file_path'] or not os.path.exists(blob_store.path_for(meta['filename'])):
+        print(f"❌ Куб {cube_id} потерял {meta['filename']}, а копии на сервере нет")
+        return False
+    janitor.pin(meta['filename'])
+    queued = cubes.enqueue(cube_id, 'upload', data=job['data'], file_path=blob_store.path_for(meta['filename']),
+                           file_name=meta['filename'], timeout=job['timeout'], meta=meta)
+    if not queued:
+        janitor.unpin(meta['filename'])
+        return False
+    print(f"🔁 Куб {cube_id} вытеснил {meta['filename']} из кэша, шлём файл заново")
+    return True
+
+def on_command_delivered(job, response):
+    trace_delivered(job, True)
+
+def on_command_failed(job, response):
+    trace_delivered(job, False)
+
+def on_playlist_delivered(job, response):
+    """Куб принял плейлист и назвал файлы, которых у него нет."""
+    trace_delivered(job, True)
+    cube_id = job['meta'].get('cube_id', DEFAULT_CUBE_ID)
+    try:
+        missing = json.loads(job.get('reply') or '{}').get('missing') or []
+    except (ValueError, AttributeError):
+        missing = []
+    for file_hash in missing:
+        # Не доставленные ещё файлы уже в очереди; заново — только те, что Куб вытеснил
+        entry = blob_store.lookup(file_hash)
+        if entry and blob_store.delivered_to(entry, cube_id):
+            print(f"🔁 Куб {cube_id} потерял файл расписания {entry['filename']}, шлём заново")
+            push_playlist_asset(cube_id, file_hash, job['meta'].get('playlist'), stale=True)
+
+def on_playlist_failed(job, response):
+    trace_delivered(job, False)
+
+def notify_observer_async(filename, user_id, file_size, file_path, is_duplicate=False, image_data=None,
+                          content_hash=None, trace=None, cube_id=DEFAULT_CUBE_ID):
+    """Ставит отправку в очередь доставки одного Куба.
+
+    Если file_path=None, уходит только ссылка на файл, который уже есть на Кубе.
+    """
+    if not OBSERVER_ENABLED:
+        return
+    payload = {
+        "filename": filename,
+        "user_id": user_id,
+        "file_size": file_size,
+        "timestamp": datetime.now().isoformat(),
+        "is_duplicate": is_duplicate
+    }
+    if content_hash: payload["hash"] = content_hash
+    if image_data: payload.update(image_data)
+    meta = {"filename": filename, "hash": content_hash}
+    if trace:
+        payload.update(trace.fields())
+        meta.update(trace.fields(), trace_kind=trace.kind)
+
+    if file_path:
+        janitor.pin(filename)
+        print(f"🚀 [PUSH] В очередь {cube_id}: {filename}")
+    else:
+        print(f"🔁 [PUSH] Повтор по ссылке {cube_id}: {filename}")
+    queued = cubes.enqueue(cube_id, 'upload', data=payload, file_path=file_path, file_name=filename,
+                           timeout=30, meta=meta)
+    if file_path and not queued:
+        janitor.unpin(filename)
+        janitor.expire_in(filename, FAILED_TTL)
+
+def push_stored_file(entry, user_id, is_duplicate, image_data, trace=None, target=None):
+    """Отправляет файл из хранилища на Кубы target; кто уже получил его — только ссылку."""
+    filename = entry['filename']
+    has_file = blob_store.has_file(entry)
+    for cube_id in cubes.resolve(target or DEFAULT_TARGET):
+        if blob_store.delivered_to(entry, cube_id):
+            file_path = None
+        elif has_file:
+            file_path = blob_store.path_for(filename)
+        else:
+            print(f"⚠️ {filename}: на сервере копии нет, а Куб {cube_id} его не получал")
+            METRICS.inc('errors', stage='missing_blob', kind='upload', cube=cube_id)
+            continue
+        notify_observer_async(filename, user_id, entry['size'], file_path, is_duplicate, image_data,
+                              entry['hash'], trace, cube_id)
+    if trace:
+        trace.mark('queued')
+        trace.log()
+    # Учитываем файл после pin в notify_observer_async, чтобы квота его не вытеснила.
+    # track, а не touch: дубликат мог вернуть на диск копию, которую уборщик уже забыл
+    if has_file:
+        janitor.track(filename)
+
+# === РАСПИСАНИЯ СЦЕН ===
+def playlist_assets(playlist):
+    """Файлы, которые должны лежать в кэше Куба к слотам плейлиста: хэш -> имя."""
+    return {slot['file_hash']: slot['filename'] for slot in playlist['items'] if slot.get('file_hash')}
+
+def pin_playlist(playlist, pin=True):
+    # Пока плейлист не отыграл, копии на сервере нужны для новых Кубов и повторов
+    for filename in playlist_assets(playlist).values():
+        (janitor.pin if pin else janitor.unpin)(filename)
+
+def prune_playlists():
+    for playlist in playlists.prune():
+        pin_playlist(playlist, pin=False)
+
+def prepare_playlist(playlist, done):
+    """Картинки слотов готовятся для экрана Куба, как при загрузке; done(плейлист) — когда готовы все."""
+    slots = [slot for slot in playlist['items'] if slot['type'] == 'custom_image']
+    lock = threading.Lock()
+    left = [len(slots) + 1]  # +1 — пока цикл ниже ещё раздаёт работу
+
+    def finished():
+        with lock:
+            left[0] -= 1
+            if left[0]:
+                return
+        done(playlist)
+
+    def use(slot, entry, prerendered):
+        slot.update(file_hash=entry['hash'], filename=entry['filename'], prerendered=prerendered)
+
+    for slot in slots:
+        entry = blob_store.lookup(slot['hash'])
+        rendered = prerenderer.cached(slot['hash'], slot['brightness']) if prerenderer.enabled else None
+        if rendered and blob_store.has_file(rendered):
+            use(slot, rendered, True)
+        elif not prerenderer.enabled:
+            use(slot, entry, False)
+        else:
+            janitor.pin(entry['filename'])
+
+            def on_rendered(rendered, slot=slot, entry=entry):
+                janitor.unpin(entry['filename'])
+                if rendered:
+                    use(slot, rendered, True)
+                else:
+                    METRICS.inc('errors', stage='prerender', kind='playlist')
+                    use(slot, entry, False)
+                finished()
+
+            prerenderer.submit(entry, slot['brightness'], on_rendered)
+            continue
+        finished()
+    finished()
+
+def publish_playlist(playlist):
+    """Сохраняет подготовленный плейлист и рассылает его Кубам."""
+    stored, previous = playlists.put(playlist)
+    pin_playlist(stored)
+    if previous:
+        pin_playlist(previous, pin=False)
+    targets = sync_playlist(stored)
+    print(f"🗓️ Расписание {stored['id']} v{stored['version']}: {len(stored['items'])} слотов -> {', '.join(targets) or 'нет Кубов'}")
+
+def sync_playlist(playlist, cube_ids=None):
+    """Файлы и сам плейлист — в очереди Кубов; файл, который Куб уже получил, не шлётся."""
+    targets = cubes.resolve(playlist['target'])
+    if cube_ids is not None:
+        targets = [cube_id for cube_id in targets if cube_id in cube_ids]
+    for cube_id in targets:
+        for file_hash in playlist_assets(playlist):
+            push_playlist_asset(cube_id, file_hash, playlist['id'])
+        cubes.enqueue(cube_id, 'playlist', json_body=dict(playlist, type='playlist'), timeout=10,
+                      meta={"playlist": playlist['id'], "version": playlist['version']})
+    return targets
+
+def sync_cube_playlists(cube_id):
+    """Куб появился или сменил адрес: досылаем ему текущие расписания."""
+    prune_playlists()
+    for playlist in playlists.all():
+        sync_playlist(playlist, [cube_id])
+
+def push_playlist_asset(cube_id, file_hash, playlist_id, stale=False):
+    """Файл к будущему слоту: Куб только кладёт его в кэш (type=prefetch), ничего не играя."""
+    entry = blob_store.lookup(file_hash)
+    if entry is None:
+        print(f"⚠️ Расписание {playlist_id}: файла {file_hash[:12]} больше нет в хранилище")
+        return False
+    if blob_store.delivered_to(entry, cube_id):
+        if not stale:
+            return True
+        blob_store.mark_missing(file_hash, cube_id)
+    if not blob_store.has_file(entry):
+        print(f"⚠️ {entry['filename']}: на сервере копии нет, а Кубу {cube_id} она нужна для расписания")
+        METRICS.inc('errors', stage='missing_blob', kind='playlist', cube=cube_id)
+        return False
+    filename = entry['filename']
+    payload = {"type": "prefetch", "hash": file_hash, "filename": filename, "playlist": playlist_id}
+    janitor.pin(filename)
+    queued = cubes.enqueue(cube_id, 'upload', data=payload, file_path=blob_store.path_for(filename),
+                           file_name=filename, timeout=30, meta={"filename": filename, "hash": file_hash})
+    if not queued:
+        janitor.unpin(filename)
+    return queued
 
 def log_image_data(image_number, user_id, brightness, music_data, lighting_data, filename=None):
     entry = {
@@ -107,10 +381,16 @@ def log_image_data(image_number, user_id, brightness, music_data, lighting_data,
         "filename": filename,
         "type": "custom" if image_number == "0" else "static"
     }
+    event_log.append(entry)
+
+def parse_time_arg(value):
+    """unix-время или ISO-строка из query-параметра."""
+    if not value:
+        return None
     try:
-        with open(STATIC_IMAGES_LOG, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
-    except: pass
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
 
 # === РОУТЫ ===
 
@@ -119,9 +399,18 @@ def index():
     return jsonify({
         "status": "online",
         "mode": "PUSH AUTOMATIC",
-        "current_observer": OBSERVER_URL
+        "current_observer": cubes.url_of(DEFAULT_CUBE_ID),
+        "cubes": cubes.stats(),
+        "admission": admission.stats(),
+        "playlists": playlists.stats(),
+        "uploads": janitor.stats(),
+        "event_log": event_log.stats()
     })
 
+@app.route('/metrics')
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
 # 🔥 НОВЫЙ РОУТ ДЛЯ АВТО-ОБНОВЛЕНИЯ АДРЕСА
 @app.route('/admin/update_url', methods=['POST'])
 def update_observer_url():
@@ -137,52 +426,131 @@ def update_observer_url():
         if not new_url:
             return jsonify({"error": "No URL provided"}), 400
 
-        global OBSERVER_URL
-        OBSERVER_URL = new_url
-
-        # Сохраняем в файл, чтобы помнить после перезагрузки
-        with open(CONFIG_FILE, 'w') as f:
-            f.write(new_url)
+        # Без cube_id — единственный Куб, как до реестра; реестр сам сохраняется на диск
+        cube_id = data.get('cube_id') or DEFAULT_CUBE_ID
+        groups = data.get('groups')
+        if isinstance(groups, str):
+            groups = [g for g in groups.split(',') if g]
+        previous_url = cubes.url_of(cube_id)
+        try:
+            cube = cubes.register(cube_id, new_url, groups)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if new_url != previous_url:
+            # Новый Куб или перезапуск (новый туннель): пусть сверит расписания
+            sync_cube_playlists(cube_id)
 
-        print(f"♻️ АДРЕС КУБА ОБНОВЛЕН: {new_url}")
-        return jsonify({"message": "URL updated successfully", "new_url": new_url}), 200
+        print(f"♻️ АДРЕС КУБА {cube_id} ОБНОВЛЕН: {new_url}")
+        return jsonify({"message": "URL updated successfully", "new_url": new_url,
+                        "cube_id": cube_id, "groups": cube['groups']}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/admin/events', methods=['GET'])
+def recent_events():
+    """Последние события пользователя или за период без чтения всей истории."""
+    secret = request.headers.get('X-Admin-Secret') or request.args.get('secret')
+    if secret != ADMIN_SECRET:
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        since = parse_time_arg(request.args.get('since'))
+        until = parse_time_arg(request.args.get('until'))
+        limit = min(int(request.args.get('limit', 50)), 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    events = event_log.query(request.args.get('user_id'), since, until, limit)
+    return jsonify({"events": events, "count": len(events)}), 200
+
+@app.route('/admin/cubes', methods=['GET'])
+def list_cubes():
+    """Реестр Кубов: адрес, группы, здоровье и очередь доставки каждого."""
+    secret = request.headers.get('X-Admin-Secret') or request.args.get('secret')
+    if secret != ADMIN_SECRET:
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"cubes": cubes.stats()}), 200
+
+@app.route('/admin/playlists/media', methods=['POST'])
+def playlist_media():
+    """Файл для будущих слотов: только в хранилище, на Кубы уйдёт вместе с плейлистом."""
+    secret = request.headers.get('X-Admin-Secret') or request.args.get('secret')
+    if secret != ADMIN_SECRET:
+        return jsonify({"error": "Forbidden"}), 403
+    file = request.files.get('file')
+    if file is None or not allowed_file(file.filename):
+        return jsonify({"error": "No file"}), 400
+    entry, is_duplicate = blob_store.put_stream(file.stream, file.filename.rsplit('.', 1)[1].lower())
+    janitor.track(entry['filename'])
+    janitor.expire_in(entry['filename'], PLAYLIST_MEDIA_TTL)
+    # Срок в индексе — чтобы уборщик после перезапуска не снёс файл через FAILED_TTL
+    blob_store.keep(entry['hash'], time.time() + PLAYLIST_MEDIA_TTL)
+    return jsonify({"hash": entry['hash'], "filename": entry['filename'], "size": entry['size'],
+                    "duplicate": is_duplicate}), 200
+
+@app.route('/admin/playlists', methods=['GET', 'POST'])
+def admin_playlists():
+    """GET — расписания и сколько слотов впереди; POST — создать или заменить плейлист."""
+    secret = request.headers.get('X-Admin-Secret') or request.args.get('secret')
+    if secret != ADMIN_SECRET:
+        return jsonify({"error": "Forbidden"}), 403
+    prune_playlists()
+    if request.method == 'GET':
+        return jsonify({"playlists": playlists.stats()}), 200
+    try:
+        playlist = parse_playlist(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    for slot in playlist['items']:
+        if slot['type'] != 'custom_image':
+            continue
+        entry = blob_store.lookup(slot['hash'])
+        if entry is None or not blob_store.has_file(entry):
+            return jsonify({"error": f"нет файла {slot['hash'][:12]}: загрузите его в /admin/playlists/media"}), 400
+    prepare_playlist(playlist, publish_playlist)
+    return jsonify({"status": "accepted", "id": playlist['id'], "slots": len(playlist['items']),
+                    "cubes": cubes.resolve(playlist['target'])}), 202
+
+@app.route('/admin/playlists/<playlist_id>', methods=['GET', 'DELETE'])
+def admin_playlist(playlist_id):
+    secret = request.headers.get('X-Admin-Secret') or request.args.get('secret')
+    if secret != ADMIN_SECRET:
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == 'GET':
+        playlist = playlists.get(playlist_id)
+        return (jsonify(playlist), 200) if playlist else (jsonify({"error": "Not found"}), 404)
+    playlist = playlists.remove(playlist_id)
+    if playlist is None:
+        return jsonify({"error": "Not found"}), 404
+    pin_playlist(playlist, pin=False)
+    # Пустой плейлист с новой версией снимает расписание с Куба
+    removal = {"type": "playlist", "id": playlist_id, "items": [],
+               "version": max(int(time.time() * 1000), playlist['version'] + 1)}
+    targets = cubes.resolve(playlist['target'])
+    for cube_id in targets:
+        cubes.enqueue(cube_id, 'playlist', json_body=removal, timeout=10, meta={"playlist": playlist_id})
+    return jsonify({"status": "removed", "id": playlist_id, "cubes": targets}), 200
+
 @app.route('/upload', methods=['POST'])
 def upload():
+    METRICS.inc('requests', route='upload')
+    trace = Trace('upload')
+    # Отказ по нагрузке — до чтения тела; user_id в заголовке позволяет отказать и ему
+    early_user = upload_early_user(request.headers, request.args)
+    rejected = upload_admit(early_user, request.remote_addr) if early_user else upload_precheck()
+    if rejected:
+        body, status, headers = rejected
+        return jsonify(body), status, headers
     try:
-        image_number = request.form.get('image_number')
-        user_id = request.form.get('user_id', 'anon')
-        brightness = request.form.get('brightness', '0.7')
-        music_data = request.form.get('music_data', 'off')
-        lighting_data = request.form.get('lighting_data', 'off')
+        if not early_user:
+            rejected = upload_admit(request.form.get('user_id'), request.remote_addr)
+            if rejected:
+                body, status, headers = rejected
+                return jsonify(body), status, headers
 
         # Статика (1, 2, 3)
-        if image_number and image_number in ['1', '2', '3']:
-            log_image_data(image_number, user_id, brightness, music_data, lighting_data)
-            
-            # Отправка команды без файла
-            def send_cmd():
-                try:
-                    payload = {
-                        "type": "static_image",
-                        "image_number": image_number,
-                        "brightness": float(brightness),
-                        "music_data": music_data,
-                        "lighting_data": lighting_data,
-                        "filename": f"static_{image_number}",
-                        "user_id": user_id
-                    }
-                    requests.post(OBSERVER_URL, json=payload, timeout=10)
-                except Exception as e:
-                    print(f"Ошибка отправки команды: {e}")
-            
-            if OBSERVER_ENABLED:
-                threading.Thread(target=send_cmd, daemon=True).start()
-                
-            return jsonify({"status": "sent"}), 200
+        if is_static_command(request.form):
+            body, status = upload_static(request.form, trace)
+            return jsonify(body), status
 
         # Файл
         if 'file' not in request.files: return jsonify({'error': 'No file'}), 400
@@ -190,30 +558,194 @@ def upload():
         if file.filename == '': return jsonify({'error': 'Empty'}), 400
         if not allowed_file(file.filename): return jsonify({'error': 'Type'}), 400
 
-        data = file.read()
-        h = file_hash(data)
-        safe_name = secure_filename(file.filename)
-        filename = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{h[:6]}_{safe_name}"
-        
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(save_path, "wb") as f:
-            f.write(data)
-
-        log_image_data("0", user_id, brightness, music_data, lighting_data, filename)
-        
-        image_data = {
-            "image_number": "0", "brightness": float(brightness),
-            "music_data": music_data, "lighting_data": lighting_data,
-            "type": "custom_image"
-        }
-        
-        notify_observer_async(filename, user_id, os.path.getsize(save_path), data, False, image_data)
-
-        return jsonify({"status": "ok", "filename": filename}), 200
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        entry, is_duplicate = blob_store.put_stream(file.stream, ext)
+        body, status = upload_stored(entry, is_duplicate, request.form, trace)
+        return jsonify(body), status
 
     except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({'error': str(e)}), 500
+        body, status = upload_error(e, trace)
+        return jsonify(body), status
+
+# === ОБРАБОТКА ЗАГРУЗКИ (общая для Flask и async_app.py) ===
+def upload_early_user(headers, args):
+    return headers.get('X-User-Id') or args.get('user_id')
+
+def upload_precheck():
+    return upload_rejected(admission.precheck())
+
+def upload_admit(user_id, remote_addr):
+    # Без user_id все анонимы делили бы один бакет — различаем их по адресу
+    key = user_id if user_id and user_id != 'anon' else f"anon:{remote_addr}"
+    return upload_rejected(admission.admit(key))
+
+def upload_rejected(rejection):
+    """Отказ допуска -> (тело, статус, заголовки) или None."""
+    if not rejection:
+        return None
+    status, reason, retry_after = rejection
+    METRICS.inc('rejected', route='upload', reason=reason)
+    error = 'Too many uploads' if status == 429 else 'Server busy'
+    return {'error': error, 'reason': reason, 'retry_after': retry_after}, status, {'Retry-After': str(retry_after)}
+
+def is_static_command(form):
+    image_number = form.get('image_number')
+    return bool(image_number) and image_number in ['1', '2', '3']
+
+def upload_static(form, trace):
+    """Статическая сцена: запись в журнал и команда Кубам без файла."""
+    image_number = form.get('image_number')
+    user_id = form.get('user_id', 'anon')
+    brightness = form.get('brightness', '0.7')
+    music_data = form.get('music_data', 'off')
+    lighting_data = form.get('lighting_data', 'off')
+
+    trace.kind = 'static'
+    log_image_data(image_number, user_id, brightness, music_data, lighting_data)
+
+    # Отправка команды без файла
+    if OBSERVER_ENABLED:
+        payload = {
+            "type": "static_image",
+            "image_number": image_number,
+            "brightness": float(brightness),
+            "music_data": music_data,
+            "lighting_data": lighting_data,
+            "filename": f"static_{image_number}",
+            "user_id": user_id,
+            **trace.fields()
+        }
+        for cube_id in cubes.resolve(form.get('cube') or DEFAULT_TARGET):
+            cubes.enqueue(cube_id, 'command', json_body=payload, timeout=10,
+                          meta=dict(trace.fields(), trace_kind=trace.kind))
+        trace.mark('queued')
+        trace.log()
+
+    return {"status": "sent"}, 200
+
+def upload_stored(entry, is_duplicate, form, trace):
+    """Файл уже в хранилище: журнал, подготовка картинки и отправка на Кубы."""
+    user_id = form.get('user_id', 'anon')
+    target = form.get('cube') or DEFAULT_TARGET
+    brightness = form.get('brightness', '0.7')
+    music_data = form.get('music_data', 'off')
+    lighting_data = form.get('lighting_data', 'off')
+
+    filename = entry['filename']
+    trace.mark('stored')
+    if is_duplicate:
+        print(f"♊ Дубликат: {filename} (повтор №{entry['hits']})")
+
+    log_image_data("0", user_id, brightness, music_data, lighting_data, filename)
+
+    image_data = {
+        "image_number": "0", "brightness": float(brightness),
+        "music_data": music_data, "lighting_data": lighting_data,
+        "type": "custom_image"
+    }
+    response = {"status": "ok", "filename": filename, "duplicate": is_duplicate}
+
+    if not prerenderer.enabled:
+        push_stored_file(entry, user_id, is_duplicate, image_data, trace=trace, target=target)
+        return response, 200
+
+    # Без явной яркости картинка не меняется — как раньше на Кубе (brightness 0 в mpv)
+    render_brightness = float(form['brightness']) if form.get('brightness') else NEUTRAL_BRIGHTNESS
+    rendered = prerenderer.cached(entry['hash'], render_brightness)
+    if rendered:
+        push_stored_file(rendered, user_id, is_duplicate, dict(image_data, prerendered=True), trace=trace,
+                         target=target)
+        janitor.touch(filename)
+        return response, 200
+
+    # Исходник держим, пока процесс-рендерер его читает
+    janitor.pin(filename)
+    janitor.track(filename)
+
+    def on_rendered(rendered):
+        janitor.unpin(filename)
+        janitor.expire_in(filename, FAILED_TTL)
+        if rendered:
+            trace.mark('prerendered')
+            push_stored_file(rendered, user_id, is_duplicate, dict(image_data, prerendered=True),
+                             trace=trace, target=target)
+        else:
+            trace.mark('prerender_failed')
+            METRICS.inc('errors', stage='prerender', kind='upload')
+            push_stored_file(entry, user_id, is_duplicate, image_data, trace=trace, target=target)
+
+    prerenderer.submit(entry, render_brightness, on_rendered)
+    return response, 200
+
+def upload_error(e, trace):
+    print(f"Error: {e}")
+    METRICS.inc('errors', stage='upload', kind=trace.kind)
+    return {'error': str(e)}, 500
+
+services_lock = threading.Lock()
+services_lock_file = None  # Открытый SERVICES_LOCK_FILE с flock, пока процесс жив
+
+def claim_services_lock():
+    """Блокировка журналов на весь процесс; RuntimeError, если их уже ведёт другой."""
+    lock_file = open(SERVICES_LOCK_FILE, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.seek(0)
+        owner = lock_file.read().strip() or '?'
+        lock_file.close()
+        raise RuntimeError(f"Журналы в {BASE_DIR} уже ведёт процесс {owner}: "
+                           "нужен один рабочий процесс (uWSGI: processes = 1, threads = N)")
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+def start_services():
+    """Фоновые службы: журнал, уборщик и доставка на Кубы. Повторный вызов ничего не делает.
+
+    Outbox, индекс хранилища и журнал событий ведёт ровно один процесс:
+    второй переиграл бы те же задачи outbox (Куб получил бы их дважды) и
+    затирал бы индекс. Поэтому службы держат flock на SERVICES_LOCK_FILE,
+    и второй процесс с тем же GOLO_BASE_DIR получает RuntimeError.
+    """
+    global services_lock_file
+    with services_lock:
+        if services_lock_file is not None:
+            return
+        services_lock_file = claim_services_lock()
+        _start_services()
+
+def _start_services():
+    # Первым: процессы рендера форкаются, пока других потоков нет
+    prerenderer.start()
+    cubes.on('upload', on_upload_delivered, on_upload_failed)
+    cubes.on('command', on_command_delivered, on_command_failed)
+    cubes.on('playlist', on_playlist_delivered, on_playlist_failed)
+    event_log.start()
+    janitor.start()
+    for pending in cubes.pending_files():
+        janitor.pin(pending)
+    prune_playlists()
+    for playlist in playlists.all():
+        pin_playlist(playlist)
+    cubes.start()
+
+# Не при импорте: uWSGI грузит модуль в мастере до fork, и потоки служб
+# вместе с пулом рендера остались бы в мастере. Под uWSGI службы стартуют в
+# рабочем процессе сразу после fork, под другими серверами — на первом
+# запросе. В async-режиме их запускает async_app.py в своём цикле событий.
+try:
+    from uwsgidecorators import postfork
+    postfork(start_services)
+except ImportError:
+    pass
+
+@app.before_request
+def ensure_services():
+    if services_lock_file is None:
+        start_services()
 
 if __name__ == '__main__':
+    start_services()  # До потоков dev-сервера — ради fork рендереров
     app.run()
\ No newline at end of file
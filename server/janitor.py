@@ -0,0 +1,169 @@
+import os
+import time
+import heapq
+import threading
+
+
+class UploadJanitor:
+    """Один фоновый поток, который чистит папку загрузок.
+
+    Держит кучу сроков удаления (вместо отдельного спящего потока на файл) и
+    квоту по байтам и количеству файлов: при превышении удаляются давно не
+    использованные файлы (LRU). Закреплённые файлы (ещё не доставлены на Куб)
+    не вытесняются. При старте состояние собирается заново по содержимому папки.
+    """
+
+    def __init__(self, folder, max_bytes, max_files, orphan_ttl=60, sweep_interval=30, on_remove=None,
+                 restore_deadline=None):
+        self.folder = folder
+        self.on_remove = on_remove  # (имя) после удаления файла — чтобы индекс хранилища не копил мёртвые записи
+        self.restore_deadline = restore_deadline  # (имя) -> срок, до которого файл нужен и после перезапуска, или None
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.orphan_ttl = orphan_ttl
+        self.sweep_interval = sweep_interval
+
+        self.cond = threading.Condition()
+        self.files = {}      # имя -> {"size": байты, "last_used": время}
+        self.deadlines = {}  # имя -> время удаления
+        self.heap = []       # (время удаления, имя); устаревшие записи пропускаются
+        self.pinned = {}     # имя -> число держателей
+        self.total_bytes = 0
+        self.counters = {"expired": 0, "evicted": 0}
+        self.started = False
+
+    # --- ПУБЛИЧНОЕ API ---
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self._rebuild()
+        threading.Thread(target=self._loop, name="upload-janitor", daemon=True).start()
+
+    def track(self, filename):
+        """Учитывает новый или повторно использованный файл и проверяет квоту."""
+        path = os.path.join(self.folder, filename)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self.cond:
+            old = self.files.get(filename)
+            if old:
+                self.total_bytes -= old["size"]
+            self.files[filename] = {"size": size, "last_used": time.time()}
+            self.total_bytes += size
+            self.cond.notify()
+
+    def touch(self, filename):
+        with self.cond:
+            if filename in self.files:
+                self.files[filename]["last_used"] = time.time()
+
+    def expire_in(self, filename, delay):
+        """Удалить файл через delay секунд (заменяет прежний срок)."""
+        with self.cond:
+            deadline = time.time() + delay
+            self.deadlines[filename] = deadline
+            heapq.heappush(self.heap, (deadline, filename))
+            self.cond.notify()
+
+    def pin(self, filename):
+        with self.cond:
+            self.pinned[filename] = self.pinned.get(filename, 0) + 1
+            # Пока файл нужен, его срок не действует
+            self.deadlines.pop(filename, None)
+
+    def unpin(self, filename):
+        with self.cond:
+            left = self.pinned.get(filename, 0) - 1
+            if left > 0:
+                self.pinned[filename] = left
+            else:
+                self.pinned.pop(filename, None)
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "files": len(self.files),
+                "bytes": self.total_bytes,
+                "pinned": len(self.pinned),
+                "max_files": self.max_files,
+                "max_bytes": self.max_bytes,
+                **self.counters,
+            }
+
+    # --- ВНУТРЕННЕЕ ---
+    def _rebuild(self):
+        now = time.time()
+        with self.cond:
+            for name in os.listdir(self.folder):
+                path = os.path.join(self.folder, name)
+                if name.startswith('.') or not os.path.isfile(path):
+                    continue
+                st = os.stat(path)
+                self.files[name] = {"size": st.st_size, "last_used": st.st_mtime}
+                self.total_bytes += st.st_size
+                # Хвосты после падения: через orphan_ttl удалим, если никто не закрепит.
+                # Файлу со своим сроком (например, для расписания) оставляем его срок
+                deadline = now + self.orphan_ttl
+                kept_until = self.restore_deadline(name) if self.restore_deadline else None
+                if kept_until:
+                    deadline = max(deadline, kept_until)
+                self.deadlines[name] = deadline
+                heapq.heappush(self.heap, (deadline, name))
+        print(f"🧹 Уборщик: {len(self.files)} файлов, {self.total_bytes / 1024 / 1024:.1f} МБ")
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                self._expire_due()
+                self._enforce_quota()
+                wait = self.sweep_interval
+                if self.heap:
+                    wait = max(0.0, min(wait, self.heap[0][0] - time.time()))
+                self.cond.wait(wait)
+
+    def _expire_due(self):
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, name = heapq.heappop(self.heap)
+            if self.deadlines.get(name) != deadline or name in self.pinned:
+                continue
+            del self.deadlines[name]
+            if self._remove(name):
+                self.counters["expired"] += 1
+                print(f"🗑️ Удален: {name}")
+
+    def _enforce_quota(self):
+        if self.total_bytes <= self.max_bytes and len(self.files) <= self.max_files:
+            return
+        candidates = sorted(
+            (info["last_used"], name) for name, info in self.files.items() if name not in self.pinned
+        )
+        for _, name in candidates:
+            if self.total_bytes <= self.max_bytes and len(self.files) <= self.max_files:
+                break
+            self.deadlines.pop(name, None)
+            if self._remove(name):
+                self.counters["evicted"] += 1
+                print(f"🗑️ Вытеснен по квоте: {name}")
+
+    def _remove(self, name):
+        info = self.files.pop(name, None)
+        if info:
+            self.total_bytes -= info["size"]
+        try:
+            os.remove(os.path.join(self.folder, name))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"❌ Ошибка удаления {name}: {e}")
+            return False
+        if self.on_remove:
+            try:
+                self.on_remove(name)
+            except Exception as e:
+                print(f"⚠️ Уборщик: ошибка on_remove {name}: {e}")
+        return True
@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import heapq
+import queue
+import uuid
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+BLOB_CHUNK_SIZE = 1024 * 1024        # Кусок докачки через /media/<хэш>
+BLOB_CHUNKED_FROM = 2 * 1024 * 1024  # Файлы больше уходят кусками, меньше — в самом событии
+
+
+class MultipartFileBody:
+    """multipart/form-data тело, которое читает файл с диска по кускам.
+
+    requests.post(files=...) собирает всё тело в памяти; этот объект отдаёт
+    поля формы, затем файл кусками по CHUNK_SIZE, и заранее знает длину,
+    поэтому запрос уходит с обычным Content-Length.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields, field_name, file_name, file_path, mimetype):
+        self.boundary = uuid.uuid4().hex
+        self.file_path = file_path
+        head = []
+        for key, value in (fields or {}).items():
+            head.append(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{key}"\r\n\r\n'
+                f'{value}\r\n'
+            )
+        head.append(
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'
+        )
+        self.head = ''.join(head).encode('utf-8')
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.length = len(self.head) + os.path.getsize(file_path) + len(self.tail)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        yield self.head
+        with open(self.file_path, 'rb') as fh:
+            while True:
+                chunk = fh.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+
+class DeliveryOutbox:
+    """Очередь доставки на Куб с пулом воркеров и журналом на диске.
+
+    Каждое событие сначала пишется в папку outbox (один JSON на задачу), затем
+    отправляется одним из воркеров через общий keep-alive Session. Неудачи
+    повторяются с экспоненциальной задержкой. Всё, что не успело уйти до
+    перезапуска, отправляется заново при старте.
+
+    Файл с хэшем в meta сначала сверяется с кэшем Куба (/media/have): если
+    он там есть, уходит только событие. Большие файлы заливаются кусками и
+    после обрыва докачиваются с того места, где Куб остановился.
+    """
+
+    def __init__(self, folder, url_getter, workers=4, max_queue=500,
+                 max_attempts=6, backoff_base=2.0, backoff_max=60.0, on_attempt=None):
+        self.folder = folder
+        self.url_getter = url_getter
+        self.on_attempt = on_attempt  # (ok, подробности) после каждой попытки — для здоровья Куба
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.retry_heap = []  # (время следующей попытки, id, задача)
+        self.retry_cond = threading.Condition()
+        self.handlers = {}    # kind -> (on_success, on_failure)
+        self.started = False
+        self.blob_support = {}  # адрес Куба -> умеет ли он /media (старые Кубы — нет)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.stats_lock = threading.Lock()
+        self.counters = {
+            "enqueued": 0, "delivered": 0, "failed": 0,
+            "retried": 0, "dropped": 0, "in_flight": 0,
+            "blob_cached": 0, "blob_chunks": 0,
+        }
+        self.latency = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+
+        os.makedirs(self.folder, exist_ok=True)
+
+    # --- ПУБЛИЧНОЕ API ---
+    def on(self, kind, on_success=None, on_failure=None):
+        """Обработчики результата по типу задачи (переживают перезапуск)."""
+        self.handlers[kind] = (on_success, on_failure)
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        self._replay()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"outbox-{i}", daemon=True).start()
+        threading.Thread(target=self._retry_loop, name="outbox-retry", daemon=True).start()
+
+    def enqueue(self, kind, data=None, json_body=None, file_path=None, file_name=None,
+                mimetype='image/jpeg', timeout=30, meta=None):
+        """Ставит задачу в очередь. Возвращает False, если очередь переполнена."""
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "data": data,
+            "json": json_body,
+            "file_path": file_path,
+            "file_name": file_name,
+            "mimetype": mimetype,
+            "timeout": timeout,
+            "meta": meta or {},
+            "attempts": 0,
+            "created": time.time(),
+        }
+        self._persist(job)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._discard(job)
+            self._count("dropped")
+            print(f"⛔ Очередь доставки переполнена, событие отброшено: {kind}")
+            return False
+        self._count("enqueued")
+        return True
+
+    def pending_files(self):
+        """Имена файлов, которые ждут отправки в журнале на диске."""
+        names = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.folder, name), 'r') as f:
+                    job = json.load(f)
+            except Exception:
+                continue
+            if job.get('file_path'):
+                names.append(job['file_name'])
+        return names
+
+    def stats(self):
+        with self.stats_lock:
+            counters = dict(self.counters)
+            lat = dict(self.latency)
+        with self.retry_cond:
+            waiting_retry = len(self.retry_heap)
+        avg = lat["total_ms"] / lat["count"] if lat["count"] else 0.0
+        return {
+            "queue_depth": self.queue.qsize(),
+            "waiting_retry": waiting_retry,
+            "workers": self.workers,
+            **counters,
+            "latency_ms": {
+                "avg": round(avg, 1),
+                "max": round(lat["max_ms"], 1),
+                "last": round(lat["last_ms"], 1),
+            },
+        }
+
+    # --- ЖУРНАЛ НА ДИСКЕ ---
+    def _job_path(self, job):
+        return os.path.join(self.folder, f"{job['id']}.json")
+
+    def _persist(self, job):
+        path = self._job_path(job)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _discard(self, job):
+        try:
+            os.remove(self._job_path(job))
+        except FileNotFoundError:
+            pass
+
+    def _replay(self):
+        jobs = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    jobs.append(json.load(f))
+            except Exception as e:
+                print(f"⚠️ Битая задача в outbox {name}: {e}")
+                os.remove(path)
+        jobs.sort(key=lambda j: j.get('created', 0))
+        for job in jobs:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                break  # Остальное останется на диске до следующего старта
+        if jobs:
+            print(f"📬 Outbox: восстановлено {len(jobs)} недоставленных событий")
+
+    # --- ДОСТАВКА ---
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            self._count("in_flight", 1)
+            try:
+                self._deliver(job)
+            except Exception as e:
+                print(f"❌ Outbox: ошибка воркера: {e}")
+            finally:
+                self._count("in_flight", -1)
+
+    def _deliver(self, job):
+        url = self._begin_attempt(job)
+        if url is None:
+            return
+
+        started = time.time()
+        try:
+            if job['file_path'] and not self._push_blob(job, url):
+                body = MultipartFileBody(job['data'], 'file', job['file_name'],
+                                         job['file_path'], job['mimetype'])
+                r = self.session.post(url, data=body, headers={'Content-Type': body.content_type},
+                                      timeout=job['timeout'])
+            elif job['json'] is not None:
+                r = self.session.post(url, json=job['json'], timeout=job['timeout'])
+            else:
+                r = self.session.post(url, data=job['data'], timeout=job['timeout'])
+        except Exception as e:
+            # Не только обрыв связи: битый JSON или ответ Куба без нужного поля
+            # тоже уходят в повтор, иначе задача пропала бы до перезапуска
+            self._on_error(job, e)
+            return
+        self._on_response(job, r.status_code, r.text, r, started)
+
+    def _push_blob(self, job, url):
+        """Кладёт файл задачи в кэш Куба. False — файл надо слать в самом событии."""
+        h = job['meta'].get('hash')
+        if not h or self.blob_support.get(url) is False:
+            return False
+        media_url = self._media_url(url)
+        r = self.session.post(f"{media_url}/have", json={"hashes": [h]}, timeout=job['timeout'])
+        if not self._blob_reply(url, r.status_code):
+            return False
+        r.raise_for_status()
+        reply = r.json()
+        if h in reply.get('have', []):
+            self._count("blob_cached")
+            return True
+        size = os.path.getsize(job['file_path'])
+        if size < BLOB_CHUNKED_FROM:
+            return False
+        offset = reply.get('partial', {}).get(h, 0)
+        with open(job['file_path'], 'rb') as fh:
+            while offset < size:
+                fh.seek(offset)
+                chunk = fh.read(BLOB_CHUNK_SIZE)
+                r = self.session.put(f"{media_url}/{h}", params={"ext": self._blob_ext(job)}, data=chunk,
+                                     headers={"Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{size}"},
+                                     timeout=job['timeout'])
+                # 416 — Куб докачал другое число байт: продолжаем с его места
+                if r.status_code != 416:
+                    r.raise_for_status()
+                offset = r.json()['received']
+                self._count("blob_chunks")
+        print(f"📦 Файл залит в кэш Куба кусками: {job['file_name']}")
+        return True
+
+    def _media_url(self, url):
+        # http://<туннель>/webhook -> http://<туннель>/media
+        return url.rsplit('/', 1)[0] + '/media'
+
+    def _blob_ext(self, job):
+        return (job['file_name'] or '').rsplit('.', 1)[-1].lower() or 'jpg'
+
+    def _blob_reply(self, url, status_code):
+        """Запоминает, умеет ли Куб по этому адресу /media; 404 — старая версия."""
+        if status_code == 404:
+            if self.blob_support.get(url) is not False:
+                print(f"ℹ️ Куб без кэша /media, файлы уходят целиком: {url}")
+            self.blob_support[url] = False
+            return False
+        self.blob_support[url] = True
+        return True
+
+    def _begin_attempt(self, job):
+        """Новая попытка: адрес Куба или None, если слать сейчас нечего/некуда."""
+        job['attempts'] += 1
+        url = self.url_getter()
+        # Если адрес пустой или локальный, нет смысла слать — ждём обновления адреса
+        if not url or 'localhost' in url or '127.0.0.1' in url:
+            print(f"⚠️ Отправка отложена, адрес не настроен: {url}")
+            self._schedule_retry(job)
+            return None
+        if job['file_path'] and not os.path.exists(job['file_path']):
+            print(f"❌ Файл для отправки пропал: {job['file_path']}")
+            self._finish(job, None, ok=False)
+            return None
+        return url
+
+    def _on_error(self, job, error):
+        print(f"⚠️ Ошибка доставки на Куб ({job['kind']}, попытка {job['attempts']}): {error!r}")
+        self._report_attempt(False, error)
+        self._schedule_retry(job)
+
+    def _on_response(self, job, status_code, text, response, started):
+        rtt_ms = (time.time() - started) * 1000
+        job['status'] = status_code  # Для обработчиков: 409 — у Куба нет файла по ссылке
+        job['reply'] = text          # ...и тело ответа (aiohttp-ответ к обработчику уже закрыт)
+        # Куб ответил — значит жив, даже если не принял именно это событие
+        self._report_attempt(status_code < 500, f"HTTP {status_code}")
+        if 200 <= status_code < 300:
+            self._record_latency((time.time() - job['created']) * 1000)
+            print(f"✅ Доставлено: {job['kind']} за {rtt_ms:.0f} мс")
+            self._finish(job, response, ok=True)
+        elif 400 <= status_code < 500 and status_code not in (408, 429):
+            print(f"❌ Ошибка клиента: {status_code} - {text}")
+            self._finish(job, response, ok=False)
+        else:
+            print(f"⚠️ Куб ответил {status_code}, повторим")
+            self._schedule_retry(job)
+
+    def _report_attempt(self, ok, detail):
+        if self.on_attempt:
+            try:
+                self.on_attempt(ok, detail)
+            except Exception as e:
+                print(f"⚠️ Outbox: ошибка on_attempt: {e}")
+
+    def _finish(self, job, response, ok):
+        self._discard(job)
+        self._count("delivered" if ok else "failed")
+        on_success, on_failure = self.handlers.get(job['kind'], (None, None))
+        handler = on_success if ok else on_failure
+        if handler:
+            try:
+                handler(job, response)
+            except Exception as e:
+                print(f"⚠️ Outbox: ошибка обработчика {job['kind']}: {e}")
+
+    # --- ПОВТОРЫ ---
+    def _schedule_retry(self, job):
+        if job['attempts'] >= self.max_attempts:
+            print(f"❌ Событие {job['kind']} не доставлено после {job['attempts']} попыток")
+            self._finish(job, None, ok=False)
+            return
+        delay = min(self.backoff_base * (2 ** max(job['attempts'] - 1, 0)), self.backoff_max)
+        self._persist(job)
+        self._count("retried")
+        with self.retry_cond:
+            heapq.heappush(self.retry_heap, (time.time() + delay, job['id'], job))
+            self.retry_cond.notify()
+
+    def _retry_loop(self):
+        while True:
+            with self.retry_cond:
+                while not self.retry_heap:
+                    self.retry_cond.wait()
+                due, _, job = self.retry_heap[0]
+                wait = due - time.time()
+                if wait > 0:
+                    self.retry_cond.wait(wait)
+                    continue
+                heapq.heappop(self.retry_heap)
+            self.queue.put(job)
+
+    # --- СЧЁТЧИКИ ---
+    def _count(self, name, delta=1):
+        with self.stats_lock:
+            self.counters[name] += delta
+
+    def _record_latency(self, ms):
+        with self.stats_lock:
+            self.latency["count"] += 1
+            self.latency["total_ms"] += ms
+            self.latency["last_ms"] = ms
+            self.latency["max_ms"] = max(self.latency["max_ms"], ms)
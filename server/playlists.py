@@ -0,0 +1,176 @@
+import os
+import re
+import math
+import json
+import time
+import threading
+from datetime import datetime
+
+PLAYLIST_ID_RE = re.compile(r'^[0-9A-Za-z_-]{1,64}$')
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+SLOT_TYPES = ('static_image', 'custom_image', 'stop')
+STATIC_NUMBERS = ('1', '2', '3')
+MAX_SLOTS = 500
+DEFAULT_BRIGHTNESS = 1.0  # Множитель яркости пререндера: картинка как есть
+
+
+def slot_time(value):
+    """Время слота: unix-время (число или строка) или ISO-строка."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise ValueError(f"непонятное время слота: {value!r}")
+
+
+def parse_playlist(data):
+    """Плейлист из запроса в виде, который хранится и уходит на Куб.
+
+    {"id": "evening", "target": "group:hall_a", "items": [
+        {"at": "2025-05-01T18:00:00", "type": "static_image", "image_number": "2"},
+        {"at": 1746115500, "type": "custom_image", "hash": "<sha256>", "brightness": 0.9},
+        {"at": "2025-05-01T19:00:00", "type": "stop"}]}
+
+    ValueError — с причиной, которую можно вернуть клиенту как есть.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("ожидался JSON-объект")
+    playlist_id = str(data.get('id') or '')
+    if not PLAYLIST_ID_RE.match(playlist_id):
+        raise ValueError("id: латиница, цифры, _ и -, до 64 символов")
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError("items: нужен непустой список слотов")
+    if len(items) > MAX_SLOTS:
+        raise ValueError(f"items: не больше {MAX_SLOTS} слотов")
+
+    slots = []
+    for n, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"слот {n}: ожидался объект")
+        slot_type = item.get('type')
+        if slot_type not in SLOT_TYPES:
+            raise ValueError(f"слот {n}: type одно из {', '.join(SLOT_TYPES)}")
+        slot = {"at": slot_time(item.get('at')), "type": slot_type}
+        if slot_type == 'static_image':
+            slot["image_number"] = str(item.get('image_number', ''))
+            if slot["image_number"] not in STATIC_NUMBERS:
+                raise ValueError(f"слот {n}: image_number одно из {', '.join(STATIC_NUMBERS)}")
+        elif slot_type == 'custom_image':
+            slot["hash"] = str(item.get('hash', ''))
+            if not HASH_RE.match(slot["hash"]):
+                raise ValueError(f"слот {n}: hash — sha256 файла из /admin/playlists/media")
+        if slot_type != 'stop':
+            slot["brightness"] = slot_brightness(item.get('brightness', DEFAULT_BRIGHTNESS), n)
+            slot["music_data"] = str(item.get('music_data', 'off'))
+            slot["lighting_data"] = str(item.get('lighting_data', 'off'))
+        slots.append(slot)
+
+    slots.sort(key=lambda slot: slot['at'])
+    return {"id": playlist_id, "target": str(data.get('target') or 'all'),
+            "name": str(data.get('name') or playlist_id), "items": slots}
+
+
+def slot_brightness(value, n):
+    try:
+        brightness = float(value)
+    except (TypeError, ValueError):
+        brightness = math.nan
+    if not math.isfinite(brightness):
+        raise ValueError(f"слот {n}: brightness — число, 1.0 — без изменений")
+    return brightness
+
+
+def playlist_end(playlist):
+    return playlist['items'][-1]['at'] if playlist['items'] else 0.0
+
+
+class PlaylistStore:
+    """Расписания сцен, которые сервер заранее рассылает Кубам.
+
+    Плейлист — слоты с абсолютным временем начала; каждый слот играет до
+    следующего. Переключает сцены сам Куб по своим часам, сервер только
+    хранит плейлисты в JSON и досылает их (с файлами) Кубам, которые
+    появились или сменили адрес. version растёт с каждым изменением, чтобы
+    Куб не откатился на старую копию, пришедшую повтором из outbox.
+    Плейлист забывается через expire_after секунд после последнего слота.
+    """
+
+    def __init__(self, path, expire_after=3600):
+        self.path = path
+        self.expire_after = expire_after
+        self.lock = threading.Lock()
+        self.playlists = {}  # id -> плейлист
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self.playlists = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Файл расписаний повреждён, начинаем с нуля: {e}")
+            self.playlists = {}
+            return
+        print(f"🗓️ Расписания: {', '.join(sorted(self.playlists)) or 'пусто'}")
+
+    def _save(self):
+        with self.lock:
+            data = {playlist_id: dict(playlist) for playlist_id, playlist in self.playlists.items()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def put(self, playlist):
+        """Сохраняет плейлист с новой версией. Возвращает (новый, прежний или None)."""
+        with self.lock:
+            previous = self.playlists.get(playlist['id'])
+            version = int(time.time() * 1000)
+            if previous and version <= previous['version']:
+                version = previous['version'] + 1
+            playlist = dict(playlist, version=version, updated=time.time())
+            self.playlists[playlist['id']] = playlist
+        self._save()
+        return dict(playlist), previous
+
+    def get(self, playlist_id):
+        with self.lock:
+            playlist = self.playlists.get(playlist_id)
+            return dict(playlist) if playlist else None
+
+    def remove(self, playlist_id):
+        with self.lock:
+            playlist = self.playlists.pop(playlist_id, None)
+        if playlist:
+            self._save()
+        return playlist
+
+    def all(self):
+        with self.lock:
+            return [dict(playlist) for _, playlist in sorted(self.playlists.items())]
+
+    def prune(self, now=None):
+        """Убирает отыгравшие плейлисты и возвращает их."""
+        now = now or time.time()
+        with self.lock:
+            expired = [playlist_id for playlist_id, playlist in self.playlists.items()
+                       if playlist_end(playlist) + self.expire_after < now]
+            removed = [self.playlists.pop(playlist_id) for playlist_id in expired]
+        if removed:
+            self._save()
+            print(f"🗓️ Расписания отыграли: {', '.join(p['id'] for p in removed)}")
+        return removed
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            return {playlist_id: {"target": playlist['target'], "version": playlist['version'],
+                                  "slots": len(playlist['items']),
+                                  "upcoming": sum(1 for slot in playlist['items'] if slot['at'] > now),
+                                  "ends": playlist_end(playlist)}
+                    for playlist_id, playlist in sorted(self.playlists.items())}
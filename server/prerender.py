@@ -0,0 +1,112 @@
+import os
+import uuid
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# --- ОПЦИОНАЛЬНАЯ ЗАВИСИМОСТЬ ---
+HAS_PIL = False
+try:
+    from PIL import Image, ImageEnhance, ImageOps
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+    print("⚠️ ВНИМАНИЕ: Библиотека 'Pillow' не найдена. Картинки уйдут на Куб без подготовки.")
+
+
+NEUTRAL_BRIGHTNESS = 1.0  # Множитель ImageEnhance, при котором картинка не меняется
+
+
+def render_image(src_path, dst_path, size, rotate, brightness, quality):
+    """Готовит картинку для экрана Куба. Выполняется в отдельном процессе."""
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGB')
+        img.thumbnail(size, Image.LANCZOS)  # Только уменьшение, пропорции сохраняются
+        if rotate:
+            img = img.rotate(rotate, expand=True)
+        if brightness != NEUTRAL_BRIGHTNESS:
+            img = ImageEnhance.Brightness(img).enhance(brightness)
+        img.save(dst_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return dst_path
+
+
+class Prerenderer:
+    """Пул процессов, который заранее уменьшает, поворачивает и осветляет картинки.
+
+    Результат кладётся в ContentStore как обычный файл, а связь
+    (хэш исходника, параметры) -> хэш результата хранится в индексе хранилища,
+    поэтому повторная загрузка не рендерится и не отправляется второй раз.
+    """
+
+    def __init__(self, store, size=(1920, 1080), rotate=180, quality=85, workers=2):
+        self.store = store
+        self.size = tuple(size)
+        self.rotate = rotate
+        self.quality = quality
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return HAS_PIL
+
+    def params_key(self, brightness):
+        # Ключ от уже обрезанной яркости: cached() и submit() должны совпасть при любом вводе
+        brightness = clamp_brightness(brightness)
+        params = f"{self.size[0]}x{self.size[1]}_r{self.rotate}_b{brightness:.2f}_q{self.quality}"
+        return hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]
+
+    def cached(self, src_hash, brightness):
+        """Готовая запись результата или None."""
+        rendered_hash = self.store.render_of(src_hash, self.params_key(brightness))
+        return self.store.lookup(rendered_hash) if rendered_hash else None
+
+    def start(self):
+        """Форкает процессы-рендереры, пока в сервере ещё нет других потоков.
+
+        fork из многопоточного процесса может унести в дочерний чужую
+        захваченную блокировку. spawn и forkserver не подходят: они заново
+        импортируют главный модуль, а flask_app при импорте открывает журналы.
+        С fork пул создаёт все процессы разом при первой задаче и больше не
+        форкает, поэтому пустая задача здесь — это весь fork.
+        """
+        with self.lock:
+            if self.executor is not None or not self.enabled:
+                return
+            if threading.active_count() > 1:
+                print(f"⚠️ Рендереры форкаются при {threading.active_count()} потоках — вызовите start() раньше")
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context('fork'))
+            self.executor.submit(os.getpid)
+
+    def submit(self, src_entry, brightness, callback):
+        """Рендерит в фоне и вызывает callback(запись результата или None)."""
+        self.start()
+        brightness = clamp_brightness(brightness)
+        dst_path = os.path.join(self.store.incoming_folder, f"{uuid.uuid4().hex}.render")
+        future = self.executor.submit(
+            render_image, self.store.path_for(src_entry['filename']), dst_path,
+            self.size, self.rotate, brightness, self.quality
+        )
+
+        def done(fut):
+            try:
+                fut.result()
+                entry, _ = self.store.adopt_file(dst_path, 'jpg')
+                self.store.set_render(src_entry['hash'], self.params_key(brightness), entry['hash'])
+                print(f"🎨 Подготовлено: {src_entry['size'] // 1024} КБ -> {entry['size'] // 1024} КБ")
+            except Exception as e:
+                print(f"⚠️ Ошибка подготовки картинки: {e}")
+                if os.path.exists(dst_path):
+                    os.remove(dst_path)
+                entry = None
+            callback(entry)
+
+        future.add_done_callback(done)
+
+
+def clamp_brightness(value):
+    return max(0.0, min(float(value), 2.0))
@@ -0,0 +1,84 @@
+import pytest
+
+import admission
+from admission import TokenBucket, AdmissionControl
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, 'monotonic', clock)
+    return clock
+
+
+def make_control(pending=0, **kwargs):
+    params = dict(user_rate=1, user_burst=2, global_rate=100, global_burst=100,
+                  max_pending=10, pending_getter=lambda: pending)
+    params.update(kwargs)
+    return AdmissionControl(**params)
+
+
+def test_bucket_spends_burst_then_refills():
+    bucket = TokenBucket(rate=2, burst=3)
+    now = bucket.updated
+    assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.5)
+    assert not bucket.full(now + 0.5)
+    assert bucket.full(now + 2.0)
+
+
+def test_bucket_never_exceeds_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket._refill(bucket.updated + 60)
+    assert bucket.tokens == 2
+    assert bucket.refill_time(bucket.updated) == 0
+
+
+def test_user_limit_is_429_and_does_not_touch_others(clock):
+    control = make_control()
+    assert control.admit('a') is None
+    assert control.admit('a') is None
+    status, reason, retry_after = control.admit('a')
+    assert (status, reason, retry_after) == (429, 'user', 1)
+    assert control.admit('b') is None
+    clock.now += 1
+    assert control.admit('a') is None
+    assert control.counters['admitted'] == 4
+    assert control.counters['rejected_user'] == 1
+
+
+def test_global_limit_is_503(clock):
+    control = make_control(global_rate=1, global_burst=1)
+    assert control.admit('a') is None
+    assert control.admit('b') == (503, 'global', 1)
+    assert control.precheck() == (503, 'global', 1)
+
+
+def test_overload_rejected_before_spending_tokens(clock):
+    control = make_control(pending=10, overload_retry=7)
+    assert control.admit('a') == (503, 'overload', 7)
+    assert control.global_bucket.tokens == 100
+    assert 'a' not in control.users
+
+
+def test_full_user_table_forgets_only_idle_buckets(clock):
+    control = make_control(max_users=2)
+    assert control.admit('a') is None
+    assert control.admit('b') is None
+    # Оба бакета ещё не наполнились: новый пользователь ждёт, чужие лимиты целы
+    status, reason, _ = control.admit('c')
+    assert (status, reason) == (503, 'users')
+    assert list(control.users) == ['a', 'b']
+    clock.now += 1
+    assert control.admit('c') is None
+    assert list(control.users) == ['b', 'c']
+    assert control.counters['rejected_users'] == 1
@@ -0,0 +1,188 @@
+import io
+import os
+import json
+import time
+import hashlib
+
+import pytest
+
+import blob_store
+from blob_store import ContentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / 'uploads'), str(tmp_path / 'index.json'))
+
+
+def test_same_bytes_are_stored_once(store):
+    entry, duplicate = store.put(b'cube', 'jpg')
+    assert not duplicate
+    assert entry['filename'] == f"{entry['hash']}.jpg"
+    again, duplicate = store.put_stream(io.BytesIO(b'cube'), 'png')
+    assert duplicate
+    assert again['filename'] == entry['filename']
+    assert again['hits'] == 2
+    assert sorted(os.listdir(store.folder)) == ['.incoming', entry['filename']]
+    assert os.listdir(store.incoming_folder) == []
+
+
+def test_index_survives_restart(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    store.mark_delivered(entry['hash'], 'hall_a')
+    store.set_render(entry['hash'], 'key', 'cd' * 32)
+    reopened = ContentStore(store.folder, store.index_path)
+    restored = reopened.lookup(entry['hash'])
+    assert restored['filename'] == entry['filename']
+    assert restored['delivered_to'] == ['hall_a']
+    assert reopened.render_of(entry['hash'], 'key') == 'cd' * 32
+
+
+def test_entry_without_file_is_dropped_unless_delivered(store):
+    kept, _ = store.put(b'delivered', 'jpg')
+    lost, _ = store.put(b'lost', 'jpg')
+    store.mark_delivered(kept['hash'], 'hall_a')
+    for entry in (kept, lost):
+        os.remove(store.path_for(entry['filename']))
+
+    assert store.lookup(lost['hash']) is None
+    assert store.lookup(kept['hash'])['hash'] == kept['hash']
+    reopened = ContentStore(store.folder, store.index_path)
+    assert set(reopened.index) == {kept['hash']}
+
+
+def test_delivery_is_tracked_per_cube(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    assert not store.delivered_to(entry, 'hall_a')
+    store.mark_delivered(entry['hash'], 'hall_a')
+    entry = store.lookup(entry['hash'])
+    assert store.delivered_to(entry, 'hall_a')
+    assert not store.delivered_to(entry, 'hall_b')
+    assert entry['delivered']
+
+    store.mark_delivered(entry['hash'], 'hall_b')
+    store.mark_missing(entry['hash'], 'hall_a')
+    entry = store.lookup(entry['hash'])
+    assert not store.delivered_to(entry, 'hall_a')
+    assert store.delivered_to(entry, 'hall_b')
+    store.mark_missing(entry['hash'], 'hall_b')
+    assert not store.lookup(entry['hash'])['delivered']
+
+
+def test_legacy_delivered_flag_means_default_cube(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    legacy = {"hash": entry['hash'], "filename": entry['filename'], "delivered": True}
+    assert store.delivered_to(legacy, 'default')
+    assert not store.delivered_to(legacy, 'hall_a')
+    store.index[entry['hash']] = legacy
+    store.mark_delivered(entry['hash'], 'hall_a')
+    assert sorted(store.lookup(entry['hash'])['delivered_to']) == ['default', 'hall_a']
+
+
+def test_readopted_copy_returns_after_janitor_removed_it(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    store.mark_delivered(entry['hash'], 'hall_a')
+    os.remove(store.path_for(entry['filename']))
+    again, duplicate = store.put(b'cube', 'jpg')
+    assert duplicate
+    assert store.has_file(again)
+
+
+def test_forget(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    store.forget(entry['hash'])
+    assert store.lookup(entry['hash']) is None
+    again, duplicate = store.put(b'cube', 'jpg')
+    assert not duplicate
+
+
+def test_streamed_upload_is_hashed_while_written(store):
+    incoming = store.incoming_file()
+    for chunk in (b'cu', b'be'):
+        incoming.write(chunk)
+    entry, duplicate = store.put_stream(incoming, 'jpg')
+    assert not duplicate
+    assert entry['hash'] == hashlib.sha256(b'cube').hexdigest()
+    assert entry['size'] == 4
+    with open(store.path_for(entry['filename']), 'rb') as f:
+        assert f.read() == b'cube'
+
+
+def test_abandoned_upload_leaves_nothing(store):
+    incoming = store.incoming_file()
+    incoming.write(b'half')
+    incoming.close()
+    assert os.listdir(store.incoming_folder) == []
+
+
+def test_leftovers_from_crash_are_cleared(store):
+    with open(os.path.join(store.incoming_folder, 'crash.part'), 'wb') as f:
+        f.write(b'half')
+    ContentStore(store.folder, store.index_path)
+    assert os.listdir(store.incoming_folder) == []
+
+
+def test_changes_are_appended_to_journal(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    store.put(b'other', 'jpg')
+    store.mark_delivered(entry['hash'], 'hall_a')
+    with open(store.journal_path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 3
+    # Снимок не переписывался: в нём только то, что было при старте
+    with open(store.index_path) as f:
+        assert f.read() == '{}'
+
+    reopened = ContentStore(store.folder, store.index_path)
+    assert reopened.lookup(entry['hash'])['delivered_to'] == ['hall_a']
+    assert len(reopened.index) == 2
+    with open(reopened.journal_path) as f:
+        assert f.read() == ''
+
+
+def test_torn_journal_line_is_ignored(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    with open(store.journal_path, 'a') as f:
+        f.write('["abc", {"hash"')
+    reopened = ContentStore(store.folder, store.index_path)
+    assert set(reopened.index) == {entry['hash']}
+
+
+def test_journal_is_compacted(store, monkeypatch):
+    monkeypatch.setattr(blob_store, 'INDEX_COMPACT_EVERY', 3)
+    for n in range(4):
+        store.put(bytes([n]), 'jpg')
+    assert store.journal_lines == 1
+    with open(store.index_path) as f:
+        assert len(json.load(f)) == 3
+
+
+def test_janitor_removal_forgets_undelivered_entry(store):
+    kept, _ = store.put(b'delivered', 'jpg')
+    lost, _ = store.put(b'lost', 'jpg')
+    store.mark_delivered(kept['hash'], 'hall_a')
+    for entry in (kept, lost):
+        os.remove(store.path_for(entry['filename']))
+        store.file_removed(entry['filename'])
+    assert set(store.index) == {kept['hash']}
+
+
+def test_delivered_reference_expires(store, monkeypatch):
+    entry, _ = store.put(b'cube', 'jpg')
+    store.mark_delivered(entry['hash'], 'hall_a')
+    os.remove(store.path_for(entry['filename']))
+    assert ContentStore(store.folder, store.index_path).lookup(entry['hash'])
+
+    later = time.time() + store.reference_ttl + 1
+    monkeypatch.setattr(blob_store.time, 'time', lambda: later)
+    assert ContentStore(store.folder, store.index_path).lookup(entry['hash']) is None
+
+
+def test_keep_deadline_survives_restart(store):
+    entry, _ = store.put(b'cube', 'jpg')
+    assert store.kept_until(entry['filename']) is None
+    store.keep(entry['hash'], 2000.0)
+    store.keep(entry['hash'], 1000.0)
+    reopened = ContentStore(store.folder, store.index_path)
+    assert reopened.kept_until(entry['filename']) == 2000.0
+    assert reopened.kept_until('other.jpg') is None
@@ -0,0 +1,134 @@
+import json
+import os
+
+import pytest
+
+from cube_registry import DEFAULT_CUBE_ID, FAILURES_OFFLINE, CubeRegistry
+
+
+class FakeOutbox:
+    def __init__(self, folder, url_getter, on_attempt):
+        self.folder = folder
+        self.url_getter = url_getter
+        self.on_attempt = on_attempt
+        self.handlers = {}
+        self.jobs = []
+        self.started = False
+        os.makedirs(folder, exist_ok=True)
+
+    def on(self, kind, on_success=None, on_failure=None):
+        self.handlers[kind] = (on_success, on_failure)
+
+    def start(self):
+        self.started = True
+
+    def enqueue(self, kind, **job):
+        self.jobs.append(dict(job, kind=kind))
+        return True
+
+    def pending_files(self):
+        return [job['filename'] for job in self.jobs if job.get('filename')]
+
+    def stats(self):
+        return {"queue_depth": len(self.jobs), "waiting_retry": 0, "in_flight": 0}
+
+
+@pytest.fixture
+def make_registry(tmp_path):
+    def make():
+        return CubeRegistry(str(tmp_path / 'cubes.json'), str(tmp_path / 'outbox'), FakeOutbox)
+    return make
+
+
+def test_register_and_resolve_targets(make_registry):
+    registry = make_registry()
+    registry.register('hall_a', 'http://a/webhook', groups=['hall', 'floor1'])
+    registry.register('hall_b', 'http://b/webhook', groups=['hall'])
+    registry.register('lobby', 'http://c/webhook')
+
+    assert registry.resolve() == ['hall_a', 'hall_b', 'lobby']
+    assert registry.resolve('all') == ['hall_a', 'hall_b', 'lobby']
+    assert registry.resolve('group:hall') == ['hall_a', 'hall_b']
+    assert registry.resolve('lobby, group:floor1, ghost') == ['hall_a', 'lobby']
+    assert registry.url_of('hall_b') == 'http://b/webhook'
+    assert registry.url_of('ghost') is None
+
+
+def test_registry_survives_restart(make_registry):
+    registry = make_registry()
+    registry.register('hall_a', 'http://a/webhook', groups=['hall'])
+    registry.register('hall_a', 'http://a2/webhook')
+
+    reopened = make_registry()
+    assert reopened.url_of('hall_a') == 'http://a2/webhook'
+    assert reopened.cubes['hall_a']['groups'] == ['hall']
+    assert reopened.outboxes['hall_a'].url_getter() == 'http://a2/webhook'
+
+
+def test_health_follows_delivery_attempts(make_registry):
+    registry = make_registry()
+    registry.register('hall_a', 'http://a/webhook')
+    outbox = registry.outboxes['hall_a']
+
+    outbox.on_attempt(True, None)
+    assert registry.cubes['hall_a']['health'] == 'online'
+    outbox.on_attempt(False, 'timeout')
+    assert registry.cubes['hall_a']['health'] == 'degraded'
+    for _ in range(FAILURES_OFFLINE):
+        outbox.on_attempt(False, 'timeout')
+    assert registry.cubes['hall_a']['health'] == 'offline'
+    assert registry.cubes['hall_a']['last_error'] == 'timeout'
+
+    # Повторное рукопожатие снимает offline
+    registry.register('hall_a', 'http://a/webhook')
+    assert registry.cubes['hall_a']['health'] == 'unknown'
+
+
+def test_each_cube_gets_own_queue(make_registry):
+    registry = make_registry()
+    registry.on('upload', on_success=print)
+    registry.register('hall_a', 'http://a/webhook')
+    registry.start()
+    registry.register('hall_b', 'http://b/webhook')
+
+    assert registry.enqueue('hall_b', 'upload', filename='x.jpg', meta={"hash": "h"})
+    assert not registry.enqueue('ghost', 'upload', filename='x.jpg')
+    assert registry.outboxes['hall_a'].jobs == []
+    [job] = registry.outboxes['hall_b'].jobs
+    assert job['meta'] == {"hash": "h", "cube_id": "hall_b"}
+    assert registry.pending_files() == ['x.jpg']
+    assert registry.queue_depths() == {'hall_a': 0, 'hall_b': 1}
+    # Обработчики и запуск достаются и Кубу, пришедшему позже
+    assert registry.outboxes['hall_b'].handlers['upload'] == (print, None)
+    assert registry.outboxes['hall_b'].started
+
+
+def test_legacy_url_and_journal_migrate_to_default_cube(make_registry, tmp_path):
+    url_file = tmp_path / 'observer_url.txt'
+    url_file.write_text('http://old/webhook\n')
+    outbox_folder = tmp_path / 'outbox'
+    outbox_folder.mkdir()
+    (outbox_folder / 'job1.json').write_text(json.dumps({"id": "job1"}))
+
+    registry = make_registry()
+    registry.migrate_legacy(str(url_file))
+    assert registry.url_of(DEFAULT_CUBE_ID) == 'http://old/webhook'
+    assert os.path.exists(outbox_folder / 'cubes' / DEFAULT_CUBE_ID / 'job1.json')
+    assert not os.path.exists(outbox_folder / 'job1.json')
+
+
+@pytest.mark.parametrize('cube_id', ['', '../etc', 'hall a', 'x' * 65, None])
+def test_register_rejects_bad_cube_id(make_registry, cube_id):
+    registry = make_registry()
+    with pytest.raises(ValueError):
+        registry.register(cube_id, 'http://a/webhook')
+    assert registry.cubes == {}
+
+
+def test_pending_counts_all_cubes(make_registry):
+    registry = make_registry()
+    registry.register('hall_a', 'http://a/webhook')
+    registry.register('hall_b', 'http://b/webhook')
+    registry.enqueue('hall_a', 'upload', filename='x.jpg')
+    registry.enqueue('hall_b', 'upload', filename='y.jpg')
+    assert registry.pending() == 2
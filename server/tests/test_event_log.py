@@ -0,0 +1,109 @@
+import os
+import json
+from datetime import datetime
+
+import pytest
+
+import event_log
+from event_log import EventLog
+
+T0 = datetime(2025, 5, 1, 12).timestamp()
+
+
+def event(n, user_id='u1'):
+    return {"timestamp": datetime.fromtimestamp(T0 + n).isoformat(), "user_id": user_id, "n": n}
+
+
+@pytest.fixture
+def make_log(tmp_path, monkeypatch):
+    # Сегменты называются по времени открытия в мс: часы идут вперёд на каждом вызове
+    clock = iter(range(10 ** 9))
+    monkeypatch.setattr(event_log.time, 'time', lambda: T0 + next(clock) / 100)
+
+    def make(**kwargs):
+        log = EventLog(str(tmp_path / 'events'), fsync_interval=None, **kwargs)
+        log._load_segments()
+        return log
+    return make
+
+
+def numbers(entries):
+    return [entry['n'] for entry in entries]
+
+
+def test_query_by_user_newest_first(make_log):
+    log = make_log()
+    log._write_batch([event(n, 'u1' if n % 2 else 'u2') for n in range(10)])
+    assert numbers(log.query(user_id='u1')) == [9, 7, 5, 3, 1]
+    assert numbers(log.query(user_id='u1', limit=2)) == [9, 7]
+    assert numbers(log.query(user_id='u2', since=T0 + 3, until=T0 + 7)) == [6, 4]
+    assert log.query(user_id='nobody') == []
+
+
+def test_query_by_time_across_rotated_segments(make_log):
+    log = make_log(segment_max_bytes=300)
+    for start in range(0, 200, 10):
+        log._write_batch([event(n) for n in range(start, start + 10)])
+    assert log.stats()['segments'] > 5
+    assert numbers(log.query(since=T0 + 95, until=T0 + 104, limit=100)) == list(range(104, 94, -1))
+    assert numbers(log.query(limit=3)) == [199, 198, 197]
+    assert numbers(log.query(user_id='u1', since=T0 + 150, limit=100)) == list(range(199, 149, -1))
+
+
+def test_restart_keeps_history_and_appends_to_open_segment(make_log):
+    log = make_log(segment_max_bytes=300)
+    for start in range(0, 40, 10):
+        log._write_batch([event(n) for n in range(start, start + 10)])
+    log.active_file.close()
+
+    reopened = make_log(segment_max_bytes=300)
+    assert numbers(reopened.query(user_id='u1', limit=100)) == list(range(39, -1, -1))
+    reopened._write_batch([event(40)])
+    assert numbers(reopened.query(limit=2)) == [40, 39]
+
+
+def test_old_segments_are_dropped(make_log):
+    log = make_log(segment_max_bytes=1, max_segments=3)
+    for n in range(6):
+        log._write_batch([event(n)])
+    names = [name for name in os.listdir(log.folder) if name.endswith('.jsonl')]
+    assert len(names) <= 4
+    assert numbers(log.query(limit=100))[0] == 5
+    assert 0 not in numbers(log.query(limit=100))
+
+
+def test_full_queue_drops_events(make_log):
+    log = make_log(max_queue=1)
+    log.append(event(1))
+    log.append(event(2))
+    assert log.stats()['dropped'] == 1
+
+
+def test_rotation_in_same_millisecond_opens_new_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_log.time, 'time', lambda: T0)
+    log = EventLog(str(tmp_path / 'events'), fsync_interval=None, segment_max_bytes=1)
+    log._load_segments()
+    for n in range(3):
+        log._write_batch([event(n)])
+    names = [seg['name'] for seg in log.segments]
+    assert len(set(names)) == 3
+    assert numbers(log.query(limit=10)) == [2, 1, 0]
+
+
+def test_legacy_log_becomes_first_segment(make_log, tmp_path):
+    legacy = tmp_path / 'static_images.log'
+    lines = [json.dumps(event(n, 'old')) for n in range(-5, 0)]
+    legacy.write_text('\n'.join(lines[:3]) + '\n{"timestamp": \n' + '\n'.join(lines[3:]) + '\n')
+
+    log = EventLog(str(tmp_path / 'events'), fsync_interval=None, legacy_path=str(legacy))
+    log._import_legacy()
+    log._load_segments()
+    log._write_batch([event(0, 'old')])
+    assert numbers(log.query(user_id='old')) == [0, -1, -2, -3, -4, -5]
+    assert not legacy.exists()
+    assert (tmp_path / 'static_images.log.imported').exists()
+
+    # Повторный старт не переносит журнал второй раз
+    reopened = make_log(legacy_path=str(legacy))
+    reopened._import_legacy()
+    assert len(reopened.segments) == 2
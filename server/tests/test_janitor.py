@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from janitor import UploadJanitor
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return tmp_path
+
+
+def put(folder, name, size=10, mtime=None):
+    path = folder / name
+    path.write_bytes(b'x' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return name
+
+
+def make_janitor(folder, max_bytes=1000, max_files=100, **kwargs):
+    janitor = UploadJanitor(str(folder), max_bytes, max_files, **kwargs)
+    janitor._rebuild()
+    return janitor
+
+
+def test_rebuild_counts_files_and_gives_them_orphan_ttl(folder):
+    put(folder, 'a.jpg', 10)
+    put(folder, 'b.jpg', 20)
+    put(folder, '.hidden', 5)
+    (folder / '.incoming').mkdir()
+    janitor = make_janitor(folder, orphan_ttl=60)
+    assert janitor.stats()['files'] == 2
+    assert janitor.stats()['bytes'] == 30
+    assert set(janitor.deadlines) == {'a.jpg', 'b.jpg'}
+
+
+def test_rebuild_keeps_restored_deadline(folder):
+    put(folder, 'orphan.jpg')
+    put(folder, 'playlist.jpg')
+    later = time.time() + 24 * 3600
+    janitor = make_janitor(folder, orphan_ttl=60,
+                           restore_deadline=lambda name: later if name == 'playlist.jpg' else None)
+    assert janitor.deadlines['playlist.jpg'] == later
+    assert janitor.deadlines['orphan.jpg'] < time.time() + 61
+
+
+def test_expired_file_is_removed(folder):
+    janitor = make_janitor(folder)
+    janitor.track(put(folder, 'a.jpg'))
+    janitor.expire_in('a.jpg', -1)
+    janitor._expire_due()
+    assert not (folder / 'a.jpg').exists()
+    assert janitor.stats()['files'] == 0
+    assert janitor.counters['expired'] == 1
+
+
+def test_on_remove_hears_about_removed_files(folder):
+    removed = []
+    janitor = make_janitor(folder, max_files=1, on_remove=removed.append)
+    janitor.track(put(folder, 'a.jpg', mtime=1000))
+    janitor.track(put(folder, 'b.jpg'))
+    janitor.files['a.jpg']['last_used'] = 1000
+    janitor._enforce_quota()
+    janitor.expire_in('b.jpg', -1)
+    janitor._expire_due()
+    assert removed == ['a.jpg', 'b.jpg']
+
+
+def test_new_deadline_replaces_old_one(folder):
+    janitor = make_janitor(folder)
+    janitor.track(put(folder, 'a.jpg'))
+    janitor.expire_in('a.jpg', -1)
+    janitor.expire_in('a.jpg', 3600)
+    janitor._expire_due()
+    assert (folder / 'a.jpg').exists()
+
+
+def test_pinned_file_outlives_its_deadline(folder):
+    janitor = make_janitor(folder)
+    janitor.track(put(folder, 'a.jpg'))
+    janitor.expire_in('a.jpg', -1)
+    janitor.pin('a.jpg')
+    janitor._expire_due()
+    assert (folder / 'a.jpg').exists()
+    janitor.unpin('a.jpg')
+    janitor.expire_in('a.jpg', -1)
+    janitor._expire_due()
+    assert not (folder / 'a.jpg').exists()
+
+
+def test_quota_evicts_least_recently_used_unpinned(folder):
+    janitor = make_janitor(folder, max_bytes=25)
+    for n, name in enumerate(['old.jpg', 'pinned.jpg', 'new.jpg']):
+        janitor.track(put(folder, name, 10))
+        janitor.files[name]['last_used'] = n
+    janitor.pin('pinned.jpg')
+    janitor._enforce_quota()
+    assert sorted(os.listdir(folder)) == ['new.jpg', 'pinned.jpg']
+    assert janitor.stats()['bytes'] == 20
+    assert janitor.counters['evicted'] == 1
+
+
+def test_file_count_quota(folder):
+    janitor = make_janitor(folder, max_files=2)
+    for n, name in enumerate(['a.jpg', 'b.jpg', 'c.jpg']):
+        janitor.track(put(folder, name))
+        janitor.files[name]['last_used'] = n
+    janitor.touch('a.jpg')
+    janitor._enforce_quota()
+    assert sorted(os.listdir(folder)) == ['a.jpg', 'c.jpg']
+
+
+def test_track_replaces_size_of_rewritten_file(folder):
+    janitor = make_janitor(folder)
+    janitor.track(put(folder, 'a.jpg', 10))
+    janitor.track(put(folder, 'a.jpg', 30))
+    assert janitor.stats()['bytes'] == 30
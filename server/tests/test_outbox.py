@@ -0,0 +1,190 @@
+import json
+import os
+
+import pytest
+import requests
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from outbox import BLOB_CHUNKED_FROM, DeliveryOutbox, MultipartFileBody
+
+URL = 'http://cube.example/webhook'
+
+
+class Reply:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = json.dumps(self.body)
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    """Ответы Куба по очереди; исключение в списке — обрыв связи."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def post(self, url, **kwargs):
+        return self._reply('POST', url, kwargs)
+
+    def put(self, url, **kwargs):
+        return self._reply('PUT', url, kwargs)
+
+    def _reply(self, method, url, kwargs):
+        self.calls.append((method, url, kwargs))
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    def make(*replies, url=URL, **kwargs):
+        outbox = DeliveryOutbox(str(tmp_path / 'outbox'), lambda: url, **kwargs)
+        outbox.session = FakeSession(*replies)
+        outbox.results = []
+        outbox.on('event', lambda job, r: outbox.results.append(('ok', job['id'])),
+                  lambda job, r: outbox.results.append(('failed', job['id'])))
+        return outbox
+    return make
+
+
+def journal(outbox):
+    return sorted(name for name in os.listdir(outbox.folder) if name.endswith('.json'))
+
+
+def deliver_next(outbox):
+    job = outbox.queue.get_nowait()
+    outbox._deliver(job)
+    return job
+
+
+def test_enqueue_writes_journal_before_delivery(make_outbox):
+    outbox = make_outbox()
+    assert outbox.enqueue('event', json_body={"a": 1})
+    [name] = journal(outbox)
+    with open(os.path.join(outbox.folder, name)) as f:
+        assert json.load(f)['json'] == {"a": 1}
+    assert outbox.stats()['enqueued'] == 1
+
+
+@pytest.mark.parametrize("status", [200, 201, 204])
+def test_delivered_job_leaves_journal(make_outbox, status):
+    outbox = make_outbox(Reply(status))
+    outbox.enqueue('event', json_body={"a": 1})
+    job = deliver_next(outbox)
+    assert outbox.session.calls[0][1] == URL
+    assert outbox.session.calls[0][2]['json'] == {"a": 1}
+    assert journal(outbox) == []
+    assert outbox.results == [('ok', job['id'])]
+    assert outbox.stats()['delivered'] == 1
+
+
+@pytest.mark.parametrize("reply", [Reply(500), Reply(429), requests.ConnectionError("обрыв")])
+def test_transient_failure_is_retried_from_journal(make_outbox, reply):
+    outbox = make_outbox(reply)
+    outbox.enqueue('event', data={"a": "1"})
+    job = deliver_next(outbox)
+    assert journal(outbox) == [f"{job['id']}.json"]
+    [(due, _, retried)] = outbox.retry_heap
+    assert retried['attempts'] == 1
+    assert outbox.results == []
+    assert outbox.stats()['retried'] == 1
+
+
+def test_malformed_cube_reply_is_retried(make_outbox, tmp_path):
+    path = tmp_path / 'big.jpg'
+    path.write_bytes(b'x' * BLOB_CHUNKED_FROM)
+    # /media/have в порядке, а ответ на кусок без поля received
+    outbox = make_outbox(Reply(200, {"have": [], "partial": {}}), Reply(200, {"ok": True}))
+    outbox.enqueue('event', data={"a": "1"}, file_path=str(path), file_name='big.jpg', meta={"hash": "ab" * 32})
+    job = deliver_next(outbox)
+    assert journal(outbox) == [f"{job['id']}.json"]
+    assert len(outbox.retry_heap) == 1
+    assert outbox.results == []
+
+
+def test_client_error_fails_without_retry(make_outbox):
+    outbox = make_outbox(Reply(400))
+    outbox.enqueue('event', data={"a": "1"})
+    job = deliver_next(outbox)
+    assert outbox.retry_heap == []
+    assert journal(outbox) == []
+    assert outbox.results == [('failed', job['id'])]
+
+
+def test_gives_up_after_max_attempts(make_outbox):
+    outbox = make_outbox(Reply(503), Reply(503), max_attempts=2)
+    outbox.enqueue('event', data={"a": "1"})
+    job = deliver_next(outbox)
+    outbox._deliver(outbox.retry_heap.pop()[2])
+    assert journal(outbox) == []
+    assert outbox.results == [('failed', job['id'])]
+
+
+def test_unconfigured_url_waits_without_sending(make_outbox):
+    outbox = make_outbox(url='http://localhost:5000/webhook')
+    outbox.enqueue('event', data={"a": "1"})
+    deliver_next(outbox)
+    assert outbox.session.calls == []
+    assert len(outbox.retry_heap) == 1
+
+
+def test_missing_file_fails_the_job(make_outbox, tmp_path):
+    outbox = make_outbox()
+    outbox.enqueue('event', file_path=str(tmp_path / 'gone.jpg'), file_name='gone.jpg')
+    job = deliver_next(outbox)
+    assert outbox.session.calls == []
+    assert outbox.results == [('failed', job['id'])]
+
+
+def test_file_is_posted(make_outbox, tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'jpeg')
+    outbox = make_outbox(Reply(200))
+    outbox.enqueue('event', data={"a": "1"}, file_path=str(path), file_name='photo.jpg')
+    deliver_next(outbox)
+    assert len(outbox.session.calls) == 1
+    assert journal(outbox) == []
+
+
+def test_replay_restores_jobs_in_order(make_outbox):
+    first = make_outbox()
+    first.enqueue('event', data={"n": "1"})
+    first.enqueue('event', data={"n": "2"})
+    with open(os.path.join(first.folder, 'broken.json'), 'w') as f:
+        f.write('{')
+    with open(os.path.join(first.folder, 'half.json.tmp'), 'w') as f:
+        f.write('{')
+
+    second = make_outbox()
+    second._replay()
+    assert [second.queue.get_nowait()['data']['n'] for _ in range(2)] == ['1', '2']
+    assert sorted(os.listdir(second.folder)) == sorted(journal(first))
+    assert len(journal(second)) == 2
+
+
+def test_full_queue_drops_and_forgets_job(make_outbox):
+    outbox = make_outbox(max_queue=1)
+    assert outbox.enqueue('event', data={"n": "1"})
+    assert not outbox.enqueue('event', data={"n": "2"})
+    assert len(journal(outbox)) == 1
+    assert outbox.stats()['dropped'] == 1
+
+
+def test_multipart_body_streams_file_with_known_length(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'jpeg' * 50000)
+    body = MultipartFileBody({"user_id": "u1"}, 'file', 'photo.jpg', str(path), 'image/jpeg')
+    payload = b''.join(body)
+    assert len(payload) == len(body)
+    request = Request(EnvironBuilder(method='POST', data=payload, content_type=body.content_type).get_environ())
+    assert request.form['user_id'] == 'u1'
+    assert request.files['file'].filename == 'photo.jpg'
+    assert request.files['file'].read() == path.read_bytes()
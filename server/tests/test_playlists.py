@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+from playlists import PlaylistStore, parse_playlist, slot_time, MAX_SLOTS
+
+HASH = 'ab' * 32
+
+
+def test_slots_are_parsed_and_sorted():
+    playlist = parse_playlist({"id": "evening", "target": "group:hall_a", "items": [
+        {"at": "2025-05-01T19:00:00", "type": "stop"},
+        {"at": 1746115500, "type": "custom_image", "hash": HASH, "brightness": "0.9"},
+        {"at": "2025-05-01T18:00:00", "type": "static_image", "image_number": 2},
+    ]})
+    assert playlist['id'] == 'evening'
+    assert playlist['target'] == 'group:hall_a'
+    assert playlist['name'] == 'evening'
+    assert [slot['type'] for slot in playlist['items']] == ['custom_image', 'static_image', 'stop']
+    custom, static, stop = playlist['items']
+    assert custom == {"at": 1746115500.0, "type": "custom_image", "hash": HASH, "brightness": 0.9,
+                      "music_data": "off", "lighting_data": "off"}
+    assert static['image_number'] == '2'
+    assert static['brightness'] == 1.0
+    assert stop == {"at": datetime.fromisoformat("2025-05-01T19:00:00").timestamp(), "type": "stop"}
+
+
+def test_defaults():
+    playlist = parse_playlist({"id": "a", "items": [{"at": 1, "type": "stop"}]})
+    assert playlist['target'] == 'all'
+
+
+def test_slot_time_accepts_numbers_strings_and_iso():
+    assert slot_time(5) == 5.0
+    assert slot_time("5.5") == 5.5
+    assert slot_time("2025-05-01T18:00:00") == datetime(2025, 5, 1, 18).timestamp()
+    with pytest.raises(ValueError):
+        slot_time("завтра")
+    with pytest.raises(ValueError):
+        slot_time(None)
+
+
+@pytest.mark.parametrize("data", [
+    None,
+    [],
+    {"items": [{"at": 1, "type": "stop"}]},
+    {"id": "../etc", "items": [{"at": 1, "type": "stop"}]},
+    {"id": "a", "items": []},
+    {"id": "a", "items": [{"at": 1, "type": "stop"}] * (MAX_SLOTS + 1)},
+    {"id": "a", "items": ["stop"]},
+    {"id": "a", "items": [{"at": 1, "type": "video"}]},
+    {"id": "a", "items": [{"at": 1, "type": "static_image", "image_number": "4"}]},
+    {"id": "a", "items": [{"at": 1, "type": "custom_image", "hash": "abc"}]},
+    {"id": "a", "items": [{"at": 1, "type": "static_image", "image_number": "1", "brightness": None}]},
+    {"id": "a", "items": [{"at": 1, "type": "static_image", "image_number": "1", "brightness": "яркая"}]},
+    {"id": "a", "items": [{"at": 1, "type": "static_image", "image_number": "1", "brightness": float('nan')}]},
+    {"id": "a", "items": [{"at": None, "type": "stop"}]},
+])
+def test_bad_playlists_raise_value_error(data):
+    with pytest.raises(ValueError):
+        parse_playlist(data)
+
+
+def test_store_versions_grow_and_survive_restart(tmp_path):
+    store = PlaylistStore(str(tmp_path / 'playlists.json'))
+    playlist = parse_playlist({"id": "a", "items": [{"at": 1, "type": "stop"}]})
+    first, previous = store.put(playlist)
+    assert previous is None
+    second, previous = store.put(playlist)
+    assert previous['version'] == first['version']
+    assert second['version'] > first['version']
+    reopened = PlaylistStore(store.path)
+    assert reopened.get('a')['version'] == second['version']
+
+
+def test_store_prunes_played_playlists(tmp_path):
+    store = PlaylistStore(str(tmp_path / 'playlists.json'), expire_after=60)
+    store.put(parse_playlist({"id": "old", "items": [{"at": 100, "type": "stop"}]}))
+    store.put(parse_playlist({"id": "new", "items": [{"at": 1000, "type": "stop"}]}))
+    assert [p['id'] for p in store.prune(now=500)] == ['old']
+    assert [p['id'] for p in store.all()] == ['new']
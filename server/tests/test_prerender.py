@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+pytest.importorskip('PIL')
+from PIL import Image
+
+from blob_store import ContentStore
+from prerender import Prerenderer, render_image, clamp_brightness
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / 'uploads'), str(tmp_path / 'index.json'))
+
+
+def make_image(path, size=(400, 200), color=(100, 100, 100)):
+    Image.new('RGB', size, color).save(path, 'PNG')
+    return path
+
+
+def test_render_shrinks_rotates_and_brightens(tmp_path):
+    src = tmp_path / 'src.png'
+    img = Image.new('RGB', (400, 200), (100, 100, 100))
+    img.putpixel((0, 0), (255, 0, 0))
+    img.save(src, 'PNG')
+    dst = tmp_path / 'dst.jpg'
+    render_image(str(src), str(dst), (200, 200), 180, 1.5, 95)
+    with Image.open(dst) as out:
+        assert out.format == 'JPEG'
+        assert out.size == (200, 100)
+        # Повёрнута на 180°: красный угол теперь справа внизу
+        assert out.getpixel((199, 99))[0] > 150
+        assert abs(out.getpixel((100, 50))[1] - 150) < 10
+
+
+def test_clamp_brightness():
+    assert clamp_brightness(-1) == 0.0
+    assert clamp_brightness('0.5') == 0.5
+    assert clamp_brightness(5) == 2.0
+
+
+def test_params_key_depends_on_render_settings(store):
+    a = Prerenderer(store)
+    assert a.params_key(1.0) == Prerenderer(store).params_key(1.0)
+    assert a.params_key(1.0) != a.params_key(0.9)
+    assert a.params_key(1.0) != Prerenderer(store, rotate=0).params_key(1.0)
+    # Яркость вне диапазона рендерится обрезанной — и ключ тот же
+    assert a.params_key(5) == a.params_key(2.0)
+    assert a.params_key('-1') == a.params_key(0.0)
+
+
+def test_render_is_stored_and_reused(store, tmp_path):
+    src, _ = store.put(make_image(tmp_path / 'src.png').read_bytes(), 'png')
+    prerenderer = Prerenderer(store, size=(100, 100), workers=1)
+    assert prerenderer.cached(src['hash'], 0.8) is None
+
+    done = threading.Event()
+    results = []
+    prerenderer.submit(src, 0.8, lambda entry: (results.append(entry), done.set()))
+    assert done.wait(30)
+    [rendered] = results
+    assert rendered['filename'].endswith('.jpg')
+    assert prerenderer.cached(src['hash'], 0.8)['hash'] == rendered['hash']
+    assert prerenderer.cached(src['hash'], 1.0) is None
+    reopened = ContentStore(store.folder, store.index_path)
+    assert Prerenderer(reopened, size=(100, 100)).cached(src['hash'], 0.8)['hash'] == rendered['hash']
+
+
+def test_broken_source_reports_none(store):
+    src, _ = store.put(b'not an image', 'jpg')
+    prerenderer = Prerenderer(store, workers=1)
+    done = threading.Event()
+    results = []
+    prerenderer.submit(src, 1.0, lambda entry: (results.append(entry), done.set()))
+    assert done.wait(30)
+    assert results == [None]
+    assert prerenderer.cached(src['hash'], 1.0) is None
@@ -0,0 +1,38 @@
+import importlib
+import sys
+
+import pytest
+
+pytest.importorskip('flask')
+
+
+@pytest.fixture
+def flask_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('GOLO_BASE_DIR', str(tmp_path))
+    monkeypatch.setenv('GOLO_SERVER_MODE', 'wsgi')
+    sys.modules.pop('flask_app', None)
+    module = importlib.import_module('flask_app')
+    yield module
+    sys.modules.pop('flask_app', None)
+
+
+def test_import_does_not_start_services(flask_app):
+    assert flask_app.services_lock_file is None
+    assert not flask_app.janitor.started
+
+
+def test_first_request_starts_services_once(flask_app):
+    client = flask_app.app.test_client()
+    client.get('/metrics')
+    lock_file = flask_app.services_lock_file
+    assert lock_file is not None
+    assert flask_app.janitor.started
+    client.get('/metrics')
+    assert flask_app.services_lock_file is lock_file
+
+
+def test_second_process_cannot_own_the_journals(flask_app):
+    flask_app.start_services()
+    # flock держится на открытом файле: другой файл — как другой процесс
+    with pytest.raises(RuntimeError):
+        flask_app.claim_services_lock()
@@ -0,0 +1,137 @@
+"""Сквозная трассировка задержек и метрики для /metrics.
+
+Точка входа (загрузка, статическая команда, голосовой интент) создаёт Trace
+с trace_id и временем начала; оба поля едут дальше внутри полезной нагрузки
+(trace_id, trace_t0), и каждый узел отмечает свои стадии. Время стадии
+считается от trace_t0, поэтому между сервером и Кубом в него входит и
+расхождение часов.
+
+Файл одинаковый в server/ и local/: они разворачиваются на разных машинах.
+"""
+import time
+import uuid
+import threading
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape(value):
+    # Экранирование значений меток по формату Prometheus
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + '}'
+
+
+class Metrics:
+    """Счётчики, гистограммы и датчики в текстовом формате Prometheus."""
+
+    def __init__(self, prefix='golo'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}    # (имя, метки) -> число
+        self.histograms = {}  # (имя, метки) -> Histogram
+        self.gauges = {}      # имя -> (функция, имя метки): число или {значение метки: число}
+
+    def inc(self, name, delta=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def gauge(self, name, getter, label=None):
+        self.gauges[name] = (getter, label)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f'{self.prefix}_{name}_total{_labels(dict(labels))} {value}')
+            for (name, labels), hist in sorted(self.histograms.items()):
+                full = f'{self.prefix}_{name}'
+                labels = dict(labels)
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{full}_bucket{_labels(dict(labels, le=bound))} {cumulative}')
+                lines.append(f'{full}_bucket{_labels(dict(labels, le="+Inf"))} {hist.count}')
+                lines.append(f'{full}_sum{_labels(labels)} {hist.total:.3f}')
+                lines.append(f'{full}_count{_labels(labels)} {hist.count}')
+        for name, (getter, label) in sorted(self.gauges.items()):
+            try:
+                value = getter()
+            except Exception:
+                continue
+            if isinstance(value, dict):
+                for label_value, v in value.items():
+                    lines.append(f'{self.prefix}_{name}{_labels({label: label_value})} {v}')
+            else:
+                lines.append(f'{self.prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+class Trace:
+    """Путь одного события: trace_id, время начала и отметки стадий."""
+
+    def __init__(self, kind, trace_id=None, t0=None):
+        self.kind = kind
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.t0 = t0 if t0 is not None else time.time()
+        self.last = self.t0
+        self.stages = []  # (стадия, мс от предыдущей отметки)
+
+    @classmethod
+    def from_fields(cls, data, kind):
+        """Продолжает трассу из полученной нагрузки или начинает новую."""
+        data = data or {}
+        try:
+            t0 = float(data['trace_t0'])
+        except (KeyError, TypeError, ValueError):
+            t0 = None
+        return cls(kind, data.get('trace_id'), t0)
+
+    def fields(self):
+        return {"trace_id": self.trace_id, "trace_t0": self.t0}
+
+    def mark(self, stage):
+        """Отмечает стадию: гистограмма времени от начала трассы и шаг для лога."""
+        now = time.time()
+        self.stages.append((stage, (now - self.last) * 1000))
+        self.last = now
+        METRICS.observe('stage_latency_ms', (now - self.t0) * 1000, kind=self.kind, stage=stage)
+
+    def log(self, prefix=''):
+        steps = ' → '.join(f'{stage} +{ms:.0f}' for stage, ms in self.stages)
+        total = (self.last - self.t0) * 1000
+        print(f"🧭 [{self.trace_id}] {prefix}{self.kind}: {steps} = {total:.0f} мс")